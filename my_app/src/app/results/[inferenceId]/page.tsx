@@ -12,16 +12,34 @@ import {
     CheckSquare, Square
 } from "lucide-react";
 import DashboardNav from "@/components/DashboardNav";
-import { apiFetch } from "@/lib/api";
+import { API_BASE_URL, apiFetch } from "@/lib/api";
 import { useAuthGuard } from "@/hooks/use-auth-guard";
 
+type InferenceArtifact = {
+    kind: string;
+    gridfs_id?: string;
+    url?: string;
+    view_urls?: Partial<Record<"class" | "instance", string>>;
+};
+
 type InferenceResult = {
     source_filename: string;
     source_image_gridfs_id?: string;
     class_mask_id?: string;
     instance_mask_id?: string;
+    label_mask_id?: string;
+    // Signed URLs, present when the server issues them (SIGNED_FILE_URLS)
+    source_image_url?: string;
+    artifacts?: InferenceArtifact[];
+};
+
+type StreamState = {
+    inference_id: string;
+    status: string;
 };
 
+const TERMINAL_STATUSES = ["completed", "failed"];
+
 type InferenceResponse = {
     _id: string;
     dataset_id: string;
@@ -39,14 +57,14 @@ export default function InferenceDetailPage() {
     const { inferenceId } = useParams<{ inferenceId: string }>();
     const { isLoading } = useAuthGuard();
     const [inference, setInference] = useState<InferenceResponse | null>(null);
-    const [isPolling, setIsPolling] = useState(true);
     const [selectedFilenames, setSelectedFilenames] = useState<string[]>([]);
     const [imageMap, setImageMap] = useState<Record<string, ImageEntry>>({});
     const [overlayOpacity, setOverlayOpacity] = useState(0.6);
     const [activeOverlay, setActiveOverlay] = useState<"classMask" | "instanceMask">("instanceMask");
     const [isSending, setIsSending] = useState(false);
     const [cvatLink, setCvatLink] = useState<string | null>(null);
-    const pollRef = useRef<NodeJS.Timeout | null>(null);
+    const streamRef = useRef<EventSource | null>(null);
+    const reconnectRef = useRef<NodeJS.Timeout | null>(null);
 
     useEffect(() => {
         setSelectedFilenames([]);
@@ -55,6 +73,7 @@ export default function InferenceDetailPage() {
 
     useEffect(() => {
         if (isLoading || !inferenceId) return;
+        let closed = false;
 
         const fetchInference = async () => {
             try {
@@ -63,47 +82,110 @@ export default function InferenceDetailPage() {
                     throw new Error("Failed to load inference");
                 }
                 const data: InferenceResponse = await response.json();
+                if (closed) return data;
                 setInference(data);
                 if (data.status === "completed") {
-                    setIsPolling(false);
                     hydrateImages(data.results);
-                } else {
-                    setIsPolling(true);
                 }
+                return data;
             } catch (error) {
                 console.error(error);
                 toast.error("Unable to load inference");
+                return null;
             }
         };
 
-        fetchInference();
-        if (isPolling) {
-            pollRef.current = setInterval(fetchInference, 5000);
-        }
+        // EventSource cannot send the Authorization header, so every connection
+        // opens with a fresh short-lived stream token instead of the JWT.
+        const openStream = async () => {
+            try {
+                const response = await apiFetch(`/api/inferences/${inferenceId}/stream/token`);
+                if (!response.ok) {
+                    throw new Error("Failed to open progress stream");
+                }
+                const { url } = await response.json();
+                if (closed) return;
+
+                const source = new EventSource(`${API_BASE_URL}${url}`);
+                streamRef.current = source;
+                source.addEventListener("inference", (event) => {
+                    const state: StreamState = JSON.parse((event as MessageEvent).data);
+                    setInference((current) => (current ? { ...current, status: state.status } : current));
+                    if (TERMINAL_STATUSES.includes(state.status)) {
+                        source.close();
+                        fetchInference();
+                    }
+                });
+                // The server ends the stream after INFERENCE_STREAM_MAX_SECONDS and the
+                // token expires after STREAM_TOKEN_TTL, so reconnect with a new one
+                // instead of letting EventSource retry the old URL.
+                source.onerror = () => {
+                    source.close();
+                    if (!closed) {
+                        reconnectRef.current = setTimeout(openStream, 2000);
+                    }
+                };
+            } catch (error) {
+                console.error(error);
+                if (!closed) {
+                    reconnectRef.current = setTimeout(openStream, 5000);
+                }
+            }
+        };
+
+        fetchInference().then((data) => {
+            if (data && !TERMINAL_STATUSES.includes(data.status)) {
+                openStream();
+            }
+        });
 
         return () => {
-            if (pollRef.current) {
-                clearInterval(pollRef.current);
+            closed = true;
+            streamRef.current?.close();
+            if (reconnectRef.current) {
+                clearTimeout(reconnectRef.current);
             }
         };
-    }, [inferenceId, isLoading, isPolling]);
+    }, [inferenceId, isLoading]);
 
     const hydrateImages = async (results: InferenceResult[]) => {
         const newEntries: Record<string, ImageEntry> = {};
         for (const result of results) {
             newEntries[result.source_filename] = {
-                source: await fetchImageUrl(result.source_image_gridfs_id),
-                classMask: await fetchImageUrl(result.class_mask_id),
-                instanceMask: await fetchImageUrl(result.instance_mask_id),
+                source: signedUrl(result.source_image_url)
+                    ?? await fetchImageUrl(result.source_image_gridfs_id),
+                classMask: maskUrl(result, "class")
+                    ?? (result.label_mask_id
+                        ? await fetchImageUrl(result.label_mask_id, "class")
+                        : await fetchImageUrl(result.class_mask_id)),
+                instanceMask: maskUrl(result, "instance")
+                    ?? (result.label_mask_id
+                        ? await fetchImageUrl(result.label_mask_id, "instance")
+                        : await fetchImageUrl(result.instance_mask_id)),
             };
         }
         setImageMap(newEntries);
     };
 
-    const fetchImageUrl = async (gridfsId?: string) => {
+    // Signed URLs are loaded by the browser directly (and cached by it);
+    // without them the files are fetched with the JWT into object URLs.
+    const signedUrl = (url?: string) => (url ? `${API_BASE_URL}${url}` : undefined);
+
+    const maskUrl = (result: InferenceResult, view: "class" | "instance") => {
+        const artifacts = result.artifacts ?? [];
+        const labels = artifacts.find((artifact) => artifact.kind === "label_mask");
+        if (labels) {
+            return signedUrl(labels.view_urls?.[view]);
+        }
+        const rendered = artifacts.find((artifact) => artifact.kind === `${view}_mask`);
+        return signedUrl(rendered?.url);
+    };
+
+    const fetchImageUrl = async (gridfsId?: string, view?: "class" | "instance") => {
         if (!gridfsId) return undefined;
         try {
-            const response = await apiFetch(`/api/files/${gridfsId}`);
+            const query = view ? `?view=${view}` : "";
+            const response = await apiFetch(`/api/files/${gridfsId}${query}`);
             if (!response.ok) {
                 throw new Error("Failed to fetch image");
             }
@@ -118,9 +200,9 @@ export default function InferenceDetailPage() {
     useEffect(() => {
         return () => {
             Object.values(imageMap).forEach((entry) => {
-                entry.source && URL.revokeObjectURL(entry.source);
-                entry.classMask && URL.revokeObjectURL(entry.classMask);
-                entry.instanceMask && URL.revokeObjectURL(entry.instanceMask);
+                [entry.source, entry.classMask, entry.instanceMask].forEach((url) => {
+                    url?.startsWith("blob:") && URL.revokeObjectURL(url);
+                });
             });
         };
     }, [imageMap]);
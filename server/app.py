@@ -14,6 +14,7 @@ import os
 def create_app(config_name = 'default'):
     app = Flask(__name__)
     app.config.from_object(config[config_name])
+    app.config["CONFIG_NAME"] = config_name
     frontend_origin = app.config.get(
         "FRONTEND_ORIGIN",
         os.getenv("FRONTEND_ORIGIN", "http://localhost:3000")
@@ -0,0 +1,78 @@
+"""
+Compares the per-image Cellpose loop with batched evaluation.
+
+Run from the server directory:
+
+    python benchmarks/bench_batched_eval.py --model models/trained_cellpose --images path/to/pngs
+    python benchmarks/bench_batched_eval.py --model models/trained_cellpose --synthetic 16 --size 512
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.cellpose_runner import load_cellpose_model, segment_batch, segment_image  # noqa: E402
+
+
+def synthetic_images(count, size, seed=0):
+    """Bright blobs on a noisy background, roughly nucleus-sized."""
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[:size, :size]
+    imgs = []
+    for _ in range(count):
+        img = rng.normal(20, 5, (size, size))
+        for cy, cx in rng.integers(0, size, (size // 16, 2)):
+            img[(yy - cy) ** 2 + (xx - cx) ** 2 < 64] += 150
+        imgs.append(np.clip(img, 0, 255).astype(np.uint8))
+    return imgs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", required=True, help="Path to the Cellpose weights")
+    parser.add_argument("--images", help="Directory of images to segment")
+    parser.add_argument("--synthetic", type=int, default=8, help="Number of synthetic images if --images is not given")
+    parser.add_argument("--size", type=int, default=512, help="Synthetic image size")
+    parser.add_argument("--batch-size", type=int, default=8, help="Network batch size (tiles)")
+    parser.add_argument("--images-per-batch", type=int, default=8)
+    parser.add_argument("--diameter", type=float, default=None)
+    args = parser.parse_args()
+
+    if args.images:
+        paths = sorted(glob.glob(os.path.join(args.images, "*")))
+        imgs = [np.array(Image.open(p)) for p in paths]
+    else:
+        imgs = synthetic_images(args.synthetic, args.size)
+
+    model = load_cellpose_model(os.path.abspath(args.model))
+    eval_kwargs = {"channels": [0, 0], "diameter": args.diameter}
+
+    # Warm-up so neither side pays one-off initialisation.
+    segment_image(model, imgs[0], eval_kwargs)
+
+    start = time.perf_counter()
+    sequential = [segment_image(model, img, eval_kwargs) for img in imgs]
+    sequential_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batched = []
+    for i in range(0, len(imgs), args.images_per_batch):
+        batched.extend(segment_batch(model, imgs[i:i + args.images_per_batch], eval_kwargs, args.batch_size))
+    batched_s = time.perf_counter() - start
+
+    agreement = np.mean([np.mean((a > 0) == (b > 0)) for a, b in zip(sequential, batched)])
+    print(f"images:            {len(imgs)}")
+    print(f"per-image loop:    {sequential_s:.2f}s ({sequential_s / len(imgs):.3f}s/image)")
+    print(f"batched:           {batched_s:.2f}s ({batched_s / len(imgs):.3f}s/image)")
+    print(f"speedup:           {sequential_s / batched_s:.2f}x")
+    print(f"foreground match:  {agreement:.4f}")
+
+
+if __name__ == "__main__":
+    main()
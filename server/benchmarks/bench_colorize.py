@@ -0,0 +1,85 @@
+"""
+Micro-benchmarks for mask colorization on dense label masks.
+
+Compares the per-label loop the runner used to do with the lookup-table
+renderers in services.colorize. Run from the server directory:
+
+    python benchmarks/bench_colorize.py --size 2048 --cells 3000
+"""
+import argparse
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.colorize import NUCLEUS_RGB, VOC_CMAP, to_class_rgb, to_instance_rgb, to_overlay_rgb  # noqa: E402
+
+
+def legacy_class_rgb(mask_int):
+    rgb = np.zeros((*mask_int.shape, 3), np.uint8)
+    rgb[mask_int > 0] = NUCLEUS_RGB
+    return rgb
+
+
+def legacy_instance_rgb(mask_int):
+    h, w = mask_int.shape[:2]
+    out = np.zeros((h, w, 3), np.uint8)
+    labels = np.unique(mask_int)
+    labels = labels[labels > 0]
+    for k in labels:
+        out[mask_int == k] = VOC_CMAP[int(k) % 255 + 1]
+    return out
+
+
+def dense_label_mask(size, cells, seed=0):
+    """Square 'cells' laid out on a jittered grid, labelled 1..cells."""
+    rng = np.random.default_rng(seed)
+    mask = np.zeros((size, size), np.uint16)
+    per_row = int(np.ceil(np.sqrt(cells)))
+    step = size // per_row
+    radius = max(2, step // 3)
+    label = 1
+    for gy in range(per_row):
+        for gx in range(per_row):
+            if label > cells:
+                break
+            cy = gy * step + step // 2 + rng.integers(-2, 3)
+            cx = gx * step + step // 2 + rng.integers(-2, 3)
+            mask[max(cy - radius, 0):cy + radius, max(cx - radius, 0):cx + radius] = label
+            label += 1
+    return mask
+
+
+def bench(label, fn, repeat):
+    best = min(timeit.repeat(fn, number=1, repeat=repeat))
+    print(f"{label:<28}{best * 1000:10.1f} ms")
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=2048)
+    parser.add_argument("--cells", type=int, default=3000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    mask = dense_label_mask(args.size, args.cells)
+    image = np.random.default_rng(1).integers(0, 255, mask.shape, dtype=np.uint8)
+
+    assert np.array_equal(legacy_instance_rgb(mask), to_instance_rgb(mask))
+    assert np.array_equal(legacy_class_rgb(mask), to_class_rgb(mask))
+
+    print(f"{args.size}x{args.size} uint16 mask, {int(mask.max())} instances")
+    legacy = bench("instance (per-label loop)", lambda: legacy_instance_rgb(mask), max(1, args.repeat // 3))
+    lut = bench("instance (lookup table)", lambda: to_instance_rgb(mask), args.repeat)
+    bench("class (boolean assign)", lambda: legacy_class_rgb(mask), args.repeat)
+    bench("class (lookup table)", lambda: to_class_rgb(mask), args.repeat)
+    bench("overlay (instance)", lambda: to_overlay_rgb(image, mask), args.repeat)
+    print(f"instance speedup: {legacy / lut:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Benchmarks the ONNX Runtime engine against the PyTorch path and checks
+that both produce the same segmentation.
+
+For each engine (torch, onnx, onnx int8) it times ``segment_image`` over
+the images, then compares against torch:
+
+- network output: max abs difference of (flows, cellprob) on random tiles
+- masks: foreground agreement and instance F1 at IoU >= 0.5
+- sub-tile masks: instance F1 on crops smaller than one network tile, which
+  the ONNX engine hands to the torch network
+
+Exits non-zero when an fp32 ONNX run (full or sub-tile) falls below --min-f1, so it can gate
+a deployment. int8 results are reported but never fail the check.
+
+Run from the server directory:
+
+    python benchmarks/bench_onnx.py --model models/trained_cellpose --synthetic 8 --size 512
+    python benchmarks/bench_onnx.py --model models/trained_cellpose --images path/to/pngs --no-int8
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+import numpy as np
+import torch
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_batched_eval import synthetic_images  # noqa: E402
+from services.cellpose_runner import load_cellpose_model, segment_image  # noqa: E402
+
+
+def instance_f1(truth: np.ndarray, pred: np.ndarray, iou_threshold: float = 0.5) -> float:
+    """F1 of instances matched at IoU > ``iou_threshold`` (>= 0.5 keeps matches one-to-one)."""
+    n_true, n_pred = int(truth.max()), int(pred.max())
+    if n_true == 0 and n_pred == 0:
+        return 1.0
+    if n_true == 0 or n_pred == 0:
+        return 0.0
+    overlap = np.bincount(
+        truth.ravel().astype(np.int64) * (n_pred + 1) + pred.ravel(), minlength=(n_true + 1) * (n_pred + 1)
+    ).reshape(n_true + 1, n_pred + 1)
+    area_true = overlap.sum(axis=1, keepdims=True)
+    area_pred = overlap.sum(axis=0, keepdims=True)
+    iou = overlap / np.maximum(area_true + area_pred - overlap, 1)
+    matches = int((iou[1:, 1:] > iou_threshold).sum())
+    return 2 * matches / (n_true + n_pred)
+
+
+def network_diff(reference, candidate, tile: int, channels: int, batch: int = 4) -> float:
+    x = torch.from_numpy(np.random.default_rng(0).normal(size=(batch, channels, tile, tile)).astype(np.float32))
+    with torch.no_grad():
+        expected = reference.net(x)[0].numpy()
+    return float(np.abs(candidate.net(x)[0].numpy() - expected).max())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", required=True, help="Path to the Cellpose weights")
+    parser.add_argument("--images", help="Directory of images to segment")
+    parser.add_argument("--synthetic", type=int, default=8, help="Number of synthetic images if --images is not given")
+    parser.add_argument("--size", type=int, default=512, help="Synthetic image size")
+    parser.add_argument("--diameter", type=float, default=None)
+    parser.add_argument("--tile", type=int, default=224, help="Network tile size the ONNX graph is exported for")
+    parser.add_argument("--onnx-dir", default=None, help="Where exports are written (default: next to the weights)")
+    parser.add_argument("--no-int8", action="store_true", help="Skip the int8-quantized engine")
+    parser.add_argument("--min-f1", type=float, default=0.95)
+    args = parser.parse_args()
+
+    if args.images:
+        paths = sorted(glob.glob(os.path.join(args.images, "*")))
+        imgs = [np.array(Image.open(p)) for p in paths]
+    else:
+        imgs = synthetic_images(args.synthetic, args.size)
+
+    model_path = os.path.abspath(args.model)
+    eval_kwargs = {"channels": [0, 0], "diameter": args.diameter}
+    engines = {"torch": {"engine": "torch"}, "onnx": {"engine": "onnx", "quantize": False}}
+    if not args.no_int8:
+        engines["onnx-int8"] = {"engine": "onnx", "quantize": True}
+
+    # Smaller than one tile in both dimensions, and not square.
+    sub_tile = [np.asarray(img)[: args.tile * 4 // 9, : args.tile * 5 // 9] for img in imgs]
+
+    loaded, timings, masks, sub_tile_masks = {}, {}, {}, {}
+    for name, kwargs in engines.items():
+        if kwargs["engine"] == "onnx":
+            kwargs.update(onnx_tile=args.tile, onnx_dir=args.onnx_dir)
+        model = load_cellpose_model(model_path, **kwargs)
+        segment_image(model, imgs[0], eval_kwargs)  # warm-up
+        start = time.perf_counter()
+        masks[name] = [segment_image(model, img, eval_kwargs) for img in imgs]
+        timings[name] = time.perf_counter() - start
+        sub_tile_masks[name] = [segment_image(model, img, eval_kwargs) for img in sub_tile]
+        loaded[name] = model
+
+    channels = int(loaded["torch"].net.nbase[0])
+    print(f"images:  {len(imgs)}   torch threads: {torch.get_num_threads()}")
+    failed = False
+    for name, seconds in timings.items():
+        line = f"{name:10s} {seconds:7.2f}s ({seconds / len(imgs):.3f}s/image, {timings['torch'] / seconds:.2f}x)"
+        if name != "torch":
+            diff = network_diff(loaded["torch"], loaded[name], args.tile, channels)
+            fg = np.mean([np.mean((a > 0) == (b > 0)) for a, b in zip(masks["torch"], masks[name])])
+            f1 = np.mean([instance_f1(a, b) for a, b in zip(masks["torch"], masks[name])])
+            sub_f1 = np.mean([instance_f1(a, b) for a, b in zip(sub_tile_masks["torch"], sub_tile_masks[name])])
+            line += f"   net max|diff| {diff:.2e}   foreground {fg:.4f}   F1@0.5 {f1:.4f}   sub-tile F1 {sub_f1:.4f}"
+            if name == "onnx" and min(f1, sub_f1) < args.min_f1:
+                failed = True
+        print(line)
+
+    if failed:
+        print(f"FAIL: ONNX F1 below {args.min_f1}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
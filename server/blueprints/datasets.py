@@ -1,8 +1,9 @@
 from flask import Blueprint, request, jsonify, current_app
 from services.storage import save_file_to_gridfs # Images still use GridFS
 from blueprints.models import get_model_by_id
-from services.inference_manager import start_managed_inference
+from services.job_queue import dispatch_inference
 from bson.objectid import ObjectId
+from pymongo import ReturnDocument
 import json as _json
 from db import get_db
 import datetime
@@ -57,7 +58,7 @@ def upload_dataset(current_user_id):
     run_inference_flag = request.form.get('run_inference') or request.form.get('run')
     if run_inference_flag and str(run_inference_flag).lower() in {'1', 'true', 'yes', 'on'}:
         # Determine model and params
-        model_id = request.form.get('model_id', 'cellpose_default')
+        model_id = request.form.get('model_id', 'cellpose_model')
         model_def = get_model_by_id(model_id)
         if not model_def:
             return jsonify({"error": f"Unknown model_id '{model_id}'"}), 400
@@ -77,6 +78,7 @@ def upload_dataset(current_user_id):
             "params": params,
             "model_id": model_id,
             "runner_name": model_def.get('runner_name'),
+            "engine": model_def.get('engine', 'torch'),
             "status": "queued",
             "created_at": datetime.datetime.utcnow(),
             "results": []
@@ -84,10 +86,11 @@ def upload_dataset(current_user_id):
 
         inference_id = db.inferences.insert_one(inference_doc).inserted_id
 
-        # Start inference synchronously (same behavior as /inferences/start endpoint)
+        # Start or queue inference (same behavior as /inferences/start endpoint)
         try:
-            start_managed_inference(str(inference_id), params)
+            queued = dispatch_inference(str(inference_id))
             response_payload['inference_id'] = str(inference_id)
+            response_payload['inference_status'] = "queued" if queued else "completed"
         except Exception as e:
             # update inference doc to failed
             db.inferences.update_one({"_id": inference_id}, {"$set": {"status": "failed", "finished_at": datetime.datetime.utcnow(), "notes": str(e)}})
@@ -96,6 +99,64 @@ def upload_dataset(current_user_id):
 
     return jsonify(response_payload), 201
 
+@datasets_bp.route('/<dataset_id>/files', methods=['POST'])
+@jwt_required
+def append_files(current_user_id, dataset_id):
+    """Appends uploaded files to an existing dataset.
+
+    Run an inference with params { "mode": "incremental" } afterwards to
+    segment only the new files.
+    """
+    db = get_db()
+    try:
+        dataset_obj_id = ObjectId(dataset_id)
+    except Exception:
+        return jsonify({"error": "Invalid dataset_id format"}), 400
+
+    dataset = db.datasets.find_one({"_id": dataset_obj_id}, {"owner_id": 1})
+    if not dataset:
+        return jsonify({"error": "Dataset not found"}), 404
+    if str(dataset['owner_id']) != current_user_id:
+        return jsonify({"error": "Forbidden"}), 403
+
+    files = request.files.getlist('files')
+    if not files or files[0].filename == '':
+        return jsonify({"error": "No files selected"}), 400
+
+    file_references = []
+    for file in files:
+        try:
+            gridfs_id = save_file_to_gridfs(
+                file,
+                metadata={'type': 'image', 'uploader': current_user_id}
+            )
+            file_references.append({
+                "gridfs_id": gridfs_id,
+                "filename": file.filename,
+                "type": "image"
+            })
+        except Exception as e:
+            return jsonify({"error": f"Failed to save file {file.filename}: {e}"}), 500
+
+    updated = db.datasets.find_one_and_update(
+        {"_id": dataset_obj_id},
+        {
+            "$push": {"files": {"$each": file_references}},
+            "$set": {"updated_at": datetime.datetime.utcnow()},
+        },
+        projection={"files": 1},
+        return_document=ReturnDocument.AFTER,
+    )
+
+    return jsonify({
+        "message": f"Added {len(file_references)} files",
+        "dataset_id": dataset_id,
+        "added": [
+            {"gridfs_id": str(f["gridfs_id"]), "filename": f["filename"]} for f in file_references
+        ],
+        "file_count": len(updated.get("files", [])),
+    }), 201
+
 @datasets_bp.route('/', methods=['GET'])
 @jwt_required
 def list_datasets(current_user_id):
@@ -1,19 +1,189 @@
-from flask import Blueprint, Response
-from db import get_fs
+from flask import Blueprint, Response, jsonify, request, current_app
+from db import get_db, get_fs
 from bson.objectid import ObjectId
 from utils.security import jwt_required
-import mimetypes
+from services.mask_render import get_rendered_mask
+from services.pyramid import PyramidPending, ensure_pyramid, get_tile, pyramid_options
+from services.volume_store import render_slice
+from utils.gridfs_response import send_gridfs_file
+from utils.signed_urls import verify_file_signature
+import time
 
 files_bp = Blueprint('files', __name__)
 
+
+def _volume_refusal(gridfs_file):
+    """400 for volume artifacts, whose stored blob is only readable through the slice route."""
+    if (gridfs_file.metadata or {}).get('volume'):
+        return Response(
+            "Volume artifacts are served per slice from /api/files/<id>/slices/<z> "
+            "or as TIFF in the inference download",
+            status=400,
+        )
+    return None
+
 @files_bp.route('/<file_id>')
 @jwt_required
 def get_gridfs_file(current_user_id, file_id):
+    """Serves a GridFS file (ETag, Range and 304 support). Label mask artifacts accept ?view=class|instance."""
     fs = get_fs()
     try:
         gridfs_file = fs.get(ObjectId(file_id))
-        
-        content_type = mimetypes.guess_type(gridfs_file.filename)[0] or 'application/octet-stream'
-        return Response(gridfs_file.read(), mimetype=content_type)
+        refusal = _volume_refusal(gridfs_file)
+        if refusal:
+            return refusal
+
+        view = request.args.get('view')
+        if view and (gridfs_file.metadata or {}).get('type') == 'mask_label':
+            gridfs_file = get_rendered_mask(fs, file_id, view, current_app.config['PNG_COMPRESS_LEVEL'])
+
+        return send_gridfs_file(gridfs_file, max_age=current_app.config['FILES_CACHE_MAX_AGE'])
     except Exception as e:
-        return Response(f"Error retrieving file: {e}", status=404)
\ No newline at end of file
+        return Response(f"Error retrieving file: {e}", status=404)
+
+
+@files_bp.route('/s/<file_id>')
+def get_signed_file(file_id):
+    """Serves a GridFS file by signed URL (see utils.signed_urls); no token needed.
+
+    Content behind a URL never changes, so it is cacheable by browsers and
+    shared caches until the URL expires.
+    """
+    view = request.args.get('view')
+    expires = request.args.get('exp')
+    valid, reason = verify_file_signature(file_id, view, expires, request.args.get('sig'))
+    if not valid:
+        return Response(reason, status=403)
+
+    fs = get_fs()
+    try:
+        gridfs_file = fs.get(ObjectId(file_id))
+        refusal = _volume_refusal(gridfs_file)
+        if refusal:
+            return refusal
+        if view and (gridfs_file.metadata or {}).get('type') == 'mask_label':
+            gridfs_file = get_rendered_mask(fs, file_id, view, current_app.config['PNG_COMPRESS_LEVEL'])
+    except Exception as e:
+        return Response(f"Error retrieving file: {e}", status=404)
+    return send_gridfs_file(gridfs_file, max_age=max(int(expires) - int(time.time()), 0), public=True)
+
+
+@files_bp.route('/<file_id>/slices/<int:z>')
+@jwt_required
+def get_volume_slice(current_user_id, file_id, z):
+    """Serves one z-slice of a volume artifact. Label volumes accept ?view=class|instance."""
+    fs = get_fs()
+    try:
+        data, mimetype = render_slice(
+            fs, file_id, z, request.args.get('view'), current_app.config['PNG_COMPRESS_LEVEL']
+        )
+        return Response(data, mimetype=mimetype)
+    except (IndexError, ValueError) as e:
+        return Response(str(e), status=400)
+    except Exception as e:
+        return Response(f"Error retrieving slice: {e}", status=404)
+
+
+def _pyramid_args():
+    """(view, plane) selecting a pyramid: label mask view and stack plane."""
+    return request.args.get('view'), request.args.get('plane', 0, type=int)
+
+
+def _serve_pyramid(fs, file_id, serve):
+    """
+    Builds the file's pyramid on first use (unless a worker already did),
+    then answers with ``serve(pyramid)``. While another request builds it the
+    answer is a 202 with Retry-After. Bad views / planes are 400s; a pyramid
+    that can't be built is logged and a 404.
+    """
+    view, plane = _pyramid_args()
+    try:
+        pyramid = ensure_pyramid(get_db(), fs, file_id, view, plane, **pyramid_options())
+    except PyramidPending:
+        return Response("Pyramid is being built", status=202, headers={'Retry-After': '2'})
+    except (IndexError, ValueError) as e:
+        return Response(str(e), status=400)
+    except Exception as e:
+        current_app.logger.error(f"Failed to build pyramid of {file_id}: {e}")
+        return Response(f"Error building pyramid: {e}", status=404)
+    return serve(pyramid)
+
+
+def _thumbnail(fs, max_age, public=False):
+    return lambda pyramid: send_gridfs_file(
+        fs.get(ObjectId(pyramid['thumbnail_id'])), max_age=max_age, public=public
+    )
+
+
+def _tile(fs, file_id, level, x, y, max_age, public=False):
+    def serve(pyramid):
+        tile = get_tile(fs, file_id, level, x, y, pyramid['view'], pyramid['plane'])
+        if tile is None:
+            return Response("Tile out of range", status=404)
+        return send_gridfs_file(tile, max_age=max_age, public=public)
+    return serve
+
+
+def _verify_signed_request(file_id):
+    """(max-age until expiry, None) for a valid signed request, else (None, 403 response)."""
+    expires = request.args.get('exp')
+    valid, reason = verify_file_signature(file_id, request.args.get('view'), expires, request.args.get('sig'))
+    if not valid:
+        return None, Response(reason, status=403)
+    return max(int(expires) - int(time.time()), 0), None
+
+
+@files_bp.route('/<file_id>/pyramid')
+@jwt_required
+def get_file_pyramid(current_user_id, file_id):
+    """Thumbnail / tile pyramid descriptor of an image or mask, built on first request."""
+    return _serve_pyramid(get_fs(), file_id, jsonify)
+
+
+@files_bp.route('/<file_id>/thumbnail')
+@jwt_required
+def get_file_thumbnail(current_user_id, file_id):
+    fs = get_fs()
+    return _serve_pyramid(fs, file_id, _thumbnail(fs, current_app.config['FILES_CACHE_MAX_AGE']))
+
+
+@files_bp.route('/<file_id>/tiles/<int:level>/<int:x>/<int:y>')
+@jwt_required
+def get_file_tile(current_user_id, file_id, level, x, y):
+    """One tile of a file's zoom pyramid; level 0 is full resolution."""
+    fs = get_fs()
+    # Tiles of a finished pyramid are served without touching its descriptor.
+    view, plane = _pyramid_args()
+    tile = get_tile(fs, file_id, level, x, y, view, plane)
+    if tile is not None:
+        return send_gridfs_file(tile, max_age=current_app.config['FILES_CACHE_MAX_AGE'])
+    return _serve_pyramid(fs, file_id, _tile(fs, file_id, level, x, y, current_app.config['FILES_CACHE_MAX_AGE']))
+
+
+@files_bp.route('/s/<file_id>/pyramid')
+def get_signed_pyramid(file_id):
+    _, error = _verify_signed_request(file_id)
+    return error or _serve_pyramid(get_fs(), file_id, jsonify)
+
+
+@files_bp.route('/s/<file_id>/thumbnail')
+def get_signed_thumbnail(file_id):
+    max_age, error = _verify_signed_request(file_id)
+    if error:
+        return error
+    fs = get_fs()
+    return _serve_pyramid(fs, file_id, _thumbnail(fs, max_age, public=True))
+
+
+@files_bp.route('/s/<file_id>/tiles/<int:level>/<int:x>/<int:y>')
+def get_signed_tile(file_id, level, x, y):
+    """A pyramid tile by signed URL; one signature covers every tile of the file / view."""
+    max_age, error = _verify_signed_request(file_id)
+    if error:
+        return error
+    fs = get_fs()
+    view, plane = _pyramid_args()
+    tile = get_tile(fs, file_id, level, x, y, view, plane)
+    if tile is not None:
+        return send_gridfs_file(tile, max_age=max_age, public=True)
+    return _serve_pyramid(fs, file_id, _tile(fs, file_id, level, x, y, max_age, public=True))
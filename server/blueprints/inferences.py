@@ -1,14 +1,19 @@
-from flask import Blueprint, request, jsonify, Response, current_app
+from flask import Blueprint, request, jsonify, Response, current_app, stream_with_context, url_for
 from db import get_db
 import datetime
 from bson.objectid import ObjectId
-from utils.security import jwt_required
+from utils.security import jwt_required, stream_token_required
 from db import get_db, get_fs
 from blueprints.models import get_model_by_id
-from services.inference_manager import start_managed_inference
-import io
-import zipfile
-import os
+from services.job_queue import dispatch_inference
+from services.mask_render import delete_renderings
+from services.progress_stream import InferenceStream
+from services.pyramid import delete_pyramids
+from services.result_cache import forget_artifact, normalize_params
+from services.export_archive import cached_export, invalidate_export, stream_and_store_export, stream_export
+from services.volume_store import VOLUME_KINDS
+from utils.gridfs_response import send_gridfs_file
+from utils.signed_urls import sign_file_url, sign_pyramid_urls, sign_stream_token, url_expiry
 
 inferences_bp = Blueprint('inferences', __name__)
 
@@ -40,6 +45,7 @@ def classify_inference(current_user_id, inference_id):
     # Option 1: top-level classification
     if 'classification' in data:
         db.inferences.update_one({"_id": inference_obj_id}, {"$set": {"classification": data['classification']}})
+        invalidate_export(db, get_fs(), inference_obj_id)
         return jsonify({"message": "Inference classified"}), 200
 
     # Option 2: per-result classifications
@@ -57,6 +63,7 @@ def classify_inference(current_user_id, inference_id):
                 if r.get('source_filename') == filename:
                     r['classification'] = {"label": label, "confidence": confidence}
         db.inferences.update_one({"_id": inference_obj_id}, {"$set": {"results": results}})
+        invalidate_export(db, get_fs(), inference_obj_id)
         return jsonify({"message": "Result classifications updated"}), 200
 
     return jsonify({"error": "No classification data provided"}), 400
@@ -81,16 +88,26 @@ def delete_inference(current_user_id, inference_id):
         return jsonify({"error": "Forbidden"}), 403
 
     # Attempt to remove any GridFS artifacts referenced in results
-    for res in inference.get('results', []):
-        artifacts = res.get('artifacts', [])
-        for a in artifacts:
-            gf = a.get('gridfs_id')
-            if gf:
-                try:
-                    fs.delete(ObjectId(gf))
-                except Exception:
-                    # log and continue; failure to delete a file should not block removal of the record
-                    current_app.logger.warning(f"Failed to delete gridfs file {gf} while deleting inference {inference_id}")
+    artifacts = [a for res in inference.get('results', []) for a in res.get('artifacts', []) if a.get('gridfs_id')]
+    # Artifacts can be shared with other inferences (e.g. flows reused by a
+    # re-segmentation); only delete what nothing else references.
+    shared = _shared_artifact_ids(db, inference_obj_id, [a['gridfs_id'] for a in artifacts])
+    for a in artifacts:
+        gf = a['gridfs_id']
+        if gf in shared:
+            continue
+        try:
+            if a.get('kind') == 'label_mask':
+                delete_renderings(fs, gf)
+            forget_artifact(db, gf)
+            delete_pyramids(db, fs, gf)
+            fs.delete(ObjectId(gf))
+        except Exception:
+            # log and continue; failure to delete a file should not block removal of the record
+            current_app.logger.warning(f"Failed to delete gridfs file {gf} while deleting inference {inference_id}")
+
+    # Stored download archive, if one was built
+    invalidate_export(db, fs, inference_obj_id)
 
     # Delete the inference document
     db.inferences.delete_one({"_id": inference_obj_id})
@@ -98,6 +115,20 @@ def delete_inference(current_user_id, inference_id):
     return jsonify({"message": "Inference deleted"}), 200
 
 
+def _shared_artifact_ids(db, inference_obj_id, gridfs_ids):
+    """The subset of ``gridfs_ids`` that other inferences also reference, in one query."""
+    if not gridfs_ids:
+        return set()
+    pipeline = [
+        {"$match": {"_id": {"$ne": inference_obj_id}, "results.artifacts.gridfs_id": {"$in": gridfs_ids}}},
+        {"$unwind": "$results"},
+        {"$unwind": "$results.artifacts"},
+        {"$match": {"results.artifacts.gridfs_id": {"$in": gridfs_ids}}},
+        {"$group": {"_id": "$results.artifacts.gridfs_id"}},
+    ]
+    return {doc['_id'] for doc in db.inferences.aggregate(pipeline)}
+
+
 @inferences_bp.route('/archive', methods=['POST'])
 @jwt_required
 def bulk_archive_inferences(current_user_id):
@@ -134,13 +165,38 @@ def start_inference(current_user_id):
     data = request.json
 
     dataset_id = data.get('dataset_id')
+    params = data.get('params', {}) or {}
+
+    # Ensemble: several models over the same decoded images in one job
+    if data.get('model_ids'):
+        return _start_ensemble(db, current_user_id, dataset_id, data['model_ids'], params)
+
     model_id = data.get('model_id', 'cellpose_model') #setting cellpose as a default model
     model_def = get_model_by_id(model_id)
     if not model_def:
         return jsonify({"error": f"Unknown model_id '{model_id}'"}), 400
 
     runner_name = model_def["runner_name"]
-    params = data.get('params', {}) or {}
+
+    if params.get('preview'):
+        error = _preview_error(params)
+        if error:
+            return error
+
+    # Re-segment mode: rebuild masks from a previous job's stored flows
+    if params.get('mode') == 'resegment':
+        try:
+            source = db.inferences.find_one({"_id": ObjectId(params.get('source_inference_id'))})
+        except Exception:
+            return jsonify({"error": "Invalid source_inference_id"}), 400
+        if not source or str(source['requested_by']) != current_user_id:
+            return jsonify({"error": "Source inference not found"}), 404
+        if source['status'] != 'completed':
+            return jsonify({"error": "Source inference is not yet complete"}), 400
+        if source.get('runner_name') == 'ensemble':
+            return jsonify({"error": "Ensemble inferences cannot be re-segmented"}), 400
+        dataset_id = dataset_id or str(source['dataset_id'])
+        runner_name = source.get('runner_name', runner_name)
 
     if not dataset_id:
         return jsonify({"error": "dataset_id is required"}), 400
@@ -151,14 +207,212 @@ def start_inference(current_user_id):
         "params": params,
         "model_id": model_id,
         "runner_name": runner_name,
+        "engine": model_def.get("engine", "torch"),
+        "status": "queued",
+        "created_at": datetime.datetime.utcnow(),
+        "results": []
+    }
+    if params.get('mode') == 'incremental':
+        error = _set_incremental_base(db, inference_doc)
+        if error:
+            return error
+    return _create_and_dispatch(db, inference_doc)
+
+
+def _preview_error(params):
+    """400 response for preview params the runner would reject, else None."""
+    scale = params.get('preview_scale', current_app.config['PREVIEW_SCALE'])
+    try:
+        scale = float(scale)
+    except (TypeError, ValueError):
+        return jsonify({"error": "preview_scale must be a number"}), 400
+    if not 0 < scale <= 1:
+        return jsonify({"error": "preview_scale must be greater than 0 and at most 1"}), 400
+    return None
+
+
+# Params that only select how an incremental job finds its base; ignored when matching.
+INCREMENTAL_PARAMS = ("mode", "base_inference_id")
+
+
+def _comparable_params(params):
+    """Params normalized like result cache keys, so execution-only settings don't block a base match."""
+    return normalize_params({k: v for k, v in (params or {}).items() if k not in INCREMENTAL_PARAMS})
+
+
+def _set_incremental_base(db, inference_doc):
+    """
+    Incremental mode: only files without a result are processed, and the
+    results of the base inference are carried into the new job.
+
+    The base is ``params.base_inference_id`` or, by default, the latest
+    completed inference of the same dataset, model(s) and params. Without
+    one the job simply processes every file.
+    """
+    params = inference_doc["params"]
+    if params.get('preview'):
+        return jsonify({"error": "Preview jobs cannot run incrementally"}), 400
+
+    query = {
+        "dataset_id": inference_doc["dataset_id"],
+        "requested_by": inference_doc["requested_by"],
+        "model_id": inference_doc["model_id"],
+        "status": "completed",
+    }
+    if params.get('base_inference_id'):
+        try:
+            query["_id"] = ObjectId(params['base_inference_id'])
+        except Exception:
+            return jsonify({"error": "Invalid base_inference_id"}), 400
+
+    wanted = _comparable_params(params)
+    candidates = db.inferences.find(
+        query, {"params": 1, "engine": 1, "members": 1}
+    ).sort("created_at", -1)
+    for candidate in candidates:
+        if (
+            _comparable_params(candidate.get("params")) == wanted
+            and candidate.get("engine", "torch") == inference_doc.get("engine", "torch")
+            and candidate.get("members") == inference_doc.get("members")
+        ):
+            inference_doc["base_inference_id"] = candidate["_id"]
+            return None
+
+    if params.get('base_inference_id'):
+        return jsonify({"error": "Base inference not found, not complete, or run with different model or params"}), 400
+    return None
+
+
+def _start_ensemble(db, current_user_id, dataset_id, model_ids, params):
+    """Body: { "dataset_id": ..., "model_ids": ["cellpose_model", "cellpose_onnx"], "params": {...} }"""
+    if not dataset_id:
+        return jsonify({"error": "dataset_id is required"}), 400
+    if not isinstance(model_ids, list) or len(model_ids) < 2 or len(set(model_ids)) != len(model_ids):
+        return jsonify({"error": "model_ids must list at least two distinct models"}), 400
+    if params.get('mode') == 'resegment' or params.get('volumetric') or params.get('preview'):
+        return jsonify({"error": "Re-segment, volumetric and preview jobs cannot run as an ensemble"}), 400
+
+    members = []
+    for model_id in model_ids:
+        model_def = get_model_by_id(model_id)
+        if not model_def:
+            return jsonify({"error": f"Unknown model_id '{model_id}'"}), 400
+        members.append({
+            "model_id": model_id,
+            "runner_name": model_def["runner_name"],
+            "engine": model_def.get("engine", "torch"),
+        })
+
+    inference_doc = {
+        "dataset_id": ObjectId(dataset_id),
+        "requested_by": ObjectId(current_user_id),
+        "params": params,
+        "model_id": "ensemble",
+        "runner_name": "ensemble",
+        "members": members,
+        "status": "queued",
+        "created_at": datetime.datetime.utcnow(),
+        "results": []
+    }
+    if params.get('mode') == 'incremental':
+        error = _set_incremental_base(db, inference_doc)
+        if error:
+            return error
+    return _create_and_dispatch(db, inference_doc)
+
+
+# Params that only shape a preview run; dropped when it is promoted to a full job.
+PREVIEW_PARAMS = ("preview", "preview_scale", "preview_max_files")
+
+
+@inferences_bp.route('/<inference_id>/promote', methods=['POST'])
+@jwt_required
+def promote_preview(current_user_id, inference_id):
+    """Starts the full-resolution job for a preview inference.
+
+    Body (optional): { "params": {...} } to override params of the preview.
+    """
+    db = get_db()
+    try:
+        preview = db.inferences.find_one({"_id": ObjectId(inference_id)})
+    except Exception:
+        return jsonify({"error": "Invalid inference id"}), 400
+    if not preview or str(preview['requested_by']) != current_user_id:
+        return jsonify({"error": "Inference not found"}), 404
+    if not (preview.get('params') or {}).get('preview'):
+        return jsonify({"error": "Inference is not a preview"}), 400
+
+    data = request.get_json(silent=True) or {}
+    params = {k: v for k, v in (preview.get('params') or {}).items() if k not in PREVIEW_PARAMS}
+    params.update(data.get('params') or {})
+
+    inference_doc = {
+        "dataset_id": preview["dataset_id"],
+        "requested_by": ObjectId(current_user_id),
+        "params": params,
+        "model_id": preview.get("model_id"),
+        "runner_name": preview["runner_name"],
+        "engine": preview.get("engine", "torch"),
         "status": "queued",
         "created_at": datetime.datetime.utcnow(),
+        "promoted_from": preview["_id"],
         "results": []
     }
+    if "members" in preview:
+        inference_doc["members"] = preview["members"]
+    return _create_and_dispatch(db, inference_doc)
+
+
+@inferences_bp.route('/<inference_id>/resume', methods=['POST'])
+@jwt_required
+def resume_inference(current_user_id, inference_id):
+    """Re-queues a failed or interrupted job; it continues from its last checkpoint.
+
+    Jobs still marked running are resumed only once their worker lease has
+    expired, or with { "force": true } (e.g. after the server was killed
+    while running jobs in-process).
+    """
+    db = get_db()
+    try:
+        inference = db.inferences.find_one({"_id": ObjectId(inference_id)})
+    except Exception:
+        return jsonify({"error": "Invalid inference id"}), 400
+    if not inference or str(inference['requested_by']) != current_user_id:
+        return jsonify({"error": "Inference not found"}), 404
+
+    data = request.get_json(silent=True) or {}
+    status = inference['status']
+    if status == 'running':
+        lease = inference.get('lease_expires_at')
+        if not data.get('force') and not (lease and lease < datetime.datetime.utcnow()):
+            return jsonify({"error": "Inference is still running"}), 409
+    elif status != 'failed':
+        return jsonify({"error": f"Cannot resume an inference that is {status}"}), 400
+    if (inference.get('params') or {}).get('mode') == 'resegment':
+        return jsonify({"error": "Re-segment jobs cannot be resumed; start a new one"}), 400
+
+    # Only the caller that flips the status dispatches the job.
+    updated = db.inferences.update_one(
+        {"_id": inference["_id"], "status": status},
+        {
+            "$set": {"status": "queued", "attempts": 0, "resumed_at": datetime.datetime.utcnow()},
+            "$unset": {"finished_at": "", "notes": "", "worker_id": "", "heartbeat_at": "", "lease_expires_at": ""},
+        },
+    )
+    if not updated.modified_count:
+        return jsonify({"error": "Inference changed state; try again"}), 409
+    return _dispatch(db, inference["_id"])
+
+
+def _create_and_dispatch(db, inference_doc):
+    """Inserts an inference job and hands it to the dispatcher; returns the start response."""
     inference_id = db.inferences.insert_one(inference_doc).inserted_id
+    return _dispatch(db, inference_id)
+
 
+def _dispatch(db, inference_id):
     try:
-        start_managed_inference(str(inference_id))
+        queued = dispatch_inference(str(inference_id))
 
     except Exception as e:
         db.inferences.update_one(
@@ -174,12 +428,86 @@ def start_inference(current_user_id):
         traceback.print_exc()
         return jsonify({"error": f"Inference failed: {e}"}), 500
 
+    if queued:
+        return jsonify({
+            "message": "Inference job queued",
+            "inference_id": str(inference_id),
+            "status": "queued"
+        }), 202
+
     return jsonify({
         "message": "Inference job completed", 
         "inference_id": str(inference_id)
     }), 200
 
 
+def _owned_inference_id(db, current_user_id, inference_id):
+    """(ObjectId, None) for one of the user's inferences, else (None, error response)."""
+    try:
+        inference_id = ObjectId(inference_id)
+    except Exception:
+        return None, (jsonify({"error": "Invalid inference id"}), 400)
+    if not db.inferences.count_documents({"_id": inference_id, "requested_by": ObjectId(current_user_id)}, limit=1):
+        return None, (jsonify({"error": "Inference not found"}), 404)
+    return inference_id, None
+
+
+@inferences_bp.route('/stream/token', methods=['GET'])
+@inferences_bp.route('/<inference_id>/stream/token', methods=['GET'])
+@jwt_required
+def get_stream_token(current_user_id, inference_id=None):
+    """Short-lived ``?token=`` for opening the matching stream with EventSource.
+
+    Returns ``{"token", "expires_in", "url"}``; the token is only checked when
+    the stream opens, so request a new one for every (re)connection.
+    """
+    if inference_id is not None:
+        _, error = _owned_inference_id(get_db(), current_user_id, inference_id)
+        if error:
+            return error
+    token = sign_stream_token(current_user_id, inference_id)
+    if inference_id is None:
+        url = url_for('inferences.stream_inferences', token=token)
+    else:
+        url = url_for('inferences.stream_inferences', inference_id=inference_id, token=token)
+    return jsonify({
+        "token": token,
+        "expires_in": current_app.config['STREAM_TOKEN_TTL'],
+        "url": url,
+    }), 200
+
+
+@inferences_bp.route('/stream', methods=['GET'])
+@inferences_bp.route('/<inference_id>/stream', methods=['GET'])
+@stream_token_required
+def stream_inferences(current_user_id, inference_id=None):
+    """Server-Sent Events with compact status / progress updates.
+
+    ``/stream`` follows all of the user's inferences, ``/<id>/stream`` one
+    job and ends once it completes or fails. EventSource cannot send
+    headers, so it passes a token from ``/stream/token`` as ``?token=``.
+    """
+    db = get_db()
+    if inference_id is not None:
+        inference_id, error = _owned_inference_id(db, current_user_id, inference_id)
+        if error:
+            return error
+
+    stream = InferenceStream(
+        db,
+        current_user_id,
+        inference_id,
+        heartbeat=current_app.config["INFERENCE_STREAM_HEARTBEAT"],
+        max_seconds=current_app.config["INFERENCE_STREAM_MAX_SECONDS"],
+        poll_interval=current_app.config["INFERENCE_STREAM_POLL_INTERVAL"],
+    )
+    return Response(
+        stream.events(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @inferences_bp.route('/<inference_id>', methods=['GET'])
 @jwt_required
 def get_inference_status(current_user_id, inference_id):
@@ -195,6 +523,10 @@ def get_inference_status(current_user_id, inference_id):
     inference['_id'] = str(inference['_id'])
     inference['dataset_id'] = str(inference['dataset_id'])
     inference['requested_by'] = str(inference['requested_by'])
+    if 'promoted_from' in inference:
+        inference['promoted_from'] = str(inference['promoted_from'])
+    if 'base_inference_id' in inference:
+        inference['base_inference_id'] = str(inference['base_inference_id'])
     
     # Serializing mask / artifact IDs for the frontend
     for res in inference.get('results', []):
@@ -208,16 +540,46 @@ def get_inference_status(current_user_id, inference_id):
         for artifact in artifacts:
             if "gridfs_id" in artifact:
                 artifact["gridfs_id"] = str(artifact["gridfs_id"])
+
+    if current_app.config["SIGNED_FILE_URLS"]:
+        _add_signed_urls(inference, url_expiry())
     
     return jsonify(inference), 200
 
+
+def _add_signed_urls(inference, expires):
+    """Signed, cacheable URLs for the source image, artifacts and their pyramids in every result."""
+    for res in inference.get('results', []):
+        if res.get('source_image_gridfs_id'):
+            res['source_image_url'] = sign_file_url(res['source_image_gridfs_id'], expires=expires)
+            res['source_pyramid_urls'] = sign_pyramid_urls(
+                res['source_image_gridfs_id'], plane=res.get('plane'), expires=expires
+            )
+        for artifact in res.get('artifacts', []):
+            # Volumes are read slice by slice through /api/files/<id>/slices/<z>
+            if not artifact.get('gridfs_id') or artifact.get('kind') in VOLUME_KINDS:
+                continue
+            artifact['url'] = sign_file_url(artifact['gridfs_id'], expires=expires)
+            if artifact.get('kind') in ('class_mask', 'instance_mask'):
+                artifact['pyramid_urls'] = sign_pyramid_urls(artifact['gridfs_id'], expires=expires)
+            if artifact.get('kind') == 'label_mask':
+                artifact['view_urls'] = {
+                    view: sign_file_url(artifact['gridfs_id'], view, expires) for view in ('class', 'instance')
+                }
+                artifact['view_pyramid_urls'] = {
+                    view: sign_pyramid_urls(artifact['gridfs_id'], view, expires=expires)
+                    for view in ('class', 'instance')
+                }
+    inference['urls_expire_at'] = expires
+
 @inferences_bp.route('/<inference_id>/download', methods=['GET'])
 @jwt_required
 def download_inference_zip(current_user_id, inference_id):
     """
     Downloads all mask results for an inference as a ZIP file.
     The ZIP contains a folder for each dataset file, containing
-    the image and its masks.
+    the image and its masks. Stored flows are only included with
+    ``?flows=true``; those archives are streamed, never cached.
     """
     db = get_db()
     fs = get_fs()
@@ -237,73 +599,25 @@ def download_inference_zip(current_user_id, inference_id):
     if inference['status'] != 'completed':
         return jsonify({"error": "Inference is not yet complete"}), 400
     
-    memory_file = io.BytesIO()
-    with zipfile.ZipFile(memory_file, 'w', zipfile.ZIP_DEFLATED) as zf:
-        
-        for result in inference.get('results', []):
-            source_filename = result['source_filename']
-            # Create a folder name based on the file stem (e.g., 'image_01')
-            folder_name = os.path.splitext(source_filename)[0]
-
-            # 1. Add Original Image
-            # Path inside zip: image_01/image_01.png
-            if 'source_image_gridfs_id' in result:
-                try:
-                    file_data = fs.get(ObjectId(result['source_image_gridfs_id'])).read()
-                    zip_path = os.path.join(folder_name, source_filename)
-                    zf.writestr(zip_path, file_data)
-                except Exception as e:
-                    current_app.logger.error(f"Failed to read source_image {result['source_image_gridfs_id']}: {e}")
-
-            # 2. Add artifacts (generic, supports multiple models)
-            artifacts = result.get("artifacts", [])
-            if artifacts:
-                # Preferred path: use the generic artifacts list (supports any model).
-                for artifact in artifacts:
-                    gridfs_id = artifact.get("gridfs_id")
-                    if not gridfs_id:
-                        continue
-                    try:
-                        file_data = fs.get(ObjectId(gridfs_id)).read()
-                        # If the artifact provides its own filename, use it; otherwise
-                        # derive a simple name based on kind.
-                        artifact_filename = artifact.get(
-                            "filename",
-                            f"{folder_name}_{artifact.get('kind', 'artifact')}.bin",
-                        )
-                        zip_path = os.path.join(folder_name, artifact_filename)
-                        zf.writestr(zip_path, file_data)
-                    except Exception as e:
-                        current_app.logger.error(
-                            f"Failed to read artifact {gridfs_id} (kind={artifact.get('kind')}): {e}"
-                        )
-            else:
-                # Backwards-compatible path: fall back to class_mask_id / instance_mask_id
-                # if no artifacts list is present (older jobs).
-                # 2a. Add Class Mask
-                if 'class_mask_id' in result and result['class_mask_id']:
-                    try:
-                        file_data = fs.get(ObjectId(result['class_mask_id'])).read()
-                        zip_path = os.path.join(folder_name, f"{folder_name}_class_mask.png")
-                        zf.writestr(zip_path, file_data)
-                    except Exception as e:
-                        current_app.logger.error(f"Failed to read class_mask {result['class_mask_id']}: {e}")
-
-                # 2b. Add Instance Mask
-                if 'instance_mask_id' in result and result['instance_mask_id']:
-                    try:
-                        file_data = fs.get(ObjectId(result['instance_mask_id'])).read()
-                        zip_path = os.path.join(folder_name, f"{folder_name}_instance_mask.png")
-                        zf.writestr(zip_path, file_data)
-                    except Exception as e:
-                        current_app.logger.error(f"Failed to read instance_mask {result['instance_mask_id']}: {e}")
-
-    memory_file.seek(0)
-    
+    headers = {'Content-Disposition': f'attachment;filename=inference_{inference_id}.zip'}
+    include_flows = request.args.get('flows', '').lower() in {'1', 'true', 'yes', 'on'}
+    if include_flows or not current_app.config["EXPORT_CACHE_ENABLED"]:
+        return Response(
+            stream_with_context(stream_export(fs, inference, include_flows)), mimetype='application/zip', headers=headers
+        )
+
+    # Served from the stored archive when it is still current ...
+    stored = cached_export(db, fs, inference)
+    if stored is not None:
+        response = send_gridfs_file(stored, mimetype='application/zip', download_name=f'inference_{inference_id}.zip')
+        response.headers['X-Export-Cache'] = 'hit'
+        return response
+
+    # ... otherwise built while it streams and stored for the next download.
     return Response(
-        memory_file,
+        stream_with_context(stream_and_store_export(db, fs, inference)),
         mimetype='application/zip',
-        headers={'Content-Disposition': f'attachment;filename=inference_{inference_id}.zip'}
+        headers={**headers, 'X-Export-Cache': 'miss'},
     )
 
 
@@ -340,6 +654,10 @@ def list_inferences(current_user_id):
         record["_id"] = str(record["_id"])
         record["dataset_id"] = str(record["dataset_id"])
         record["requested_by"] = str(record["requested_by"])
+        if "promoted_from" in record:
+            record["promoted_from"] = str(record["promoted_from"])
+        if "base_inference_id" in record:
+            record["base_inference_id"] = str(record["base_inference_id"])
         for result in record.get("results", []):
             # Backwards-compatible: stringify legacy mask IDs if present
             if "class_mask_id" in result and result["class_mask_id"] is not None:
@@ -353,4 +671,9 @@ def list_inferences(current_user_id):
                 if "gridfs_id" in artifact:
                     artifact["gridfs_id"] = str(artifact["gridfs_id"])
 
+    if current_app.config["SIGNED_FILE_URLS"]:
+        expires = url_expiry()
+        for record in records:
+            _add_signed_urls(record, expires)
+
     return jsonify(records), 200
@@ -1,5 +1,7 @@
 from flask import Blueprint, jsonify
+from db import get_db
 from utils.security import jwt_required
+from services.model_pool import get_model_pool
 
 models_bp = Blueprint("models", __name__)
 
@@ -7,9 +9,17 @@ AVAILABLE_MODELS = [
     {
         "_id": "cellpose_model",
         "name": "Cellpose",
-        "runner_name": "cellpose_model",
+        "runner_name": "cellpose",
+        "engine": "torch",
         "description": "Cellpose-based segmentation model",
-    }
+    },
+    {
+        "_id": "cellpose_onnx",
+        "name": "Cellpose (ONNX Runtime)",
+        "runner_name": "cellpose",
+        "engine": "onnx",
+        "description": "Cellpose model exported to ONNX and run with ONNX Runtime on the CPU",
+    },
 ]
 
 
@@ -24,3 +34,22 @@ def get_model_by_id(model_id: str):
 @jwt_required
 def list_models(current_user_id):
     return jsonify(AVAILABLE_MODELS), 200
+
+
+@models_bp.route("/pool", methods=["GET"])
+@jwt_required
+def model_pool_stats(current_user_id):
+    """Hit/miss counters and resident models of this process's model pool."""
+    return jsonify(get_model_pool().stats()), 200
+
+
+@models_bp.route("/cache", methods=["GET"])
+@jwt_required
+def result_cache_stats(current_user_id):
+    """Cumulative result cache hit/miss counters per model."""
+    db = get_db()
+    stats = list(db.result_cache_stats.find())
+    for s in stats:
+        s["model_id"] = s.pop("_id")
+        s["entries"] = db.result_cache.count_documents({"model_id": s["model_id"]})
+    return jsonify(stats), 200
@@ -1,6 +1,10 @@
 import click
+import signal
+import threading
+from flask import current_app
 from flask.cli import with_appcontext
 from db import get_db
+from services.job_queue import InferenceWorkerPool
 
 @click.command('init-db')
 @with_appcontext
@@ -38,6 +42,8 @@ def init_db_command():
                     'description': {'bsonType': 'string'},
                     'owner_id': {'bsonType': 'objectId'},
                     'created_at': {'bsonType': 'date'},
+                    # Set when files are appended to an existing dataset
+                    'updated_at': {'bsonType': 'date'},
                     'files': {
                         'bsonType': 'array',
                         'items': {
@@ -65,9 +71,35 @@ def init_db_command():
                     'params': {'bsonType': 'object'},
                     'status': {'enum': ['queued', 'running', 'completed', 'failed']},
                     'notes': {'bsonType': 'string'},
+                    # Lease held by the worker running a 'running' job
+                    'worker_id': {'bsonType': ['string', 'null']},
+                    'heartbeat_at': {'bsonType': ['date', 'null']},
+                    'lease_expires_at': {'bsonType': ['date', 'null']},
+                    'attempts': {'bsonType': 'int'},
+                    # Network engine the Cellpose runner uses for this job
+                    'engine': {'enum': ['torch', 'onnx']},
+                    # Ensemble jobs (runner_name 'ensemble'): [{ model_id, runner_name, engine }, ...]
+                    'members': {'bsonType': 'array', 'items': {'bsonType': 'object'}},
+                    # Incremental jobs: inference whose results were carried over
+                    'base_inference_id': {'bsonType': 'objectId'},
+                    # Files with a checkpointed result / files in the job
+                    'progress': {
+                        'bsonType': 'object',
+                        'properties': {
+                            'processed': {'bsonType': 'int'},
+                            'total': {'bsonType': 'int'}
+                        }
+                    },
+                    'resumed_at': {'bsonType': 'date'},
+                    # Bumped whenever results change; a stored export of an older version is stale
+                    'results_version': {'bsonType': 'int'},
+                    'export': {'bsonType': 'object'},
                     # Results schema is flexible, no change needed here.
                     # It will store objects like:
                     # { source_filename: "...", class_mask_id: "...", instance_mask_id: "..." }
+                    # or, with MASK_STORAGE=labels, { source_filename: "...", label_mask_id: "..." }
+                    # or, for volumetric jobs, { source_filename: "...", label_volume_id: "...", volume: {...} }
+                    # or, for ensembles, { source_filename: "...", models: { <model_id>: {...} }, artifacts: [...] }
                     'results': {'bsonType': 'array', 'items': {'bsonType': 'object'}},
                     'created_at': {'bsonType': 'date'},
                     'finished_at': {'bsonType': 'date'}
@@ -87,7 +119,57 @@ def init_db_command():
         except Exception as e:
             click.echo(f"Failed to create collection {name}: {e}")
 
+    # Workers claim the oldest queued job and scan for expired leases
+    db.inferences.create_index([('status', 1), ('created_at', 1)])
+    db.inferences.create_index([('status', 1), ('lease_expires_at', 1)])
+    # Deleting an inference checks which of its artifacts other inferences share
+    db.inferences.create_index('results.artifacts.gridfs_id')
+
+    # Per-image result cache lookups and invalidation
+    db.result_cache.create_index(
+        [('source_sha256', 1), ('model_id', 1), ('weights_version', 1), ('params', 1)],
+        unique=True,
+    )
+    db.result_cache.create_index('result.artifacts.gridfs_id')
+
+    # Orphaned artifacts of an interrupted job are found by inference id on resume
+    db.fs.files.create_index('metadata.inference_id')
+    # One pyramid descriptor per file / view / plane; inserting it claims the build
+    db.pyramids.create_index([('file_id', 1), ('view', 1), ('plane', 1)], unique=True)
+    # Pyramid tiles / thumbnails are looked up by the file they were built from
+    db.fs.files.create_index([
+        ('metadata.pyramid_of', 1), ('metadata.view', 1), ('metadata.plane', 1),
+        ('metadata.type', 1), ('metadata.level', 1), ('metadata.x', 1), ('metadata.y', 1),
+    ])
+
     click.echo("Database initialization complete.")
 
+@click.command('inference-worker')
+@click.option('--workers', '-w', default=None, type=int,
+              help='Number of worker processes (defaults to INFERENCE_WORKERS).')
+@with_appcontext
+def inference_worker_command(workers):
+    """Runs leasing inference workers against the configured MongoDB."""
+    pool = InferenceWorkerPool(
+        current_app.config['CONFIG_NAME'],
+        workers or current_app.config['INFERENCE_WORKERS'],
+        mode='lease',
+    )
+    pool.start()
+    click.echo(f"Started {pool.num_workers} inference worker(s). Press Ctrl+C to drain and stop.")
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    try:
+        while not stop.wait(1):
+            pass
+    except KeyboardInterrupt:
+        pass
+
+    click.echo("Draining inference workers...")
+    pool.shutdown(current_app.config['INFERENCE_SHUTDOWN_TIMEOUT'])
+    click.echo("Inference workers stopped.")
+
 def register_commands(app):
-    app.cli.add_command(init_db_command)
\ No newline at end of file
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(inference_worker_command)
\ No newline at end of file
@@ -9,6 +9,99 @@ class Config:
     CVAT_API_URL = os.getenv('CVAT_API_URL', 'http://localhost:8080/')
     CVAT_ADMIN_USER = os.getenv('CVAT_ADMIN_USER', 'Vanjivaka_Sairam')
     CVAT_ADMIN_PASSWORD = os.getenv('CVAT_ADMIN_PASSWORD', 'Intelli1@pass')
+    # Loaded model weights shared by all runners, evicted LRU past this size
+    MODEL_POOL_MAX_BYTES = int(os.getenv('MODEL_POOL_MAX_BYTES', 4 * 1024 ** 3))
+    # 'inline' runs inference inside the request, 'queued' hands it to local worker
+    # processes, 'lease' leaves it for workers (on any host) that claim it from MongoDB.
+    # A restarted 'queued' server re-enqueues jobs still queued, but only 'lease'
+    # retries jobs that were running when their worker died
+    INFERENCE_DISPATCH_MODE = os.getenv('INFERENCE_DISPATCH_MODE', 'inline')
+    INFERENCE_WORKERS = int(os.getenv('INFERENCE_WORKERS', 2))
+    INFERENCE_SHUTDOWN_TIMEOUT = float(os.getenv('INFERENCE_SHUTDOWN_TIMEOUT', 600))
+    INFERENCE_LEASE_SECONDS = float(os.getenv('INFERENCE_LEASE_SECONDS', 60))
+    INFERENCE_POLL_INTERVAL = float(os.getenv('INFERENCE_POLL_INTERVAL', 2))
+    INFERENCE_MAX_ATTEMPTS = int(os.getenv('INFERENCE_MAX_ATTEMPTS', 3))
+    # Server-Sent Events progress streams: keep-alive comment interval, how long a
+    # stream stays open before the client reconnects, and the polling interval
+    # used when MongoDB has no change streams (standalone server)
+    INFERENCE_STREAM_HEARTBEAT = float(os.getenv('INFERENCE_STREAM_HEARTBEAT', 15))
+    INFERENCE_STREAM_MAX_SECONDS = float(os.getenv('INFERENCE_STREAM_MAX_SECONDS', 300))
+    INFERENCE_STREAM_POLL_INTERVAL = float(os.getenv('INFERENCE_STREAM_POLL_INTERVAL', 2))
+    # Lifetime (seconds) of the ?token= issued for an EventSource connection; it is
+    # only checked when the stream opens, so clients fetch a new one per connection
+    STREAM_TOKEN_TTL = int(os.getenv('STREAM_TOKEN_TTL', 60))
+    # Cellpose execution: 'sequential' (one image per eval) or 'batched'
+    CELLPOSE_EXECUTION_MODE = os.getenv('CELLPOSE_EXECUTION_MODE', 'sequential')
+    CELLPOSE_BATCH_SIZE = int(os.getenv('CELLPOSE_BATCH_SIZE', 8))
+    CELLPOSE_IMAGES_PER_BATCH = int(os.getenv('CELLPOSE_IMAGES_PER_BATCH', 8))
+    # Overlap GridFS reads / decoding and mask encoding / writes with the model
+    # (off by default; jobs opt in with params.pipeline)
+    CELLPOSE_PIPELINE = os.getenv('CELLPOSE_PIPELINE', 'false').lower() in {'1', 'true', 'yes', 'on'}
+    CELLPOSE_PREFETCH = int(os.getenv('CELLPOSE_PREFETCH', 2))
+    CELLPOSE_IO_WORKERS = int(os.getenv('CELLPOSE_IO_WORKERS', 2))
+    CELLPOSE_MAX_PENDING_WRITES = int(os.getenv('CELLPOSE_MAX_PENDING_WRITES', 4))
+    # Process-pool segmentation: workers per job (<= 1 disables) and cores pinned to each
+    CELLPOSE_WORKERS_PER_JOB = int(os.getenv('CELLPOSE_WORKERS_PER_JOB', 1))
+    CELLPOSE_CORES_PER_WORKER = int(os.getenv('CELLPOSE_CORES_PER_WORKER', 4))
+    # Network engine: 'torch' or 'onnx' (ONNX Runtime on CPU, exported next to the weights
+    # or into CELLPOSE_ONNX_DIR); optional dynamic int8 quantization of the export
+    CELLPOSE_ENGINE = os.getenv('CELLPOSE_ENGINE', 'torch')
+    CELLPOSE_ONNX_QUANTIZE = os.getenv('CELLPOSE_ONNX_QUANTIZE', 'false').lower() in {'1', 'true', 'yes', 'on'}
+    CELLPOSE_ONNX_TILE = int(os.getenv('CELLPOSE_ONNX_TILE', 224))
+    CELLPOSE_ONNX_DIR = os.getenv('CELLPOSE_ONNX_DIR') or None
+    # Tiled inference for large images: tile edge, overlap between tiles, images above
+    # this many pixels are tiled automatically, tiles with a flatter range are skipped
+    CELLPOSE_TILE_SIZE = int(os.getenv('CELLPOSE_TILE_SIZE', 2048))
+    CELLPOSE_TILE_OVERLAP = int(os.getenv('CELLPOSE_TILE_OVERLAP', 128))
+    CELLPOSE_TILE_AUTO_PIXELS = int(os.getenv('CELLPOSE_TILE_AUTO_PIXELS', 4096 * 4096))
+    CELLPOSE_TILE_BLANK_THRESHOLD = float(os.getenv('CELLPOSE_TILE_BLANK_THRESHOLD', 0))
+    # zlib level of the per-slice chunks of 3D volume artifacts
+    VOLUME_COMPRESS_LEVEL = int(os.getenv('VOLUME_COMPRESS_LEVEL', 6))
+    # Preview runs (params.preview): downsampling factor and number of dataset images sampled
+    PREVIEW_SCALE = float(os.getenv('PREVIEW_SCALE', 0.25))
+    PREVIEW_MAX_FILES = int(os.getenv('PREVIEW_MAX_FILES', 8))
+    # TIFF inputs at least this large are streamed from GridFS into a temporary file in
+    # IMAGE_SPOOL_DIR (system temp dir when unset) and memory-mapped instead of read into
+    # RAM; PNG / JPEG inputs are always decoded in memory
+    IMAGE_SPOOL_MIN_BYTES = int(os.getenv('IMAGE_SPOOL_MIN_BYTES', 32 * 1024 * 1024))
+    IMAGE_SPOOL_DIR = os.getenv('IMAGE_SPOOL_DIR') or None
+    # Mask PNGs: 'palette' (8-bit indexed) or 'rgb'; zlib level 0 (fastest) - 9 (smallest)
+    MASK_PNG_MODE = os.getenv('MASK_PNG_MODE', 'palette')
+    PNG_COMPRESS_LEVEL = int(os.getenv('PNG_COMPRESS_LEVEL', 6))
+    # Cache-Control max-age (seconds) for files served from GridFS; their content never changes
+    FILES_CACHE_MAX_AGE = int(os.getenv('FILES_CACHE_MAX_AGE', 86400))
+    # Signed /api/files/s/<id> URLs issued with inference results: lifetime in seconds,
+    # expiry rounding (URLs issued within one bucket are identical) and HMAC key
+    # (defaults to JWT_SECRET_KEY); off by default, since anyone holding a signed URL
+    # can fetch the file without a JWT until it expires
+    SIGNED_FILE_URLS = os.getenv('SIGNED_FILE_URLS', 'false').lower() in {'1', 'true', 'yes', 'on'}
+    FILE_URL_TTL = int(os.getenv('FILE_URL_TTL', 3600))
+    FILE_URL_BUCKET = int(os.getenv('FILE_URL_BUCKET', 900))
+    FILE_URL_SECRET = os.getenv('FILE_URL_SECRET') or None
+    # Thumbnails and zoom tile pyramids of source images and masks; tiles of source
+    # images are 'jpeg' or 'png' (masks are always PNG). With PYRAMID_PREBUILD workers
+    # build a job's pyramids once it completes, otherwise the first request builds
+    # them; a build claim older than PYRAMID_BUILD_TIMEOUT seconds is taken over
+    PYRAMID_PREBUILD = os.getenv('PYRAMID_PREBUILD', 'false').lower() in {'1', 'true', 'yes', 'on'}
+    PYRAMID_BUILD_TIMEOUT = int(os.getenv('PYRAMID_BUILD_TIMEOUT', 600))
+    PYRAMID_TILE_SIZE = int(os.getenv('PYRAMID_TILE_SIZE', 256))
+    THUMBNAIL_SIZE = int(os.getenv('THUMBNAIL_SIZE', 256))
+    PYRAMID_IMAGE_FORMAT = os.getenv('PYRAMID_IMAGE_FORMAT', 'jpeg')
+    # 'rendered' stores class + instance PNGs per image, 'labels' stores one 16-bit
+    # label PNG (32-bit TIFF for tiled results) and renders the class / instance
+    # views on demand
+    MASK_STORAGE = os.getenv('MASK_STORAGE', 'rendered')
+    # Keep Cellpose flows / cell probabilities so jobs can be re-thresholded later.
+    # Off by default (flows are ~400x the size of the masks); jobs opt in with params.keep_flows
+    CELLPOSE_KEEP_FLOWS = os.getenv('CELLPOSE_KEEP_FLOWS', 'false').lower() in {'1', 'true', 'yes', 'on'}
+    # Reuse stored results for identical (image bytes, model weights, params); off by
+    # default, jobs opt in with params.use_cache
+    RESULT_CACHE_ENABLED = os.getenv('RESULT_CACHE_ENABLED', 'false').lower() in {'1', 'true', 'yes', 'on'}
+    # Store each completed inference's download ZIP in GridFS and serve later downloads
+    # from it; with EXPORT_PREBUILD workers build it as soon as the job completes.
+    # Both off by default since the stored ZIP duplicates the job's files
+    EXPORT_CACHE_ENABLED = os.getenv('EXPORT_CACHE_ENABLED', 'false').lower() in {'1', 'true', 'yes', 'on'}
+    EXPORT_PREBUILD = os.getenv('EXPORT_PREBUILD', 'false').lower() in {'1', 'true', 'yes', 'on'}
     
 class DevelopmentConfig(Config):
     DEBUG = True
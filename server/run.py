@@ -7,5 +7,13 @@ from app import create_app
 config_name = os.getenv('FLASK_CONFIG', 'default')
 app = create_app(config_name)
 
+if app.config['INFERENCE_DISPATCH_MODE'] == 'queued':
+    # Start the worker pool now so jobs left queued by a previous run are picked up
+    # without waiting for the next submission.
+    from services.job_queue import get_worker_pool
+
+    with app.app_context():
+        get_worker_pool()
+
 if __name__ == '__main__':
     app.run(debug = True, port = 5001)
\ No newline at end of file
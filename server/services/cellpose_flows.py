@@ -0,0 +1,64 @@
+import io
+from typing import Optional, Tuple
+
+import numpy as np
+from cellpose import dynamics
+
+
+Flows = Tuple[np.ndarray, np.ndarray]  # (dP [2, H, W], cellprob [H, W])
+
+# ``model.eval``'s default; ``compute_masks`` on its own keeps every object (-1).
+EVAL_MIN_SIZE = 15
+
+
+def extract_flows(out, index: Optional[int] = None) -> Optional[Flows]:
+    """
+    Pulls (dP, cellprob) out of a ``model.eval`` result. ``index`` selects
+    one image when a stack of 2D images was evaluated together.
+    """
+    if not isinstance(out, (list, tuple)) or len(out) < 2:
+        return None
+    flows = out[1]
+    if not isinstance(flows, (list, tuple)) or len(flows) < 3:
+        return None
+
+    dP, cellprob = np.asarray(flows[1]), np.asarray(flows[2])
+    if index is not None:
+        dP, cellprob = dP[:, index], cellprob[index]
+    return dP, cellprob
+
+
+def encode_flows(flows: Flows) -> bytes:
+    """Compact float16, zlib-compressed .npz of the network outputs."""
+    dP, cellprob = flows
+    bytes_io = io.BytesIO()
+    np.savez_compressed(
+        bytes_io,
+        dP=dP.astype(np.float16),
+        cellprob=cellprob.astype(np.float16),
+    )
+    return bytes_io.getvalue()
+
+
+def decode_flows(data: bytes) -> Flows:
+    with np.load(io.BytesIO(data)) as npz:
+        return npz["dP"].astype(np.float32), npz["cellprob"].astype(np.float32)
+
+
+def masks_from_flows(flows: Flows, params: dict) -> np.ndarray:
+    """
+    Rebuilds instance labels from stored flows with new thresholds. This is
+    the mask-reconstruction half of ``model.eval`` only, with no network pass.
+    """
+    dP, cellprob = flows
+    kwargs = {
+        "niter": int(params.get("niter") or 200),
+        "cellprob_threshold": float(params.get("cellprob_threshold", 0.0)),
+        "flow_threshold": float(params.get("flow_threshold", 0.4)),
+        "min_size": int(params["min_size"]) if params.get("min_size") is not None else EVAL_MIN_SIZE,
+    }
+
+    out = dynamics.compute_masks(dP, cellprob, **kwargs)
+    # Older Cellpose releases return (masks, p), newer ones only masks.
+    masks = out[0] if isinstance(out, tuple) else out
+    return np.asarray(masks).astype(np.uint16, copy=False)
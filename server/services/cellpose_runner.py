@@ -1,94 +1,238 @@
 from bson.objectid import ObjectId
-import datetime
 from PIL import Image
 import numpy as np
 import io
 import os
+from typing import Dict, List, Optional
 from flask import current_app
 from cellpose import models
-from cellpose import io as cp_io
 
+from services.cellpose_flows import decode_flows, encode_flows, extract_flows, masks_from_flows
+from services.colorize import (
+    encode_class_png,
+    encode_instance_png,
+    to_class_rgb,
+    to_instance_rgb,
+)
+from services.image_reader import PlaneView, close_sources, open_image
+from services.mask_render import encode_label_mask, find_artifact
+from services.model_pool import get_model_pool
+from services.onnx_engine import attach_onnx_engine
+from services.parallel_inference import ParallelSegmenter
+from services.pipeline import StagedPipeline
+from services.result_cache import ResultCache, normalize_params, weights_version
 from services.model_runner_base import ModelRunner
 from services.storage import save_bytes_to_gridfs
+from services.tiling import segment_tiled
+from services.volume_store import save_volume
 
-BG_RGB       = (0, 0, 0)
-NUCLEUS_RGB = (138, 17, 157) # class color
-
-def voc_colormap(N=256):
-    """Standard VOC colormap (unique colors for instances)."""
-    cmap = np.zeros((N,3), dtype=np.uint8)
-    for i in range(N):
-        r = g = b = 0
-        cid = i
-        for j in range(8):
-            r |= ((cid & 1) << (7-j))
-            g |= (((cid >> 1) & 1) << (7-j))
-            b |= (((cid >> 2) & 1) << (7-j))
-            cid >>= 3
-        cmap[i] = [r, g, b]
-    return cmap
-
-VOC_CMAP = voc_colormap(256)
-
-def to_class_rgb(mask_int: np.ndarray) -> np.ndarray:
-    """Two-color class mask: BG black, nucleus purple."""
-    rgb = np.zeros((*mask_int.shape, 3), np.uint8)
-    rgb[mask_int > 0] = NUCLEUS_RGB
-    return rgb
-
-def to_instance_rgb(mask_int: np.ndarray) -> np.ndarray:
-    """VOC-colored instance mask."""
-    h, w = mask_int.shape[:2]
-    out = np.zeros((h, w, 3), np.uint8)
-    labels = np.unique(mask_int)
-    labels = labels[labels > 0]
-    for k in labels:
-        color = VOC_CMAP[int(k) % 255 + 1] # avoid 0 (black)
-        out[mask_int == k] = color
-    return out
-
-def convert_to_png_bytes(rgb_array: np.ndarray) -> bytes:
+def convert_to_png_bytes(rgb_array: np.ndarray, compress_level: int = 6) -> bytes:
     """Converts a numpy RGB array to PNG bytes."""
     img = Image.fromarray(rgb_array.astype(np.uint8), mode="RGB")
     bytes_io = io.BytesIO()
-    img.save(bytes_io, format='PNG')
+    img.save(bytes_io, format='PNG', compress_level=compress_level)
     return bytes_io.getvalue()
 
 
-def run_cellpose_model(image_bytes, diameter, channels):
+def encode_mask_pngs(masks: np.ndarray):
     """
-    Runs a specific Cellpose model file on raw image bytes.
-    Returns (class_rgb_array, instance_rgb_array)
+    Encodes the class and instance views of a label mask as PNG bytes.
+
+    MASK_PNG_MODE picks 'palette' (8-bit "P" PNGs, the default) or 'rgb'
+    (24-bit PNGs as older jobs stored); PNG_COMPRESS_LEVEL trades encoder
+    speed (0-1) against size (9).
     """
-    
-    model_path = os.path.join(current_app.root_path, 'models', 'trained_cellpose')
-    
+    compress_level = current_app.config["PNG_COMPRESS_LEVEL"]
+    if current_app.config["MASK_PNG_MODE"] == "rgb":
+        return (
+            convert_to_png_bytes(to_class_rgb(masks), compress_level),
+            convert_to_png_bytes(to_instance_rgb(masks), compress_level),
+        )
+    return encode_class_png(masks, compress_level), encode_instance_png(masks, compress_level)
+
+
+def default_model_path() -> str:
+    return os.path.join(current_app.root_path, 'models', 'trained_cellpose')
+
+
+def load_cellpose_model(model_path=None, device="cpu", model_type=None, engine="torch",
+                        quantize=False, onnx_tile=224, onnx_dir=None):
+    """
+    Returns a Cellpose model from the process-wide model pool, loading the
+    weights only the first time a (model_path, device, model_type, engine)
+    is seen. With ``engine="onnx"`` the network runs on ONNX Runtime (see
+    ``services.onnx_engine``); ``quantize`` selects the int8 export.
+    """
+    model_path = model_path or default_model_path()
+
     if not os.path.exists(model_path):
         print(f"FATAL: Model file not found at {model_path}")
         raise FileNotFoundError(f"Model file not found: {model_path}")
-    
-    print(f"Loading Cellpose model from: {model_path}")
 
-    model = models.CellposeModel(pretrained_model=model_path, gpu=False)
-    
-    img = np.array(Image.open(io.BytesIO(image_bytes)))
-    
+    def _load():
+        print(f"Loading Cellpose model from: {model_path} (engine={engine})")
+        kwargs = {"pretrained_model": model_path, "gpu": device != "cpu"}
+        if model_type:
+            kwargs["model_type"] = model_type
+        model = models.CellposeModel(**kwargs)
+        if engine == "onnx":
+            attach_onnx_engine(model, model_path, quantize=quantize, tile=onnx_tile, export_dir=onnx_dir)
+        return model
+
+    engine_key = "onnx-int8" if engine == "onnx" and quantize else engine
+    return get_model_pool().get((model_path, device, model_type, engine_key), _load)
+
+
+def engine_kwargs_from_params(params: dict, engine: Optional[str] = None) -> dict:
+    """``load_cellpose_model`` keyword arguments for the job's inference engine."""
+    engine = params.get("engine") or engine or current_app.config["CELLPOSE_ENGINE"]
+    if engine not in ("torch", "onnx"):
+        raise ValueError(f"Unknown inference engine '{engine}'")
+    kwargs = {"engine": engine}
+    if engine == "onnx":
+        kwargs.update({
+            "quantize": bool(params.get("quantize", current_app.config["CELLPOSE_ONNX_QUANTIZE"])),
+            "onnx_tile": current_app.config["CELLPOSE_ONNX_TILE"],
+            "onnx_dir": current_app.config["CELLPOSE_ONNX_DIR"],
+        })
+    return kwargs
+
+
+def decode_image(image_bytes: bytes) -> np.ndarray:
+    return np.array(Image.open(io.BytesIO(image_bytes)))
+
+
+def eval_kwargs_from_params(params: dict) -> dict:
+    """Translate inference params into ``model.eval`` keyword arguments."""
+    diameter = params.get("diameter")
     diam = None if (diameter is None or diameter <= 0) else float(diameter)
-    
-    print(f"Running model.eval with channels={channels}, diameter={diam}")
-    out = model.eval(img, channels=channels, diameter=diam, progress=False)
-    
+    kwargs = {
+        "channels": params.get("channels") or [0, 0],
+        "diameter": diam,
+    }
+    for key in ("flow_threshold", "cellprob_threshold"):
+        if params.get(key) is not None:
+            kwargs[key] = float(params[key])
+    return kwargs
+
+
+def _extract_masks(out, shape, dtype=np.uint16) -> np.ndarray:
     if isinstance(out, (list, tuple)):
         masks = out[0]
     elif isinstance(out, dict):
-        masks = out.get("masks") or out.get("mask")
+        masks = out.get("masks")
+        if masks is None:
+            masks = out.get("mask")
     else:
         masks = out
 
     if masks is None:
-        masks = np.zeros(img.shape[:2], dtype=np.uint16)
-    else:
-        masks = masks.astype(np.uint16, copy=False)
+        return np.zeros(shape, dtype=dtype)
+    return np.asarray(masks).astype(dtype, copy=False)
+
+
+def segment_image(model, img: np.ndarray, eval_kwargs: dict, return_flows: bool = False):
+    """
+    Runs ``model.eval`` on one image and returns its uint16 label mask, or
+    ``(masks, flows)`` when ``return_flows`` is set.
+    """
+    print(f"Running model.eval with {eval_kwargs}")
+    with get_model_pool().eval_lock(model):
+        out = model.eval(img, progress=False, **eval_kwargs)
+    masks = _extract_masks(out, img.shape[:2])
+    if return_flows:
+        return masks, extract_flows(out)
+    return masks
+
+
+def segment_batch(model, imgs: List[np.ndarray], eval_kwargs: dict, batch_size: int, return_flows: bool = False) -> list:
+    """
+    Segments several images with as few ``model.eval`` calls as possible.
+
+    Images of the same shape are stacked along a leading axis so Cellpose
+    evaluates them as one stack of 2D planes and can fill its network
+    batches (``batch_size`` tiles) across images. Returns one label mask
+    (or ``(masks, flows)`` pair) per input image, in input order.
+    """
+    groups: Dict[tuple, List[int]] = {}
+    for i, img in enumerate(imgs):
+        groups.setdefault(img.shape, []).append(i)
+
+    masks: list = [None] * len(imgs)
+    for shape, indices in groups.items():
+        if len(indices) == 1:
+            i = indices[0]
+            masks[i] = segment_image(model, imgs[i], {**eval_kwargs, "batch_size": batch_size}, return_flows)
+            continue
+
+        stack = np.stack([imgs[i] for i in indices])
+        axes = {"z_axis": 0}
+        if stack.ndim == 4:
+            axes["channel_axis"] = 3
+        print(f"Running batched model.eval on {len(indices)} images of shape {shape}")
+        with get_model_pool().eval_lock(model):
+            out = model.eval(stack, batch_size=batch_size, progress=False, **axes, **eval_kwargs)
+        stacked = _extract_masks(out, (len(indices), *shape[:2]))
+        for j, i in enumerate(indices):
+            masks[i] = (stacked[j], extract_flows(out, j)) if return_flows else stacked[j]
+    return masks
+
+
+def resize_image(img: np.ndarray, size) -> np.ndarray:
+    """Bilinear resize of an image array to (height, width)."""
+    height, width = size
+    if img.shape[:2] == (height, width):
+        return img
+    if img.ndim == 2:
+        return np.array(Image.fromarray(img).resize((width, height), Image.BILINEAR))
+    channels = [
+        np.array(Image.fromarray(img[..., c]).resize((width, height), Image.BILINEAR))
+        for c in range(img.shape[2])
+    ]
+    return np.stack(channels, axis=-1)
+
+
+def downsample_image(img, scale: float) -> np.ndarray:
+    """
+    Shrinks an image by ``scale`` for preview runs. Strided slicing first
+    drops whole rows/columns (cheap on memory-mapped planes), then a bilinear
+    resize lands on the exact size.
+    """
+    height, width = img.shape[:2]
+    size = (max(1, round(height * scale)), max(1, round(width * scale)))
+    step = max(1, int(1 / scale))
+    return resize_image(np.asarray(img[::step, ::step]), size)
+
+
+def preview_refs(image_refs: list, max_files: int) -> list:
+    """Evenly spaced subset of a dataset's images, at most ``max_files`` of them."""
+    if max_files <= 0 or len(image_refs) <= max_files:
+        return image_refs
+    picks = np.linspace(0, len(image_refs) - 1, max_files).round().astype(int)
+    return [image_refs[i] for i in sorted(set(picks))]
+
+
+def resize_labels(masks: np.ndarray, size) -> np.ndarray:
+    """Nearest-neighbour resize of a label mask to (height, width)."""
+    height, width = size
+    if masks.shape[:2] == (height, width):
+        return masks
+    rows = (np.arange(height) * masks.shape[0] // height)[:, None]
+    cols = (np.arange(width) * masks.shape[1] // width)[None, :]
+    return masks[rows, cols]
+
+
+def run_cellpose_model(image_bytes, diameter, channels, model=None):
+    """
+    Runs a specific Cellpose model file on raw image bytes.
+    Returns (class_rgb_array, instance_rgb_array)
+    """
+    
+    if model is None:
+        model = load_cellpose_model()
+    
+    img = decode_image(image_bytes)
+    masks = segment_image(model, img, eval_kwargs_from_params({"diameter": diameter, "channels": channels}))
     
     print("Cellpose inference complete. Generating CVAT masks.")
     
@@ -98,15 +242,164 @@ def run_cellpose_model(image_bytes, diameter, channels):
     return class_rgb, instance_rgb
 
 
+def tiling_options(params: dict) -> dict:
+    """
+    Tiling settings of a job: ``params`` (tiled, tile_size, tile_overlap,
+    blank_threshold) over the CELLPOSE_TILE_* config. Resolved up front so
+    segmentation, which also runs in pool workers, needs no app context.
+    """
+    tiled = params.get("tiled")
+    return {
+        "tiled": None if tiled is None else bool(tiled),
+        "tile_size": int(params.get("tile_size") or current_app.config["CELLPOSE_TILE_SIZE"]),
+        "auto_pixels": int(current_app.config["CELLPOSE_TILE_AUTO_PIXELS"]),
+        "overlap": int(params.get("tile_overlap") or current_app.config["CELLPOSE_TILE_OVERLAP"]),
+        "blank_threshold": float(params.get("blank_threshold", current_app.config["CELLPOSE_TILE_BLANK_THRESHOLD"])),
+    }
+
+
+def needs_tiling(shape, tiling: dict) -> bool:
+    """Whether an image of ``shape`` should be segmented tile by tile."""
+    height, width = shape[:2]
+    if max(height, width) <= tiling["tile_size"]:
+        return False
+    if tiling["tiled"] is None:
+        return height * width > tiling["auto_pixels"]
+    return tiling["tiled"]
+
+
+def segment_volume(model, volume: np.ndarray, eval_kwargs: dict, anisotropy=None, stitch_threshold: float = 0.0) -> np.ndarray:
+    """
+    Segments a (Z, Y, X[, C]) stack into 3D labels. Runs Cellpose's 3D flows
+    by default; with ``stitch_threshold`` > 0 each slice is segmented in 2D
+    and labels overlapping by more than that IoU are joined across slices.
+    """
+    kwargs = {**eval_kwargs, "z_axis": 0}
+    if volume.ndim == 4:
+        kwargs["channel_axis"] = 3
+    if stitch_threshold > 0:
+        kwargs["stitch_threshold"] = stitch_threshold
+    else:
+        kwargs["do_3D"] = True
+        if anisotropy:
+            kwargs["anisotropy"] = float(anisotropy)
+    print(f"Running 3D model.eval on {volume.shape} with {kwargs}")
+    with get_model_pool().eval_lock(model):
+        out = model.eval(volume, progress=False, **kwargs)
+    # A whole stack can hold more than 65535 cells.
+    return _extract_masks(out, volume.shape[:3], dtype=np.uint32)
+
+
+def tiling_kwargs(tiling: dict) -> dict:
+    return {key: tiling[key] for key in ("tile_size", "overlap", "blank_threshold")}
+
+
+def segment_images(model, imgs: List[np.ndarray], eval_kwargs: dict, options: dict) -> list:
+    """
+    Segments a group of images according to the job ``options``
+    (execution_mode, batch_size, keep_flows, resize_to, tiling,
+    preview_scale). Returns a
+    ``(masks, flows)`` pair per image with masks at the source resolution.
+    Tiled images never keep flows.
+    """
+    segmented: list = [None] * len(imgs)
+
+    tiled = [i for i, img in enumerate(imgs) if options.get("tiling") and needs_tiling(img.shape, options["tiling"])]
+    for i in tiled:
+        img = imgs[i]
+        masks = segment_tiled(
+            lambda box: img[box[0]:box[1], box[2]:box[3]],
+            img.shape[:2],
+            lambda tile: segment_image(model, tile, eval_kwargs),
+            **tiling_kwargs(options["tiling"]),
+        )
+        segmented[i] = (masks, None)
+
+    whole = [i for i in range(len(imgs)) if segmented[i] is None]
+    if not whole:
+        return segmented
+
+    shapes = [imgs[i].shape[:2] for i in whole]
+    if options.get("preview_scale"):
+        group = [downsample_image(imgs[i], options["preview_scale"]) for i in whole]
+    else:
+        group = [np.asarray(imgs[i]) for i in whole]
+    if options.get("resize_to"):
+        group = [resize_image(img, options["resize_to"]) for img in group]
+
+    keep_flows = options.get("keep_flows", False)
+    if options.get("execution_mode") == "batched":
+        outputs = segment_batch(model, group, eval_kwargs, options["batch_size"], return_flows=keep_flows)
+    else:
+        outputs = [segment_image(model, img, eval_kwargs, return_flows=keep_flows) for img in group]
+
+    for i, output, shape in zip(whole, outputs, shapes):
+        masks, flows = output if keep_flows else (output, None)
+        segmented[i] = (resize_labels(masks, shape), flows)
+    return segmented
+
+
+def result_base_filename(file_ref: dict) -> str:
+    """Stem used for a result's artifacts; planes of a stack get a ``_p<index>`` suffix."""
+    base_filename = file_ref["filename"].rsplit(".", 1)[0]
+    if "plane" in file_ref:
+        base_filename = f"{base_filename}_p{file_ref['plane']:03d}"
+    return base_filename
+
+
+def _align_outputs(loaded: list, segmented: list) -> list:
+    """Spreads per-miss outputs back over a unit, leaving None for cached images."""
+    segmented = iter(segmented)
+    return [next(segmented) if "img" in item else None for item in loaded]
+
+
+class ParallelUnit:
+    """A unit whose segmentation is still running in the process pool."""
+
+    def __init__(self, future, loaded: list) -> None:
+        self.future = future
+        self.loaded = loaded
+
+
 class CellposeRunner(ModelRunner):
     """Concrete strategy for running Cellpose-based inference."""
 
+    parallel: Optional[ParallelSegmenter] = None
+    tiling: Optional[dict] = None
+    preview_scale: Optional[float] = None
+    volumetric: bool = False
+
     def run_inference_job(self, inference_id_str: str) -> None:
         """
         Execute a Cellpose inference job.
 
-        This mirrors the previous procedural implementation but is now
-        encapsulated as a strategy class.
+        ``params.execution_mode`` selects how images go through the network:
+        ``sequential`` evaluates one image at a time, ``batched`` groups up to
+        ``params.images_per_batch`` images (optionally resized to
+        ``params.resize_to`` = [height, width]) into a single evaluation.
+
+        With ``params.pipeline`` (default CELLPOSE_PIPELINE) reading/decoding
+        of upcoming images and encoding/writing of finished masks overlap
+        with the model; see ``services.pipeline.StagedPipeline``.
+
+        With ``params.workers`` > 1 (default CELLPOSE_WORKERS_PER_JOB) units
+        are segmented in a process pool instead, each worker pinned to
+        ``params.cores_per_worker`` cores.
+
+        Images larger than ``params.tile_size`` are split into overlapping
+        tiles (``params.tiled``, ``tile_overlap``, ``blank_threshold``) whose
+        labels are stitched back together; see ``services.tiling``.
+
+        With ``params.volumetric`` multi-page inputs are segmented as z-stacks
+        (``params.anisotropy``, or ``params.stitch_threshold`` for 2D slices
+        stitched into 3D); see ``_segment_volume_file``.
+
+        Incremental jobs only segment files their base inference has no
+        result for and keep the base results; see ``incremental_refs``.
+
+        Each unit's results are checkpointed to the job document as soon as
+        they are stored (``progress.processed`` / ``progress.total``); a
+        re-run of a failed or interrupted job skips checkpointed files.
         """
         inference_id = ObjectId(inference_id_str)
 
@@ -119,73 +412,491 @@ class CellposeRunner(ModelRunner):
         inference_doc = self.db.inferences.find_one({"_id": inference_id})
         dataset_doc = self.db.datasets.find_one({"_id": inference_doc["dataset_id"]})
 
-        diameter = "diameter"
-        channels = [0, 0]
+        params = inference_doc.get("params") or {}
 
-        results = []
-        for file_ref in dataset_doc["files"]:
-            if file_ref["type"] != "image":
-                continue
+        if params.get("mode") == "resegment":
+            results = self._run_resegment(inference_id, params)
+            self.update_inference_status(
+                inference_id=inference_id,
+                status="completed",
+                results=results,
+            )
+            print(f"Cellpose re-segmentation job {inference_id_str} finished processing.")
+            return
 
-            image_file = self.fs.get(file_ref["gridfs_id"])
+        self._configure(inference_id, inference_doc, params)
+        cache = self.cache
 
-            class_rgb_array, instance_rgb_array = run_cellpose_model(
-                image_file.read(),
-                diameter=diameter,
-                channels=channels,
+        image_refs = [f for f in dataset_doc["files"] if f["type"] == "image"]
+        if self.preview_scale:
+            total_images = len(image_refs)
+            image_refs = preview_refs(
+                image_refs, int(params.get("preview_max_files", current_app.config["PREVIEW_MAX_FILES"]))
             )
+        pending = self.start_progress(inference_doc, image_refs)
 
-            # 2. Convert both to PNG bytes
-            class_mask_bytes = convert_to_png_bytes(class_rgb_array)
-            instance_mask_bytes = convert_to_png_bytes(instance_rgb_array)
+        # A unit is the group of images that goes through one model call.
+        if self.execution_mode == "batched":
+            images_per_batch = int(params.get("images_per_batch", current_app.config["CELLPOSE_IMAGES_PER_BATCH"]))
+            units = [pending[i:i + images_per_batch] for i in range(0, len(pending), images_per_batch)]
+        else:
+            units = [[file_ref] for file_ref in pending]
 
-            # 3. Save both to GridFS
-            base_filename = file_ref["filename"].rsplit(".", 1)[0]
-            common_metadata = {
-                "source_image_gridfs_id": str(file_ref["gridfs_id"]),
-                "inference_id": str(inference_id),
-            }
+        try:
+            if self.volumetric:
+                for file_ref in pending:
+                    self.checkpoint(inference_id, self._segment_volume_file(file_ref, params))
+            elif self.parallel:
+                # Keep every worker busy: units in flight wait in the store stage.
+                in_flight = 2 * self.parallel.workers
+                pipeline = StagedPipeline(
+                    self._load_unit,
+                    self._segment_unit,
+                    self._store_checkpointed,
+                    prefetch=in_flight,
+                    load_workers=current_app.config["CELLPOSE_IO_WORKERS"],
+                    store_workers=in_flight,
+                    max_pending_stores=in_flight,
+                )
+                pipeline.run(units)
+            elif params.get("pipeline", current_app.config["CELLPOSE_PIPELINE"]):
+                pipeline = StagedPipeline(
+                    self._load_unit,
+                    self._segment_unit,
+                    self._store_checkpointed,
+                    prefetch=current_app.config["CELLPOSE_PREFETCH"],
+                    load_workers=current_app.config["CELLPOSE_IO_WORKERS"],
+                    store_workers=current_app.config["CELLPOSE_IO_WORKERS"],
+                    max_pending_stores=current_app.config["CELLPOSE_MAX_PENDING_WRITES"],
+                )
+                pipeline.run(units)
+            else:
+                for unit in units:
+                    loaded = self._load_unit(unit)
+                    self._store_checkpointed(loaded, self._segment_unit(loaded))
+        finally:
+            if self.parallel:
+                self.parallel.shutdown()
 
-            class_mask_gridfs_id = save_bytes_to_gridfs(
-                class_mask_bytes,
-                filename=f"class_{base_filename}.png",
-                metadata={**common_metadata, "type": "mask_class"},
+        if self.preview_scale:
+            self.db.inferences.update_one(
+                {"_id": inference_id},
+                {"$set": {"preview": {
+                    "scale": self.preview_scale,
+                    "images": len(image_refs),
+                    "total_images": total_images,
+                }}},
             )
 
-            instance_mask_gridfs_id = save_bytes_to_gridfs(
-                instance_mask_bytes,
-                filename=f"instance_{base_filename}.png",
-                metadata={**common_metadata, "type": "mask_instance"},
+        if cache:
+            cache_stats = cache.record_stats()
+            self.db.inferences.update_one({"_id": inference_id}, {"$set": {"cache_stats": cache_stats}})
+            print(f"[RESULT CACHE] hits={cache_stats['hits']} misses={cache_stats['misses']}")
+
+        # Results are already checkpointed; mark the job completed
+        self.complete_checkpointed(inference_id, image_refs)
+        print(f"Cellpose inference job {inference_id_str} finished processing.")
+        pool_stats = self.model_pool.stats()
+        print(f"[MODEL POOL] hits={pool_stats['hits']} misses={pool_stats['misses']}")
+
+    def prepare_member(self, inference_id: ObjectId, member: dict, params: dict) -> None:
+        if params.get("volumetric") or params.get("preview") or params.get("mode") == "resegment":
+            raise ValueError("Volumetric, preview and re-segment jobs cannot be part of an ensemble")
+        member_doc = {"params": params, "model_id": member["model_id"], "engine": member.get("engine")}
+        # Members segment the shared decoded image in this process.
+        self._configure(inference_id, member_doc, params, workers=1)
+
+    def segment_items(self, items: list):
+        loaded = []
+        for item in items:
+            cached = self.cache.lookup(item["digest"]) if self.cache else None
+            if cached:
+                loaded.append({
+                    "file_ref": item["file_ref"],
+                    "digest": item["digest"],
+                    "result": self._reuse_result(item["file_ref"], cached),
+                })
+            else:
+                loaded.append(item)
+        return loaded, self._segment_unit(loaded)
+
+    def store_items(self, segmented) -> list:
+        loaded, outputs = segmented
+        return self._store_unit(loaded, outputs)
+
+    def _configure(self, inference_id: ObjectId, inference_doc: dict, params: dict, workers: Optional[int] = None) -> None:
+        """Sets up the model, cache and execution options of a job from its params."""
+        eval_kwargs = eval_kwargs_from_params(params)
+        execution_mode = params.get("execution_mode", current_app.config["CELLPOSE_EXECUTION_MODE"])
+        keep_flows = bool(params.get("keep_flows", current_app.config["CELLPOSE_KEEP_FLOWS"]))
+        model_path = default_model_path()
+        self.inference_id = inference_id
+        self.eval_kwargs = eval_kwargs
+        self.execution_mode = execution_mode
+        self.batch_size = int(params.get("batch_size", current_app.config["CELLPOSE_BATCH_SIZE"]))
+        self.resize_to = params.get("resize_to")
+        # 3D flows are not stored; volumes can't be re-segmented.
+        self.volumetric = bool(params.get("volumetric"))
+        if self.volumetric:
+            keep_flows = False
+        # Preview: a downsampled run on a subset of the dataset, labels upscaled back.
+        self.preview_scale = None
+        if params.get("preview") and not self.volumetric:
+            self.preview_scale = float(params.get("preview_scale", current_app.config["PREVIEW_SCALE"]))
+            if not 0 < self.preview_scale <= 1:
+                raise ValueError(f"preview_scale must be in (0, 1], got {self.preview_scale}")
+            keep_flows = False
+        # Flows computed at a different resolution can't be re-thresholded
+        # against the source image, so resized batches don't keep them.
+        self.keep_flows = keep_flows and not self.resize_to
+        engine_kwargs = engine_kwargs_from_params(params, inference_doc.get("engine"))
+        self.cache = self._result_cache(inference_doc, model_path, keep_flows, engine_kwargs)
+        # Tiling options; tiles are used for images above CELLPOSE_TILE_AUTO_PIXELS
+        # unless params.tiled forces it on or off.
+        self.tiling = None if self.preview_scale or self.volumetric else tiling_options(params)
+
+        if workers is None:
+            workers = int(params.get("workers", current_app.config["CELLPOSE_WORKERS_PER_JOB"]))
+        if self.volumetric:
+            workers = 1
+        cores_per_worker = int(params.get("cores_per_worker", current_app.config["CELLPOSE_CORES_PER_WORKER"]))
+        if workers > 1 and engine_kwargs["engine"] == "onnx":
+            # Export once up front instead of racing the workers to it.
+            load_cellpose_model(model_path, **engine_kwargs)
+        self.parallel = ParallelSegmenter(model_path, workers, cores_per_worker, engine_kwargs) if workers > 1 else None
+        # Parallel workers load their own copy of the model.
+        self.model = None if self.parallel else load_cellpose_model(model_path, **engine_kwargs)
+        if self.preview_scale:
+            # The diameter applies to the downsampled images; left unset, Cellpose
+            # would assume the model's diam_labels at that smaller resolution.
+            diameter = eval_kwargs.get("diameter") or float(
+                (self.model or load_cellpose_model(model_path, **engine_kwargs)).diam_labels
             )
+            eval_kwargs["diameter"] = diameter * self.preview_scale
+
+    def _load_unit(self, file_refs: list) -> list:
+        """
+        Opens a unit's images, answering from the result cache where possible.
+        Multi-page stacks contribute one item per plane, each tagged with its
+        plane index; planes are read lazily by the segment stage.
+        """
+        loaded = []
+        for file_ref in file_refs:
+            loaded.extend(self._source_items(file_ref, self._open_source(file_ref)))
+        return loaded
+
+    def _open_source(self, file_ref: dict):
+        return open_image(
+            self.fs,
+            file_ref["gridfs_id"],
+            spool_min_bytes=current_app.config["IMAGE_SPOOL_MIN_BYTES"],
+            spool_dir=current_app.config["IMAGE_SPOOL_DIR"],
+        )
+
+    def _source_items(self, file_ref: dict, source) -> list:
+        items = []
+        for plane in range(source.planes):
+            plane_ref = file_ref if source.planes == 1 else {**file_ref, "plane": plane}
+            digest = source.digest if source.planes == 1 else f"{source.digest}:{plane}"
+            cached = self.cache.lookup(digest) if self.cache else None
+            if cached:
+                items.append({"file_ref": plane_ref, "digest": digest, "source": source,
+                              "result": self._reuse_result(plane_ref, cached)})
+            else:
+                items.append({"file_ref": plane_ref, "digest": digest, "source": source,
+                              "img": PlaneView(source, plane)})
+        return items
+
+    def _segment_volume_file(self, file_ref: dict, params: dict) -> list:
+        """
+        Segments one input of a volumetric job. Multi-page files are read as a
+        (Z, Y, X[, C]) stack and segmented in 3D; single images take the 2D path.
+        """
+        with self._open_source(file_ref) as source:
+            if source.planes == 1:
+                loaded = self._source_items(file_ref, source)
+                return self._store_unit(loaded, self._segment_unit(loaded))
 
-            # 4. Store result record with a generic artifacts list.
-            #    class_mask_id / instance_mask_id are kept for backwards
-            #    compatibility with existing frontend expectations.
-            results.append(
+            digest = f"{source.digest}:3d"
+            cached = self.cache.lookup(digest) if self.cache else None
+            if cached:
+                return [self._reuse_result(file_ref, cached)]
+
+            volume = np.stack([np.asarray(source.read_plane(z)) for z in range(source.planes)])
+        masks = segment_volume(
+            self.model,
+            volume,
+            self.eval_kwargs,
+            anisotropy=params.get("anisotropy"),
+            stitch_threshold=float(params.get("stitch_threshold") or 0.0),
+        )
+        result = self._store_volume(self.inference_id, file_ref, volume, masks)
+        if self.cache:
+            self.cache.store(digest, result)
+        return [result]
+
+    def _segment_unit(self, loaded: list):
+        """
+        Runs the model on a unit's uncached images; returns (masks, flows) per
+        image, None if cached. In parallel mode this returns a future of that
+        list, resolved by ``_store_unit``.
+        """
+        misses = [item for item in loaded if "img" in item]
+        if not misses:
+            return [None] * len(loaded)
+
+        imgs = [item["img"] for item in misses]
+        options = {
+            "execution_mode": self.execution_mode,
+            "batch_size": self.batch_size,
+            "keep_flows": self.keep_flows,
+            "resize_to": self.resize_to,
+            "tiling": self.tiling,
+            "preview_scale": self.preview_scale,
+        }
+        if self.parallel:
+            if self.tiling and any(needs_tiling(img.shape, self.tiling) for img in imgs):
+                # Large images are split across the pool tile by tile instead.
+                return _align_outputs(loaded, [self._segment_parallel_tiled(img, options) for img in imgs])
+            future = self.parallel.submit([np.asarray(img) for img in imgs], self.eval_kwargs, options)
+            return ParallelUnit(future, loaded)
+
+        return _align_outputs(loaded, segment_images(self.model, imgs, self.eval_kwargs, options))
+
+    def _segment_parallel_tiled(self, img: np.ndarray, options: dict):
+        if not needs_tiling(img.shape, self.tiling):
+            return self.parallel.submit([np.asarray(img)], self.eval_kwargs, options).result()[0]
+        masks = segment_tiled(
+            lambda box: img[box[0]:box[1], box[2]:box[3]],
+            img.shape[:2],
+            lambda tile: self.parallel.submit_tile(tile, self.eval_kwargs),
+            max_in_flight=2 * self.parallel.workers,
+            **tiling_kwargs(self.tiling),
+        )
+        return masks, None
+
+    def _store_unit(self, loaded: list, outputs) -> list:
+        """Encodes and saves a unit's new masks; returns one result record per image."""
+        if isinstance(outputs, ParallelUnit):
+            outputs = _align_outputs(loaded, outputs.future.result())
+        results = []
+        for item, output in zip(loaded, outputs):
+            if output is None:
+                results.append(item["result"])
+                continue
+            masks, flows = output
+            result = self._store_result(self.inference_id, item["file_ref"], masks, flows)
+            if self.cache:
+                self.cache.store(item["digest"], result)
+            results.append(result)
+        if self.preview_scale:
+            for result in results:
+                result["preview"] = True
+        return results
+
+    def _store_checkpointed(self, loaded: list, outputs) -> list:
+        try:
+            results = self._store_unit(loaded, outputs)
+            self.checkpoint(self.inference_id, results)
+        finally:
+            close_sources(loaded)
+        return results
+
+    def _result_cache(self, inference_doc: dict, model_path: str, keep_flows: bool,
+                      engine_kwargs: dict) -> Optional[ResultCache]:
+        """Result cache for this job, or None when caching is disabled."""
+        params = inference_doc.get("params") or {}
+        if not params.get("use_cache", current_app.config["RESULT_CACHE_ENABLED"]):
+            return None
+
+        # Storage layout is part of the key so a hit has the artifacts this job would write.
+        params_key = normalize_params({
+            **params,
+            "keep_flows": keep_flows,
+            "mask_storage": current_app.config["MASK_STORAGE"],
+            # ONNX / int8 outputs differ slightly from the torch ones.
+            "engine": engine_kwargs["engine"],
+            "quantize": engine_kwargs.get("quantize", False),
+        })
+        cache = ResultCache(
+            self.db,
+            self.fs,
+            inference_doc.get("model_id", "cellpose_model"),
+            weights_version(model_path),
+            params_key,
+        )
+        stale = cache.invalidate_stale()
+        if stale:
+            print(f"[RESULT CACHE] Dropped {stale} entries from older model weights")
+        return cache
+
+    @staticmethod
+    def _reuse_result(file_ref: dict, cached: dict) -> dict:
+        return {
+            "source_filename": file_ref["filename"],
+            "source_image_gridfs_id": str(file_ref["gridfs_id"]),
+            **cached,
+            "cached": True,
+        }
+
+    def _run_resegment(self, inference_id: ObjectId, params: dict) -> list:
+        """
+        Rebuilds masks from the flows kept by ``params.source_inference_id``
+        with this job's thresholds, skipping the network entirely. The new
+        results reference the same flows artifact, so they can be
+        re-segmented again.
+        """
+        source_doc = self.db.inferences.find_one({"_id": ObjectId(params["source_inference_id"])})
+        if not source_doc:
+            raise ValueError("Source inference for re-segmentation not found")
+
+        results = []
+        for source_result in source_doc.get("results", []):
+            flows_artifact = find_artifact(source_result, "flows")
+            if not flows_artifact:
+                print(f"Skipping {source_result.get('source_filename')}: no stored flows")
+                continue
+
+            flows = decode_flows(self.fs.get(ObjectId(flows_artifact["gridfs_id"])).read())
+            masks = masks_from_flows(flows, params)
+
+            file_ref = {
+                "gridfs_id": source_result["source_image_gridfs_id"],
+                "filename": source_result["source_filename"],
+            }
+            if "plane" in source_result:
+                file_ref["plane"] = source_result["plane"]
+            result = self._store_result(inference_id, file_ref, masks)
+            result["artifacts"].append(dict(flows_artifact))
+            results.append(result)
+
+        if not results:
+            raise ValueError("Source inference has no stored flows to re-segment")
+        return results
+
+    def _store_volume(self, inference_id: ObjectId, file_ref: dict, volume: np.ndarray, labels: np.ndarray) -> dict:
+        """Saves a z-stack and its 3D labels as slice-addressable volume artifacts."""
+        base_filename = result_base_filename(file_ref)
+        common_metadata = {
+            "source_image_gridfs_id": str(file_ref["gridfs_id"]),
+            "inference_id": str(inference_id),
+        }
+        level = current_app.config["VOLUME_COMPRESS_LEVEL"]
+        label_volume_id = save_volume(
+            self.fs, labels, f"labelvol_{base_filename}.vol", {**common_metadata, "type": "label_volume"}, level
+        )
+        image_volume_id = save_volume(
+            self.fs, volume, f"imagevol_{base_filename}.vol", {**common_metadata, "type": "image_volume"}, level
+        )
+        return {
+            "source_filename": file_ref["filename"],
+            "source_image_gridfs_id": str(file_ref["gridfs_id"]),
+            "volume": {"shape": list(labels.shape), "cells": int(labels.max())},
+            "label_volume_id": str(label_volume_id),
+            "artifacts": [
                 {
-                    "source_filename": file_ref["filename"],
+                    "kind": "label_volume",
+                    "gridfs_id": str(label_volume_id),
+                    "filename": f"{base_filename}_labels.tif",
+                },
+                {
+                    "kind": "image_volume",
+                    "gridfs_id": str(image_volume_id),
+                    "filename": f"{base_filename}_image.tif",
+                },
+            ],
+        }
+
+    def _store_result(self, inference_id: ObjectId, file_ref: dict, masks: np.ndarray, flows=None) -> dict:
+        """Encode and save the masks (and optionally flows) of one image; returns its result record."""
+        result = self._store_masks(inference_id, file_ref, masks)
+        if flows is not None:
+            base_filename = result_base_filename(file_ref)
+            flows_gridfs_id = save_bytes_to_gridfs(
+                encode_flows(flows),
+                filename=f"flows_{base_filename}.npz",
+                metadata={
                     "source_image_gridfs_id": str(file_ref["gridfs_id"]),
-                    "class_mask_id": str(class_mask_gridfs_id),
-                    "instance_mask_id": str(instance_mask_gridfs_id),
-                    "artifacts": [
-                        {
-                            "kind": "class_mask",
-                            "gridfs_id": str(class_mask_gridfs_id),
-                            "filename": f"{base_filename}_class_mask.png",
-                        },
-                        {
-                            "kind": "instance_mask",
-                            "gridfs_id": str(instance_mask_gridfs_id),
-                            "filename": f"{base_filename}_instance_mask.png",
-                        },
-                    ],
+                    "inference_id": str(inference_id),
+                    "type": "flows",
+                },
+            )
+            result["artifacts"].append(
+                {
+                    "kind": "flows",
+                    "gridfs_id": str(flows_gridfs_id),
+                    "filename": f"{base_filename}_flows.npz",
                 }
             )
+        return result
+
+    def _store_masks(self, inference_id: ObjectId, file_ref: dict, masks: np.ndarray) -> dict:
+        """Encode and save the masks of one image; returns its result record."""
+        base_filename = result_base_filename(file_ref)
+        common_metadata = {
+            "source_image_gridfs_id": str(file_ref["gridfs_id"]),
+            "inference_id": str(inference_id),
+        }
+        result = {
+            "source_filename": file_ref["filename"],
+            "source_image_gridfs_id": str(file_ref["gridfs_id"]),
+        }
+        if "plane" in file_ref:
+            result["plane"] = file_ref["plane"]
 
-        # Mark job as completed with results
-        self.update_inference_status(
-            inference_id=inference_id,
-            status="completed",
-            results=results,
+        if current_app.config["MASK_STORAGE"] == "labels":
+            # Only the raw labels are stored; class / instance PNGs are
+            # rendered on demand by services.mask_render.
+            # Tiled results carry 32-bit labels and are stored as TIFF.
+            label_bytes, extension = encode_label_mask(masks, current_app.config["PNG_COMPRESS_LEVEL"])
+            label_mask_gridfs_id = save_bytes_to_gridfs(
+                label_bytes,
+                filename=f"label_{base_filename}.{extension}",
+                metadata={**common_metadata, "type": "mask_label"},
+            )
+            result["label_mask_id"] = str(label_mask_gridfs_id)
+            result["artifacts"] = [
+                {
+                    "kind": "label_mask",
+                    "gridfs_id": str(label_mask_gridfs_id),
+                    "filename": f"{base_filename}_label_mask.{extension}",
+                },
+            ]
+            return result
+
+        # 1-2. Render class / instance views of the label mask as PNG bytes
+        class_mask_bytes, instance_mask_bytes = encode_mask_pngs(masks)
+
+        # 3. Save both to GridFS
+        class_mask_gridfs_id = save_bytes_to_gridfs(
+            class_mask_bytes,
+            filename=f"class_{base_filename}.png",
+            metadata={**common_metadata, "type": "mask_class"},
         )
-        print(f"Cellpose inference job {inference_id_str} finished processing.")
\ No newline at end of file
+
+        instance_mask_gridfs_id = save_bytes_to_gridfs(
+            instance_mask_bytes,
+            filename=f"instance_{base_filename}.png",
+            metadata={**common_metadata, "type": "mask_instance"},
+        )
+
+        # 4. Store result record with a generic artifacts list.
+        #    class_mask_id / instance_mask_id are kept for backwards
+        #    compatibility with existing frontend expectations.
+        result.update({
+            "class_mask_id": str(class_mask_gridfs_id),
+            "instance_mask_id": str(instance_mask_gridfs_id),
+            "artifacts": [
+                {
+                    "kind": "class_mask",
+                    "gridfs_id": str(class_mask_gridfs_id),
+                    "filename": f"{base_filename}_class_mask.png",
+                },
+                {
+                    "kind": "instance_mask",
+                    "gridfs_id": str(instance_mask_gridfs_id),
+                    "filename": f"{base_filename}_instance_mask.png",
+                },
+            ],
+        })
+        return result
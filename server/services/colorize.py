@@ -0,0 +1,114 @@
+import io
+from typing import Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+BG_RGB       = (0, 0, 0)
+NUCLEUS_RGB = (138, 17, 157) # class color
+
+def voc_colormap(N=256):
+    """Standard VOC colormap (unique colors for instances)."""
+    cmap = np.zeros((N,3), dtype=np.uint8)
+    for i in range(N):
+        r = g = b = 0
+        cid = i
+        for j in range(8):
+            r |= ((cid & 1) << (7-j))
+            g |= (((cid >> 1) & 1) << (7-j))
+            b |= (((cid >> 2) & 1) << (7-j))
+            cid >>= 3
+        cmap[i] = [r, g, b]
+    return cmap
+
+VOC_CMAP = voc_colormap(256)
+
+# Lookup tables indexed directly by label value. Instance label k maps to
+# VOC color (k % 255) + 1 so no cell is ever drawn black.
+CLASS_LUT = np.array([BG_RGB, NUCLEUS_RGB], dtype=np.uint8)
+INSTANCE_LUT = VOC_CMAP[np.arange(2 ** 16) % 255 + 1]
+INSTANCE_LUT[0] = BG_RGB
+
+# 256-entry palettes for "P" mode PNGs. Palette index == class / instance id,
+# which is what the PASCAL VOC importer expects for palette masks.
+CLASS_PALETTE = np.zeros((256, 3), dtype=np.uint8)
+CLASS_PALETTE[:len(CLASS_LUT)] = CLASS_LUT
+INSTANCE_PALETTE = VOC_CMAP
+
+
+def instance_palette_indices(mask_int: np.ndarray) -> np.ndarray:
+    """Per-pixel VOC palette index of each instance label (0 for background)."""
+    if mask_int.dtype.itemsize <= 2 and mask_int.dtype.kind == "u":
+        return np.where(mask_int > 0, mask_int % 255 + 1, 0).astype(np.uint8)
+    labels = mask_int.astype(np.int64, copy=False)
+    return np.where(labels > 0, labels % 255 + 1, 0).astype(np.uint8)
+
+
+def to_class_rgb(mask_int: np.ndarray) -> np.ndarray:
+    """Two-color class mask: BG black, nucleus purple."""
+    return CLASS_LUT[(mask_int > 0).view(np.uint8)]
+
+
+def to_instance_rgb(mask_int: np.ndarray) -> np.ndarray:
+    """VOC-colored instance mask, one table lookup per pixel."""
+    if mask_int.dtype == np.uint16 or mask_int.dtype == np.uint8:
+        return INSTANCE_LUT[mask_int]
+    # VOC_CMAP[0] is black, so background index 0 needs no special case.
+    return VOC_CMAP[instance_palette_indices(mask_int)]
+
+
+def display_range(image: np.ndarray) -> Tuple[float, float]:
+    """1st / 99th percentile intensities that ``to_display_rgb`` maps to 0 / 255."""
+    img = np.asarray(image)
+    if img.ndim == 3 and img.shape[2] > 3:
+        img = img[..., :3]
+    lo, hi = np.percentile(img.astype(np.float32), (1, 99))
+    return float(lo), float(hi)
+
+
+def to_display_rgb(image: np.ndarray, value_range: Optional[Tuple[float, float]] = None) -> np.ndarray:
+    """
+    Scales a grayscale / multi-channel image of any dtype to uint8 RGB.
+    ``value_range`` (see ``display_range``) lets regions of one image share
+    the scaling of the whole.
+    """
+    img = np.asarray(image)
+    if img.ndim == 3 and img.shape[2] > 3:
+        img = img[..., :3]
+    if img.dtype != np.uint8:
+        lo, hi = value_range or display_range(img)
+        img = img.astype(np.float32)
+        img = np.clip((img - lo) / max(hi - lo, 1e-6) * 255, 0, 255).astype(np.uint8)
+    if img.ndim == 2:
+        img = np.repeat(img[..., None], 3, axis=2)
+    elif img.shape[2] == 2:
+        img = np.concatenate([img, np.zeros_like(img[..., :1])], axis=2)
+    return img
+
+
+def to_overlay_rgb(image: np.ndarray, mask_int: np.ndarray, alpha: float = 0.5, view: str = "instance") -> np.ndarray:
+    """Blends the class or instance rendering of ``mask_int`` over ``image``."""
+    base = to_display_rgb(image)
+    colors = to_instance_rgb(mask_int) if view == "instance" else to_class_rgb(mask_int)
+    blended = base.astype(np.float32)
+    blended += alpha * (colors.astype(np.float32) - blended) * (mask_int > 0)[..., None]
+    return blended.astype(np.uint8)
+
+
+def encode_palette_png(indices: np.ndarray, palette: np.ndarray, compress_level: int = 6) -> bytes:
+    """Encodes a uint8 index array as a palette-mode ("P") PNG."""
+    img = Image.fromarray(indices.astype(np.uint8, copy=False), mode="L")
+    img.putpalette(palette.tobytes())
+    bytes_io = io.BytesIO()
+    img.save(bytes_io, format="PNG", compress_level=compress_level)
+    return bytes_io.getvalue()
+
+
+def encode_class_png(mask_int: np.ndarray, compress_level: int = 6) -> bytes:
+    """Class mask as a palette PNG; decodes to the same RGB as ``to_class_rgb``."""
+    return encode_palette_png((mask_int > 0).view(np.uint8), CLASS_PALETTE, compress_level)
+
+
+def encode_instance_png(mask_int: np.ndarray, compress_level: int = 6) -> bytes:
+    """Instance mask as a palette PNG; decodes to the same RGB as ``to_instance_rgb``."""
+    return encode_palette_png(instance_palette_indices(mask_int), INSTANCE_PALETTE, compress_level)
@@ -1,5 +1,6 @@
 
 from ..cvat_push_base import CvatBase
+from services.mask_render import find_artifact, get_rendered_mask
 import io
 import zipfile
 from bson import ObjectId
@@ -55,15 +56,24 @@ class CellposeModel(CvatBase):
                 image_id = filename.split('.')[0]
                 ids_list.append(image_id)
                 
+                # Jobs that only stored raw labels get their masks rendered here
+                label_artifact = find_artifact(data, "label_mask")
+                
                 # Load class mask
                 if data.get("class_mask_id"):
                     class_mask = self.fs.get(ObjectId(data["class_mask_id"]))
                     zf.writestr(f"SegmentationClass/{image_id}.png", class_mask.read())
+                elif label_artifact:
+                    class_mask = get_rendered_mask(self.fs, label_artifact["gridfs_id"], "class")
+                    zf.writestr(f"SegmentationClass/{image_id}.png", class_mask.read())
                 
                 # Load instance mask
                 if data.get("instance_mask_id"):
                     instance_mask = self.fs.get(ObjectId(data["instance_mask_id"]))
                     zf.writestr(f"SegmentationObject/{image_id}.png", instance_mask.read())
+                elif label_artifact:
+                    instance_mask = get_rendered_mask(self.fs, label_artifact["gridfs_id"], "instance")
+                    zf.writestr(f"SegmentationObject/{image_id}.png", instance_mask.read())
             
             zf.writestr("ImageSets/Segmentation/default.txt", "\n".join(ids_list))
             
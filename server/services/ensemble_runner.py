@@ -0,0 +1,151 @@
+from typing import Any, Dict, List
+
+from bson.objectid import ObjectId
+from flask import current_app
+
+from services.image_reader import PlaneView, close_sources, open_image
+from services.model_runner_base import ModelRunner
+from services.pipeline import StagedPipeline
+
+
+# Result keys that describe the source image rather than one model's output.
+SOURCE_KEYS = ("source_filename", "source_image_gridfs_id", "plane")
+# Top-level mask ids copied from the first member so single-model viewers keep working.
+PRIMARY_KEYS = ("class_mask_id", "instance_mask_id", "label_mask_id")
+
+
+def tag_artifacts(model_id: str, result: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """A member's artifacts tagged with its model id and filed under a per-model folder."""
+    return [
+        {**artifact, "model_id": model_id, "filename": f"{model_id}/{artifact['filename']}"}
+        for artifact in result.get("artifacts", [])
+    ]
+
+
+def merge_member_results(file_ref: Dict[str, Any], member_results: List[tuple]) -> Dict[str, Any]:
+    """
+    One result record per image: every member's artifacts in the shared
+    ``artifacts`` list plus its other fields under ``models.<model_id>``.
+    """
+    merged: Dict[str, Any] = {
+        "source_filename": file_ref["filename"],
+        "source_image_gridfs_id": str(file_ref["gridfs_id"]),
+        "models": {},
+        "artifacts": [],
+    }
+    if "plane" in file_ref:
+        merged["plane"] = file_ref["plane"]
+
+    for model_id, result in member_results:
+        merged["models"][model_id] = {
+            k: v for k, v in result.items() if k not in SOURCE_KEYS and k != "artifacts"
+        }
+        merged["artifacts"].extend(tag_artifacts(model_id, result))
+
+    primary = member_results[0][1]
+    for key in PRIMARY_KEYS:
+        if key in primary:
+            merged[key] = primary[key]
+    return merged
+
+
+class EnsembleRunner(ModelRunner):
+    """
+    Runs several models over one dataset in a single job.
+
+    Each source image is read from GridFS and opened once; the same lazy
+    planes are handed to every member runner (``prepare_member`` /
+    ``segment_items`` / ``store_items``), so adding a model costs its
+    inference only.
+    """
+
+    def run_inference_job(self, inference_id_str: str) -> None:
+        # Imported here: the registry module imports this one.
+        from services.inference_manager import RUNNER_REGISTRY
+
+        inference_id = ObjectId(inference_id_str)
+        self.db.inferences.update_one({"_id": inference_id}, {"$set": {"status": "running"}})
+
+        inference_doc = self.db.inferences.find_one({"_id": inference_id})
+        dataset_doc = self.db.datasets.find_one({"_id": inference_doc["dataset_id"]})
+        params = inference_doc.get("params") or {}
+
+        members = inference_doc.get("members") or []
+        if not members:
+            raise ValueError("Ensemble job has no members")
+
+        self.inference_id = inference_id
+        self.members = []
+        for member in members:
+            runner_class = RUNNER_REGISTRY.get(member["runner_name"])
+            if runner_class is None or runner_class is EnsembleRunner:
+                raise NotImplementedError(f"Runner '{member['runner_name']}' cannot be an ensemble member")
+            runner = runner_class()
+            runner.prepare_member(inference_id, member, {**params, **(member.get("params") or {})})
+            self.members.append((member["model_id"], runner))
+
+        image_refs = [f for f in dataset_doc["files"] if f["type"] == "image"]
+        pending = self.start_progress(inference_doc, image_refs)
+        pipeline = StagedPipeline(
+            self._load_file,
+            self._segment_file,
+            self._store_file,
+            prefetch=current_app.config["CELLPOSE_PREFETCH"],
+            load_workers=current_app.config["CELLPOSE_IO_WORKERS"],
+            store_workers=current_app.config["CELLPOSE_IO_WORKERS"],
+            max_pending_stores=current_app.config["CELLPOSE_MAX_PENDING_WRITES"],
+        )
+        pipeline.run(pending)
+
+        cache_stats = {
+            model_id: runner.cache.record_stats()
+            for model_id, runner in self.members
+            if getattr(runner, "cache", None)
+        }
+        if cache_stats:
+            self.db.inferences.update_one({"_id": inference_id}, {"$set": {"cache_stats": cache_stats}})
+
+        self.complete_checkpointed(inference_id, image_refs)
+        print(f"Ensemble inference job {inference_id_str} finished processing ({len(self.members)} models).")
+
+    def _load_file(self, file_ref: dict) -> list:
+        """
+        Opens one input once; multi-page stacks give one item per plane. Planes
+        are read lazily when a member segments them, as in the single-model path.
+        """
+        source = open_image(
+            self.fs,
+            file_ref["gridfs_id"],
+            spool_min_bytes=current_app.config["IMAGE_SPOOL_MIN_BYTES"],
+            spool_dir=current_app.config["IMAGE_SPOOL_DIR"],
+        )
+        items = []
+        for plane in range(source.planes):
+            items.append({
+                "file_ref": file_ref if source.planes == 1 else {**file_ref, "plane": plane},
+                "digest": source.digest if source.planes == 1 else f"{source.digest}:{plane}",
+                "source": source,
+                "img": PlaneView(source, plane),
+            })
+        return items
+
+    def _segment_file(self, items: list) -> list:
+        return [runner.segment_items(items) for _, runner in self.members]
+
+    def _store_file(self, items: list, segmented: list) -> list:
+        try:
+            per_member = [
+                runner.store_items(member_segmented)
+                for (_, runner), member_segmented in zip(self.members, segmented)
+            ]
+        finally:
+            close_sources(items)
+        results = [
+            merge_member_results(
+                item["file_ref"],
+                [(model_id, member_results[i]) for (model_id, _), member_results in zip(self.members, per_member)],
+            )
+            for i, item in enumerate(items)
+        ]
+        self.checkpoint(self.inference_id, results)
+        return results
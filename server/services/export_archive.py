@@ -0,0 +1,230 @@
+import datetime
+import json
+import os
+from typing import Any, Dict, Iterator
+
+from bson.objectid import ObjectId
+from flask import current_app
+
+from services.mask_render import get_rendered_mask
+from services.volume_store import VOLUME_KINDS, volume_tiff
+from services.zip_stream import ZipEntry, gridfs_chunks, stream_zip
+
+
+def _gridfs_entry(zip_path: str, grid_out) -> ZipEntry:
+    return zip_path, grid_out.length, lambda: gridfs_chunks(grid_out)
+
+
+def _open_gridfs(fs, file_id, what: str):
+    try:
+        return fs.get(ObjectId(file_id))
+    except Exception as e:
+        current_app.logger.error(f"Failed to read {what} {file_id}: {e}")
+        return None
+
+
+def zip_entries(fs, inference: Dict[str, Any], include_flows: bool = False) -> Iterator[ZipEntry]:
+    """
+    Archive layout: a folder for each dataset file, containing the image
+    and its masks (and stored flows with ``include_flows``). Yields
+    (path, size, chunk producer) for ``stream_zip``; GridFS files are
+    opened only when their entry is reached.
+    """
+    for result in inference.get('results', []):
+        source_filename = result['source_filename']
+        # Create a folder name based on the file stem (e.g., 'image_01')
+        folder_name = os.path.splitext(source_filename)[0]
+
+        # 1. Add Original Image
+        # Path inside zip: image_01/image_01.png (once per multi-page stack)
+        if 'source_image_gridfs_id' in result and not result.get('plane'):
+            grid_out = _open_gridfs(fs, result['source_image_gridfs_id'], "source_image")
+            if grid_out:
+                yield _gridfs_entry(os.path.join(folder_name, source_filename), grid_out)
+
+        # 2. Add artifacts (generic, supports multiple models)
+        artifacts = result.get("artifacts", [])
+        if artifacts:
+            # Preferred path: use the generic artifacts list (supports any model).
+            for artifact in artifacts:
+                gridfs_id = artifact.get("gridfs_id")
+                if not gridfs_id or (artifact.get("kind") == "flows" and not include_flows):
+                    continue
+                # If the artifact provides its own filename, use it; otherwise
+                # derive a simple name based on kind.
+                artifact_filename = artifact.get(
+                    "filename",
+                    f"{folder_name}_{artifact.get('kind', 'artifact')}.bin",
+                )
+                if artifact.get("kind") in VOLUME_KINDS:
+                    # Slice-chunked volumes are shipped as multi-page TIFFs, one slice at a time
+                    try:
+                        size, produce = volume_tiff(fs, gridfs_id)
+                    except Exception as e:
+                        current_app.logger.error(f"Failed to export volume {gridfs_id}: {e}")
+                        continue
+                    yield os.path.join(folder_name, artifact_filename), size, produce
+                    continue
+
+                grid_out = _open_gridfs(fs, gridfs_id, f"artifact (kind={artifact.get('kind')})")
+                if not grid_out:
+                    continue
+                yield _gridfs_entry(os.path.join(folder_name, artifact_filename), grid_out)
+
+                # Raw label masks also ship their class / instance renderings
+                if artifact.get("kind") == "label_mask":
+                    for view in ("class", "instance"):
+                        try:
+                            rendered = get_rendered_mask(
+                                fs, gridfs_id, view, current_app.config["PNG_COMPRESS_LEVEL"]
+                            )
+                        except Exception as e:
+                            current_app.logger.error(f"Failed to render {view} mask of {gridfs_id}: {e}")
+                            continue
+                        rendered_filename = f"{artifact_filename.rsplit('_label_mask.', 1)[0]}_{view}_mask.png"
+                        yield _gridfs_entry(os.path.join(folder_name, rendered_filename), rendered)
+        else:
+            # Backwards-compatible path: fall back to class_mask_id / instance_mask_id
+            # if no artifacts list is present (older jobs).
+            for view in ("class", "instance"):
+                mask_id = result.get(f"{view}_mask_id")
+                if not mask_id:
+                    continue
+                grid_out = _open_gridfs(fs, mask_id, f"{view}_mask")
+                if grid_out:
+                    yield _gridfs_entry(os.path.join(folder_name, f"{folder_name}_{view}_mask.png"), grid_out)
+
+
+def _manifest(inference: Dict[str, Any], files: list) -> bytes:
+    def _str(value):
+        return value.isoformat() if isinstance(value, datetime.datetime) else str(value) if value is not None else None
+
+    manifest = {
+        "inference_id": str(inference["_id"]),
+        "dataset_id": str(inference["dataset_id"]),
+        "model_id": inference.get("model_id"),
+        "engine": inference.get("engine"),
+        "params": inference.get("params") or {},
+        "created_at": _str(inference.get("created_at")),
+        "finished_at": _str(inference.get("finished_at")),
+        "results_version": inference.get("results_version", 0),
+        "classification": inference.get("classification"),
+        "results": [
+            {
+                "source_filename": r.get("source_filename"),
+                "plane": r.get("plane"),
+                "classification": r.get("classification"),
+                "artifacts": [
+                    {"kind": a.get("kind"), "filename": a.get("filename"), "model_id": a.get("model_id")}
+                    for a in r.get("artifacts", [])
+                ],
+            }
+            for r in inference.get("results", [])
+        ],
+        "files": files,
+    }
+    return json.dumps(manifest, indent=2, default=str).encode("utf-8")
+
+
+def export_entries(fs, inference: Dict[str, Any], include_flows: bool = False) -> Iterator[ZipEntry]:
+    """All archive entries, closed by a ``manifest.json`` describing the job and its files."""
+    files = []
+    for entry in zip_entries(fs, inference, include_flows):
+        files.append(entry[0])
+        yield entry
+    manifest = _manifest(inference, files)
+    yield "manifest.json", len(manifest), lambda: [manifest]
+
+
+def stream_export(fs, inference: Dict[str, Any], include_flows: bool = False) -> Iterator[bytes]:
+    date_time = (inference.get('finished_at') or inference['created_at']).timetuple()[:6]
+    return stream_zip(
+        export_entries(fs, inference, include_flows),
+        date_time=date_time,
+        on_error=lambda path, e: current_app.logger.error(f"Failed to stream {path}: {e}"),
+    )
+
+
+# Cached exports: a completed inference's default archive (without flows) is stored once in GridFS
+# and recorded as ``export: {gridfs_id, results_version, size, built_at}``.
+# Anything that changes the results bumps ``results_version`` (see
+# ``invalidate_export``), which makes the stored archive stale.
+
+def _version_filter(version: int):
+    # Jobs that were never invalidated have no results_version field yet.
+    return {"$in": [version, None]} if version == 0 else version
+
+
+def cached_export(db, fs, inference: Dict[str, Any]):
+    """The stored archive of this inference as a GridOut, or None if missing or stale."""
+    export = inference.get("export")
+    if not export or export.get("results_version") != inference.get("results_version", 0):
+        return None
+    try:
+        return fs.get(ObjectId(export["gridfs_id"]))
+    except Exception:
+        return None
+
+
+def stream_and_store_export(db, fs, inference: Dict[str, Any]) -> Iterator[bytes]:
+    """
+    Streams the archive while writing the same bytes to GridFS. Once it is
+    complete, the stored copy is recorded on the inference, unless the
+    results changed meanwhile or another request stored one first.
+    """
+    version = inference.get("results_version", 0)
+    grid_in = fs.new_file(
+        filename=f"inference_{inference['_id']}.zip",
+        content_type="application/zip",
+        metadata={"type": "export", "inference_id": str(inference["_id"]), "results_version": version},
+    )
+    try:
+        for piece in stream_export(fs, inference):
+            grid_in.write(piece)
+            yield piece
+    except BaseException:
+        # Client went away or a read failed: drop the partial copy.
+        grid_in.abort()
+        raise
+    grid_in.close()
+
+    recorded = db.inferences.update_one(
+        {
+            "_id": inference["_id"],
+            "status": "completed",
+            "results_version": _version_filter(version),
+            "export": {"$exists": False},
+        },
+        {"$set": {"export": {
+            "gridfs_id": str(grid_in._id),
+            "results_version": version,
+            "size": grid_in.length,
+            "built_at": datetime.datetime.utcnow(),
+        }}},
+    )
+    if not recorded.matched_count:
+        fs.delete(grid_in._id)
+
+
+def build_export(db, fs, inference_id: ObjectId) -> None:
+    """Builds and stores the archive of a completed inference ahead of the first download."""
+    inference = db.inferences.find_one({"_id": inference_id})
+    if not inference or inference.get("status") != "completed" or cached_export(db, fs, inference):
+        return
+    for _ in stream_and_store_export(db, fs, inference):
+        pass
+
+
+def invalidate_export(db, fs, inference_id: ObjectId) -> None:
+    """Marks the results as changed and deletes the stored archive, if any."""
+    before = db.inferences.find_one_and_update(
+        {"_id": inference_id},
+        {"$inc": {"results_version": 1}, "$unset": {"export": ""}},
+        projection={"export": 1},
+    )
+    export = (before or {}).get("export")
+    if export:
+        try:
+            fs.delete(ObjectId(export["gridfs_id"]))
+        except Exception:
+            current_app.logger.warning(f"Failed to delete export {export['gridfs_id']} of inference {inference_id}")
@@ -0,0 +1,247 @@
+import hashlib
+import io
+import os
+import tempfile
+from typing import List, Optional, Tuple
+
+import numpy as np
+from bson.objectid import ObjectId
+from PIL import Image, ImageSequence
+
+try:
+    import tifffile
+except ImportError:  # TIFFs are then decoded through PIL like any other image
+    tifffile = None
+
+try:
+    import zarr
+except ImportError:
+    zarr = None
+
+
+TIFF_MAGIC = (b"II*\x00", b"MM\x00*", b"II+\x00", b"MM\x00+")  # classic and BigTIFF
+CHANNEL_AXES = "CS"
+# Without zarr, compressed TIFF data decoding to at least this much goes to a
+# temporary memmap instead of RAM, also when the file itself was read into memory.
+DECODE_MEMMAP_MIN_BYTES = 256 * 1024 ** 2
+
+Box = Tuple[int, int, int, int]  # (y0, y1, x0, x1)
+
+
+def is_tiff(head: bytes) -> bool:
+    return head[:4] in TIFF_MAGIC
+
+
+class ImageSource:
+    """
+    An input image as a sequence of 2D planes of shape (Y, X[, C]).
+
+    Multi-page stacks (Z, T, ...) become one plane per page; a channel axis is
+    kept as the last axis of each plane. ``digest`` is the SHA-256 of the
+    file bytes, the same value ``result_cache.source_sha256`` gives.
+
+    Sources are context managers; closing one releases the file handle or
+    memory map (and with it a spooled temporary file) behind its planes.
+    """
+
+    digest: str = ""
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self) -> "ImageSource":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    @property
+    def planes(self) -> int:
+        raise NotImplementedError
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        raise NotImplementedError
+
+    def read_plane(self, plane: int = 0):
+        """The plane as an array; may be memory-mapped or lazily decoded."""
+        raise NotImplementedError
+
+    def read_region(self, box: Box, plane: int = 0) -> np.ndarray:
+        y0, y1, x0, x1 = box
+        return np.asarray(self.read_plane(plane)[y0:y1, x0:x1])
+
+
+class ArraySource(ImageSource):
+    """Planes decoded in memory through PIL (PNG, JPEG, small TIFFs)."""
+
+    def __init__(self, planes: List[np.ndarray], digest: str) -> None:
+        self._planes = planes
+        self.digest = digest
+
+    @property
+    def planes(self) -> int:
+        return len(self._planes)
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        return self._planes[0].shape
+
+    def read_plane(self, plane: int = 0) -> np.ndarray:
+        return self._planes[plane]
+
+
+class TiffSource(ImageSource):
+    """
+    First series of a TIFF / OME-TIFF read through tifffile.
+
+    Uncompressed data is memory-mapped straight from the file. Compressed
+    data is read through zarr when it is installed, so regions decode only
+    the TIFF tiles/strips they touch; otherwise the series is decoded into
+    a temporary memory-mapped file (when spooled or large) rather than RAM.
+    """
+
+    def __init__(self, handle, digest: str) -> None:
+        self.digest = digest
+        self._tif = tifffile.TiffFile(handle)
+        series = self._tif.series[0]
+        self._axes = series.axes
+        self._data = self._open_data(handle, series)
+
+        self._outer = [i for i, axis in enumerate(self._axes) if axis not in "YX" + CHANNEL_AXES]
+        self._outer_shape = tuple(series.shape[i] for i in self._outer)
+        plane_axes = [i for i in range(len(self._axes)) if i not in self._outer]
+        self._plane_shape = tuple(series.shape[i] for i in plane_axes)
+        # Order of the plane's remaining axes, moved to (Y, X, C...).
+        remaining = [self._axes[i] for i in plane_axes]
+        self._order = [remaining.index("Y"), remaining.index("X")] + [
+            i for i, axis in enumerate(remaining) if axis not in "YX"
+        ]
+
+    def _open_data(self, handle, series):
+        if isinstance(handle, str):
+            try:
+                return tifffile.memmap(handle, series=0, mode="r")
+            except ValueError:
+                pass  # compressed or non-contiguous
+        if zarr is not None:
+            return zarr.open(series.aszarr(), mode="r")
+        to_disk = isinstance(handle, str) or series.nbytes >= DECODE_MEMMAP_MIN_BYTES
+        return series.asarray(out="memmap" if to_disk else None)
+
+    @property
+    def planes(self) -> int:
+        return int(np.prod(self._outer_shape)) if self._outer_shape else 1
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        return tuple(self._plane_shape[i] for i in self._order)
+
+    def _index(self, plane: int, y=slice(None), x=slice(None)) -> tuple:
+        index = [slice(None)] * len(self._axes)
+        if self._outer_shape:
+            for axis, i in zip(self._outer, np.unravel_index(plane, self._outer_shape)):
+                index[axis] = int(i)
+        index[self._axes.index("Y")] = y
+        index[self._axes.index("X")] = x
+        return tuple(index)
+
+    def _to_plane(self, data) -> np.ndarray:
+        return np.transpose(data, self._order) if self._order != sorted(self._order) else data
+
+    def read_plane(self, plane: int = 0):
+        return self._to_plane(self._data[self._index(plane)])
+
+    def read_region(self, box: Box, plane: int = 0) -> np.ndarray:
+        y0, y1, x0, x1 = box
+        return np.asarray(self._to_plane(self._data[self._index(plane, slice(y0, y1), slice(x0, x1))]))
+
+    def close(self) -> None:
+        self._data = None  # drops the memory map of an unlinked spool file
+        self._tif.close()
+
+
+class PlaneView:
+    """
+    Lazy handle on one plane of a source. Slicing ``[y0:y1, x0:x1]`` reads
+    only that region, which is what tiled inference needs; other keys index
+    the (possibly memory-mapped) plane directly.
+    """
+
+    def __init__(self, source: ImageSource, plane: int = 0) -> None:
+        self.source = source
+        self.plane = plane
+        self.shape = source.shape
+        self.ndim = len(self.shape)
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple) and len(key) == 2 and all(isinstance(k, slice) and k.step is None for k in key):
+            ys, xs = key
+            y0, y1, _ = ys.indices(self.shape[0])
+            x0, x1, _ = xs.indices(self.shape[1])
+            return self.source.read_region((y0, y1, x0, x1), self.plane)
+        return np.asarray(self.source.read_plane(self.plane)[key])
+
+    def __array__(self, dtype=None, copy=None):
+        data = np.asarray(self.source.read_plane(self.plane))
+        return data.astype(dtype, copy=False) if dtype is not None else data
+
+
+def close_sources(items: list) -> None:
+    """Closes the ``source`` of loaded items once their results are stored."""
+    sources = {id(item["source"]): item["source"] for item in items if item.get("source") is not None}
+    for source in sources.values():
+        source.close()
+
+
+def _pil_planes(data: bytes) -> List[np.ndarray]:
+    with Image.open(io.BytesIO(data)) as img:
+        return [np.array(frame) for frame in ImageSequence.Iterator(img)]
+
+
+def spool_gridfs(grid_out, spool_dir: Optional[str] = None) -> Tuple[str, str]:
+    """
+    Streams a GridFS file chunk by chunk into a temporary file, hashing it on
+    the way. Returns (path, sha256).
+    """
+    digest = hashlib.sha256()
+    fd, path = tempfile.mkstemp(suffix=".tif", dir=spool_dir)
+    with os.fdopen(fd, "wb") as f:
+        while True:
+            chunk = grid_out.readchunk()
+            if not chunk:
+                break
+            digest.update(chunk)
+            f.write(chunk)
+    return path, digest.hexdigest()
+
+
+def open_image(fs, gridfs_id, spool_min_bytes: int = 32 * 1024 ** 2, spool_dir: Optional[str] = None) -> ImageSource:
+    """
+    Opens a stored input image without holding large TIFFs in memory.
+
+    Only TIFFs stream: those of at least ``spool_min_bytes`` are spooled from
+    GridFS to a temporary file and memory-mapped from there; the file is
+    unlinked right away and freed when the source is closed. Smaller TIFFs
+    are read into memory, and PNG / JPEG inputs, which have no random
+    access, are always read and decoded in memory.
+    """
+    grid_out = fs.get(ObjectId(gridfs_id))
+    head = grid_out.read(4)
+    grid_out.seek(0)
+
+    if tifffile is None or not is_tiff(head) or grid_out.length < spool_min_bytes:
+        data = grid_out.read()
+        digest = hashlib.sha256(data).hexdigest()
+        if tifffile is not None and is_tiff(data):
+            return TiffSource(io.BytesIO(data), digest)
+        return ArraySource(_pil_planes(data), digest)
+
+    path, digest = spool_gridfs(grid_out, spool_dir)
+    try:
+        return TiffSource(path, digest)
+    finally:
+        try:
+            os.unlink(path)  # open handles and mappings keep the data alive
+        except OSError:
+            pass
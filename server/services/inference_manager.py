@@ -1,22 +1,39 @@
-from typing import Dict, Type
+from typing import Dict, Optional, Type
 
 from bson.objectid import ObjectId
 from flask import current_app
 import datetime
+import threading
 
-from db import get_db
+from db import get_db, get_fs
 from services.cellpose_runner import CellposeRunner
-from services.model_runner_base import ModelRunner
+from services.ensemble_runner import EnsembleRunner
+from services.export_archive import build_export
+from services.pyramid import build_result_pyramids, pyramid_options
+from services.model_runner_base import LeaseLostError, ModelRunner
 
 
 RUNNER_REGISTRY: Dict[str, Type[ModelRunner]] = {
     "cellpose": CellposeRunner,
+    "ensemble": EnsembleRunner,
 }
 
 
-def start_managed_inference(inference_id_str: str) -> None:
+def start_managed_inference(
+    inference_id_str: str,
+    worker_id: Optional[str] = None,
+    lease_lost: Optional[threading.Event] = None,
+) -> None:
+    """
+    Runs an inference with its registered runner. Lease workers pass their
+    ``worker_id`` and the heartbeat's ``lease_lost`` event, so a job that
+    another worker took over is abandoned instead of being overwritten.
+    """
     db = get_db()
     inference_id = ObjectId(inference_id_str)
+    owned = {"_id": inference_id}
+    if worker_id:
+        owned["worker_id"] = worker_id
 
     try:
         current_app.logger.info(f"[DISPATCHER] Starting inference: {inference_id_str}")
@@ -40,7 +57,7 @@ def start_managed_inference(inference_id_str: str) -> None:
             f"[DISPATCHER] Selected runner class: {runner_class.__name__}"
         )
 
-        runner = runner_class()
+        runner = runner_class(worker_id=worker_id, lease_lost=lease_lost)
         current_app.logger.info(
             f"[DISPATCHER] Invoking run_inference_job on {runner_class.__name__}"
         )
@@ -50,12 +67,37 @@ def start_managed_inference(inference_id_str: str) -> None:
             f"[DISPATCHER] Inference {inference_id_str} completed successfully"
         )
 
+        # Background workers also build the download archive; inline jobs
+        # build it on the first download instead of delaying the request.
+        if (
+            current_app.config["EXPORT_CACHE_ENABLED"]
+            and current_app.config["EXPORT_PREBUILD"]
+            and current_app.config["INFERENCE_DISPATCH_MODE"] != "inline"
+        ):
+            try:
+                build_export(db, get_fs(), inference_id)
+            except Exception as e:
+                current_app.logger.warning(f"[DISPATCHER] Export archive for {inference_id_str} not built: {e}")
+
+        # Likewise the viewer's thumbnails and tile pyramids.
+        if current_app.config["PYRAMID_PREBUILD"] and current_app.config["INFERENCE_DISPATCH_MODE"] != "inline":
+            try:
+                built = build_result_pyramids(
+                    db, get_fs(), db.inferences.find_one({"_id": inference_id}) or {}, **pyramid_options()
+                )
+                current_app.logger.info(f"[DISPATCHER] Built {built} pyramid(s) for {inference_id_str}")
+            except Exception as e:
+                current_app.logger.warning(f"[DISPATCHER] Pyramids for {inference_id_str} not built: {e}")
+
+    except LeaseLostError as e:
+        current_app.logger.warning(f"[DISPATCHER] Inference {inference_id_str} abandoned: {e}")
+
     except Exception as e:
         current_app.logger.error(
             f"[DISPATCHER] Inference {inference_id_str} failed: {e}"
         )
         db.inferences.update_one(
-            {"_id": inference_id},
+            owned,
             {
                 "$set": {
                     "status": "failed",
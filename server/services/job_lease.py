@@ -0,0 +1,147 @@
+import datetime
+import os
+import socket
+import threading
+from typing import Any, Dict, Optional
+
+from bson.objectid import ObjectId
+from pymongo import ReturnDocument
+
+from services.inference_manager import start_managed_inference
+
+
+def make_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def claim_next_inference(db, worker_id: str, lease_seconds: float) -> Optional[Dict[str, Any]]:
+    """
+    Atomically move the oldest queued inference to running and lease it to
+    ``worker_id``. Returns the claimed document, or None if nothing is queued.
+    """
+    now = datetime.datetime.utcnow()
+    return db.inferences.find_one_and_update(
+        {"status": "queued"},
+        {
+            "$set": {
+                "status": "running",
+                "worker_id": worker_id,
+                "heartbeat_at": now,
+                "lease_expires_at": now + datetime.timedelta(seconds=lease_seconds),
+            },
+            "$inc": {"attempts": 1},
+        },
+        sort=[("created_at", 1)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+def renew_lease(db, inference_id: ObjectId, worker_id: str, lease_seconds: float) -> bool:
+    """Extend the lease; False means the job is no longer ours."""
+    now = datetime.datetime.utcnow()
+    result = db.inferences.update_one(
+        {"_id": inference_id, "worker_id": worker_id, "status": "running"},
+        {"$set": {
+            "heartbeat_at": now,
+            "lease_expires_at": now + datetime.timedelta(seconds=lease_seconds),
+        }},
+    )
+    return result.matched_count == 1
+
+
+def release_lease(db, inference_id: ObjectId, worker_id: str) -> None:
+    db.inferences.update_one(
+        {"_id": inference_id, "worker_id": worker_id},
+        {"$unset": {"lease_expires_at": ""}},
+    )
+
+
+def requeue_expired_leases(db, max_attempts: int) -> int:
+    """
+    Put running jobs whose lease ran out back in the queue. Jobs that already
+    used up ``max_attempts`` are failed instead of retried forever.
+    Returns the number of re-queued jobs.
+    """
+    now = datetime.datetime.utcnow()
+    expired = {"status": "running", "lease_expires_at": {"$lt": now}}
+
+    db.inferences.update_many(
+        {**expired, "attempts": {"$gte": max_attempts}},
+        {
+            "$set": {
+                "status": "failed",
+                "finished_at": now,
+                "notes": f"Worker lease expired after {max_attempts} attempts",
+            },
+            "$unset": {"lease_expires_at": ""},
+        },
+    )
+    result = db.inferences.update_many(
+        expired,
+        {
+            "$set": {"status": "queued"},
+            "$unset": {"worker_id": "", "heartbeat_at": "", "lease_expires_at": ""},
+        },
+    )
+    return result.modified_count
+
+
+class LeaseHeartbeat(threading.Thread):
+    """
+    Background thread that keeps renewing a job lease until stopped. When a
+    renewal fails it sets ``lost``, which the runner checks before each write.
+    """
+
+    def __init__(self, db, inference_id: ObjectId, worker_id: str, lease_seconds: float) -> None:
+        super().__init__(daemon=True)
+        self.db = db
+        self.inference_id = inference_id
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self.lost = threading.Event()
+        self._stopped = threading.Event()
+
+    def run(self) -> None:
+        while not self._stopped.wait(self.lease_seconds / 3):
+            if not renew_lease(self.db, self.inference_id, self.worker_id, self.lease_seconds):
+                print(f"[WORKER {self.worker_id}] Lost lease on {self.inference_id}")
+                self.lost.set()
+                return
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self.join()
+
+
+def run_lease_worker(db, config, stop_event, worker_id: Optional[str] = None) -> None:
+    """
+    Claim and run queued inferences until ``stop_event`` is set. A job that
+    is already running is finished before the worker returns.
+    """
+    worker_id = worker_id or make_worker_id()
+    lease_seconds = config["INFERENCE_LEASE_SECONDS"]
+    poll_interval = config["INFERENCE_POLL_INTERVAL"]
+    max_attempts = config["INFERENCE_MAX_ATTEMPTS"]
+
+    print(f"[WORKER {worker_id}] Waiting for queued inferences")
+    while not stop_event.is_set():
+        requeued = requeue_expired_leases(db, max_attempts)
+        if requeued:
+            print(f"[WORKER {worker_id}] Re-queued {requeued} job(s) with expired leases")
+
+        inference_doc = claim_next_inference(db, worker_id, lease_seconds)
+        if inference_doc is None:
+            stop_event.wait(poll_interval)
+            continue
+
+        inference_id = inference_doc["_id"]
+        heartbeat = LeaseHeartbeat(db, inference_id, worker_id, lease_seconds)
+        heartbeat.start()
+        try:
+            start_managed_inference(str(inference_id), worker_id=worker_id, lease_lost=heartbeat.lost)
+        except Exception:
+            # start_managed_inference already marked the job as failed.
+            pass
+        finally:
+            heartbeat.stop()
+            release_lease(db, inference_id, worker_id)
@@ -0,0 +1,170 @@
+import atexit
+import multiprocessing
+import signal
+import threading
+from typing import List, Optional
+
+from bson.objectid import ObjectId
+from flask import current_app
+
+from db import get_db
+from services.inference_manager import start_managed_inference
+from services.job_lease import run_lease_worker
+
+
+_STOP = None  # sentinel telling a worker to exit once the queue is drained
+
+
+def _worker_main(config_name: str, job_queue) -> None:
+    """Entry point of a worker process: run queued inference ids until stopped."""
+    # Ctrl+C goes to the whole process group; let the parent drain us instead.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    from app import create_app
+
+    app = create_app(config_name)
+    with app.app_context():
+        db = get_db()
+        while True:
+            inference_id_str = job_queue.get()
+            if inference_id_str is _STOP:
+                break
+            # A job can be submitted twice (once by its request, once when a restarted
+            # pool re-enqueues queued jobs); only the worker that moves it to running runs it.
+            claimed = db.inferences.update_one(
+                {"_id": ObjectId(inference_id_str), "status": "queued"},
+                {"$set": {"status": "running"}},
+            )
+            if not claimed.modified_count:
+                continue
+            try:
+                start_managed_inference(inference_id_str)
+            except Exception:
+                # start_managed_inference already marked the job as failed.
+                pass
+
+
+def _lease_worker_main(config_name: str, stop_event) -> None:
+    """Entry point of a worker process that claims jobs from MongoDB."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    from app import create_app
+
+    app = create_app(config_name)
+    with app.app_context():
+        run_lease_worker(get_db(), app.config, stop_event)
+
+
+class InferenceWorkerPool:
+    """
+    Fixed-size pool of worker processes.
+
+    In ``queued`` mode workers are fed from a local job queue; in ``lease``
+    mode they claim queued inference documents from MongoDB, so workers on
+    any number of hosts can share one database. Each worker builds its own
+    app (and therefore its own Mongo client) and dispatches jobs through
+    ``start_managed_inference``, so they go through ``RUNNER_REGISTRY``
+    exactly as inline jobs do.
+    """
+
+    def __init__(self, config_name: str, num_workers: int, mode: str = "queued") -> None:
+        self.config_name = config_name
+        self.num_workers = max(1, num_workers)
+        self.mode = mode
+        self._ctx = multiprocessing.get_context("spawn")
+        self._queue = self._ctx.Queue()
+        self._stop_event = self._ctx.Event()
+        self._workers: List[multiprocessing.Process] = []
+
+    def start(self) -> None:
+        for i in range(self.num_workers):
+            if self.mode == "lease":
+                target, args = _lease_worker_main, (self.config_name, self._stop_event)
+            else:
+                target, args = _worker_main, (self.config_name, self._queue)
+            proc = self._ctx.Process(
+                target=target,
+                args=args,
+                name=f"inference-worker-{i}",
+                daemon=False,
+            )
+            proc.start()
+            self._workers.append(proc)
+
+    def submit(self, inference_id_str: str) -> None:
+        self._queue.put(inference_id_str)
+
+    def requeue_queued(self, db) -> int:
+        """
+        Submit every inference still marked ``queued``, oldest first. The local
+        queue does not survive a restart, so this picks up jobs submitted before
+        it. Jobs that were running when the process died are not retried; lease
+        mode is the dispatch mode that recovers those.
+        """
+        count = 0
+        for doc in db.inferences.find({"status": "queued"}, {"_id": 1}).sort("created_at", 1):
+            self.submit(str(doc["_id"]))
+            count += 1
+        return count
+
+    def shutdown(self, timeout: Optional[float] = None) -> None:
+        """Let workers finish the jobs they hold, then stop them."""
+        self._stop_event.set()
+        for _ in self._workers:
+            self._queue.put(_STOP)
+        for proc in self._workers:
+            proc.join(timeout)
+            if proc.is_alive():
+                proc.terminate()
+                proc.join()
+        self._workers = []
+
+
+_pool: Optional[InferenceWorkerPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_worker_pool() -> InferenceWorkerPool:
+    """Start the process-wide worker pool on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                pool = InferenceWorkerPool(
+                    current_app.config["CONFIG_NAME"],
+                    current_app.config["INFERENCE_WORKERS"],
+                    current_app.config["INFERENCE_DISPATCH_MODE"],
+                )
+                pool.start()
+                if pool.mode == "queued":
+                    requeued = pool.requeue_queued(get_db())
+                    if requeued:
+                        current_app.logger.info(f"[WORKER POOL] Re-enqueued {requeued} queued inference(s)")
+                atexit.register(
+                    pool.shutdown, current_app.config["INFERENCE_SHUTDOWN_TIMEOUT"]
+                )
+                _pool = pool
+    return _pool
+
+
+def dispatch_inference(inference_id_str: str) -> bool:
+    """
+    Hand an inference job to the configured dispatcher.
+
+    Returns True if the job was queued for a worker, False if it already ran
+    inline in this request.
+    """
+    mode = current_app.config["INFERENCE_DISPATCH_MODE"]
+    if mode == "queued":
+        get_worker_pool().submit(inference_id_str)
+        return True
+
+    if mode == "lease":
+        # The document is already 'queued'; any leasing worker will claim it.
+        # Web nodes may also run a few local workers.
+        if current_app.config["INFERENCE_WORKERS"] > 0:
+            get_worker_pool()
+        return True
+
+    start_managed_inference(inference_id_str)
+    return False
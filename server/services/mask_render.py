@@ -0,0 +1,114 @@
+import io
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+from bson.objectid import ObjectId
+from PIL import Image
+
+from services.colorize import encode_class_png, encode_instance_png
+from services.image_reader import is_tiff
+
+try:
+    import tifffile
+except ImportError:  # wide label masks fall back to .npy
+    tifffile = None
+
+NPY_MAGIC = b"\x93NUMPY"
+
+
+RENDER_VIEWS = {
+    "class": encode_class_png,
+    "instance": encode_instance_png,
+}
+
+
+def encode_label_png(masks: np.ndarray, compress_level: int = 6) -> bytes:
+    """Stores a label mask losslessly as a 16-bit grayscale PNG."""
+    img = Image.fromarray(masks.astype(np.uint16, copy=False))
+    bytes_io = io.BytesIO()
+    img.save(bytes_io, format="PNG", compress_level=compress_level)
+    return bytes_io.getvalue()
+
+
+def decode_label_png(data: bytes) -> np.ndarray:
+    # Depending on the Pillow version 16-bit PNGs open as "I;16" or "I".
+    return np.array(Image.open(io.BytesIO(data))).astype(np.uint16, copy=False)
+
+
+def encode_label_mask(masks: np.ndarray, compress_level: int = 6) -> Tuple[bytes, str]:
+    """
+    Stores a label mask losslessly; returns (bytes, file extension).
+
+    16-bit masks are stored as 16-bit PNGs. Wider ones (tiled whole-slide
+    results, whose ids can pass 65535) are stored as 32-bit TIFFs in
+    256 x 256 tiles, so regions can be read without decoding the whole
+    mask. Without tifffile they fall back to .npy.
+    """
+    if masks.dtype.itemsize <= 2:
+        return encode_label_png(masks, compress_level), "png"
+    masks = masks.astype(np.uint32, copy=False)
+    bytes_io = io.BytesIO()
+    if tifffile is None:
+        np.save(bytes_io, np.asarray(masks))
+        return bytes_io.getvalue(), "npy"
+    tifffile.imwrite(
+        bytes_io, masks, photometric="minisblack", tile=(256, 256),
+        compression="zlib", compressionargs={"level": compress_level},
+    )
+    return bytes_io.getvalue(), "tif"
+
+
+def decode_label_mask(data: bytes) -> np.ndarray:
+    """Label mask written by ``encode_label_mask``, whatever its format."""
+    if is_tiff(data):
+        return tifffile.imread(io.BytesIO(data))
+    if data.startswith(NPY_MAGIC):
+        return np.load(io.BytesIO(data))
+    return decode_label_png(data)
+
+
+def find_artifact(result: Dict[str, Any], kind: str) -> Optional[Dict[str, Any]]:
+    for artifact in result.get("artifacts", []):
+        if artifact.get("kind") == kind:
+            return artifact
+    return None
+
+
+def get_rendered_mask(fs, label_file_id, view: str, compress_level: int = 6):
+    """
+    Returns a GridFS file holding the ``view`` ('class' or 'instance')
+    rendering of a label mask artifact, rendering and caching it in GridFS
+    on first use.
+    """
+    if view not in RENDER_VIEWS:
+        raise ValueError(f"Unknown mask view '{view}'. Available: {list(RENDER_VIEWS)}")
+
+    label_file_id = str(label_file_id)
+    cached = fs.find_one({"metadata.rendered_from": label_file_id, "metadata.view": view})
+    if cached is not None:
+        return cached
+
+    label_file = fs.get(ObjectId(label_file_id))
+    masks = decode_label_mask(label_file.read())
+    png_bytes = RENDER_VIEWS[view](masks, compress_level)
+
+    label_metadata = label_file.metadata or {}
+    base_filename = label_file.filename.rsplit(".", 1)[0].replace("label_", "", 1)
+    rendered_id = fs.put(
+        png_bytes,
+        filename=f"{view}_{base_filename}.png",
+        metadata={
+            "source_image_gridfs_id": label_metadata.get("source_image_gridfs_id"),
+            "inference_id": label_metadata.get("inference_id"),
+            "type": f"mask_{view}",
+            "rendered_from": label_file_id,
+            "view": view,
+        },
+    )
+    return fs.get(rendered_id)
+
+
+def delete_renderings(fs, label_file_id) -> None:
+    """Removes every cached rendering of a label mask artifact."""
+    for rendered in fs.find({"metadata.rendered_from": str(label_file_id)}):
+        fs.delete(rendered._id)
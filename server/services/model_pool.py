@@ -0,0 +1,130 @@
+import os
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from flask import current_app, has_app_context
+
+
+ModelKey = Tuple[str, str, Optional[str], str]
+
+
+def estimate_model_bytes(model: Any, model_path: Optional[str] = None) -> int:
+    """Best-effort size of a loaded model's weights in bytes."""
+    net = getattr(model, "net", None)
+    if net is not None and hasattr(net, "parameters"):
+        try:
+            return sum(p.numel() * p.element_size() for p in net.parameters())
+        except Exception:
+            pass
+    if model_path and os.path.isfile(model_path):
+        return os.path.getsize(model_path)
+    return 0
+
+
+class ModelPool:
+    """
+    Process-wide pool of loaded models keyed by (model path, device, model type, engine).
+
+    Models are kept in least-recently-used order and evicted once the summed
+    weight size exceeds ``max_bytes``. The most recently used model is never
+    evicted, so a single model larger than the budget still gets cached.
+
+    Loading happens outside the pool lock under a per-key lock, so a slow
+    load of one model only blocks requests for that same model. The pooled
+    model object is shared by every thread of the process (inline dispatch
+    runs jobs on request threads); Cellpose's ``eval`` keeps per-call state
+    on the model, so callers hold ``eval_lock(model)`` around it.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self._models: "OrderedDict[ModelKey, Tuple[Any, int]]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._loading: Dict[ModelKey, threading.Lock] = {}
+        self._eval_locks: "weakref.WeakKeyDictionary[Any, threading.Lock]" = weakref.WeakKeyDictionary()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: ModelKey, loader: Callable[[], Any]) -> Any:
+        """Return the model for ``key``, calling ``loader()`` on a miss."""
+        with self._lock:
+            if key in self._models:
+                self._models.move_to_end(key)
+                self.hits += 1
+                return self._models[key][0]
+            key_lock = self._loading.setdefault(key, threading.Lock())
+
+        with key_lock:
+            with self._lock:
+                # Another thread may have finished loading while we waited.
+                if key in self._models:
+                    self._models.move_to_end(key)
+                    self.hits += 1
+                    return self._models[key][0]
+                self.misses += 1
+            try:
+                model = loader()
+                size = estimate_model_bytes(model, key[0])
+            finally:
+                with self._lock:
+                    self._loading.pop(key, None)
+            with self._lock:
+                self._models[key] = (model, size)
+                self._evict()
+            return model
+
+    def eval_lock(self, model: Any) -> threading.Lock:
+        """Lock serialising ``eval`` calls on one shared model object."""
+        with self._lock:
+            lock = self._eval_locks.get(model)
+            if lock is None:
+                lock = self._eval_locks[model] = threading.Lock()
+            return lock
+
+    def _evict(self) -> None:
+        while len(self._models) > 1 and self.total_bytes() > self.max_bytes:
+            key, _ = self._models.popitem(last=False)
+            self.evictions += 1
+            print(f"[MODEL POOL] Evicted {key}")
+
+    def total_bytes(self) -> int:
+        return sum(size for _, size in self._models.values())
+
+    def clear(self) -> None:
+        with self._lock:
+            self._models.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "loaded": [
+                    {"model_path": k[0], "device": k[1], "model_type": k[2], "engine": k[3], "bytes": size}
+                    for k, (_, size) in self._models.items()
+                ],
+                "total_bytes": self.total_bytes(),
+                "max_bytes": self.max_bytes,
+            }
+
+
+_pool: Optional[ModelPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_model_pool() -> ModelPool:
+    """Return the pool shared by every runner in this process."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                if has_app_context():
+                    max_bytes = current_app.config["MODEL_POOL_MAX_BYTES"]
+                else:
+                    max_bytes = os.getenv("MODEL_POOL_MAX_BYTES", 4 * 1024 ** 3)
+                _pool = ModelPool(int(max_bytes))
+    return _pool
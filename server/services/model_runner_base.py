@@ -2,8 +2,16 @@ from abc import ABC, abstractmethod
 from typing import Optional, Any, Dict, List
 
 from db import get_db, get_fs
+from services.mask_render import delete_renderings
+from services.model_pool import get_model_pool
+from services.pyramid import delete_pyramids
 from bson.objectid import ObjectId
 import datetime
+import threading
+
+
+class LeaseLostError(RuntimeError):
+    """Raised when a lease worker no longer owns the job it is running."""
 
 
 class ModelRunner(ABC):
@@ -14,9 +22,14 @@ class ModelRunner(ABC):
     logic for a specific model family (e.g. Cellpose, UNet, etc.).
     """
 
-    def __init__(self) -> None:
+    def __init__(self, worker_id: Optional[str] = None, lease_lost: Optional[threading.Event] = None) -> None:
         self.db = get_db()
         self.fs = get_fs()
+        self.model_pool = get_model_pool()
+        # Set by lease workers (services.job_lease): job writes are only
+        # applied while ``worker_id`` still owns the job.
+        self.worker_id = worker_id
+        self.lease_lost = lease_lost or threading.Event()
 
     @abstractmethod
     def run_inference_job(self, inference_id_str: str) -> None:
@@ -31,6 +44,143 @@ class ModelRunner(ABC):
         """
         raise NotImplementedError
 
+    # Ensemble support (see services.ensemble_runner): runners that can share
+    # decoded images with other models implement these three methods. Items
+    # are dicts with "file_ref", "digest" (source SHA-256) and "img" (array).
+
+    def prepare_member(self, inference_id: ObjectId, member: Dict[str, Any], params: Dict[str, Any]) -> None:
+        """Loads the member's model and options for an ensemble job."""
+        raise NotImplementedError(f"{type(self).__name__} cannot run as part of an ensemble")
+
+    def segment_items(self, items: List[Dict[str, Any]]) -> Any:
+        """Runs the model on already decoded images; returns state for ``store_items``."""
+        raise NotImplementedError(f"{type(self).__name__} cannot run as part of an ensemble")
+
+    def store_items(self, segmented: Any) -> List[Dict[str, Any]]:
+        """Persists the outputs of ``segment_items``; returns one result record per item."""
+        raise NotImplementedError(f"{type(self).__name__} cannot run as part of an ensemble")
+
+    def incremental_refs(
+        self, inference_doc: Dict[str, Any], image_refs: List[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        """
+        Incremental jobs (``base_inference_id`` set) only process dataset files
+        the base inference has no result for. The base results are copied into
+        the job as its first checkpoint; returns the files left to process.
+        """
+        base = self.db.inferences.find_one({"_id": inference_doc["base_inference_id"]}, {"results": 1}) or {}
+        in_dataset = {str(f["gridfs_id"]) for f in image_refs}
+        carried = [
+            r for r in base.get("results", [])
+            if str(r.get("source_image_gridfs_id")) in in_dataset
+        ]
+        done = {str(r["source_image_gridfs_id"]) for r in carried}
+        pending = [f for f in image_refs if str(f["gridfs_id"]) not in done]
+
+        # One update, so a resumed job never sees the carried results twice.
+        self.db.inferences.update_one(
+            {"_id": inference_doc["_id"]},
+            {
+                "$set": {"incremental": {"carried": len(done), "processed": len(pending)}},
+                "$push": {"results": {"$each": carried}},
+            },
+        )
+        return pending
+
+    # Checkpointing: results are pushed to the job document as soon as each
+    # image is stored, so a failed or interrupted job resumes where it stopped.
+
+    def start_progress(self, inference_doc: Dict[str, Any], image_refs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Sets ``progress: {processed, total}`` and returns the files this run
+        still has to process: files already checkpointed by an earlier attempt
+        (or carried over from an incremental base) are skipped.
+        """
+        inference_id = inference_doc["_id"]
+        results = inference_doc.get("results") or []
+        if "progress" in inference_doc:
+            removed = self.delete_orphan_artifacts(inference_id, results)
+            print(f"Resuming inference {inference_id}: {len(results)} results checkpointed, "
+                  f"{removed} orphaned artifacts removed")
+
+        if inference_doc.get("base_inference_id") and "incremental" not in inference_doc:
+            pending = self.incremental_refs(inference_doc, image_refs)
+        else:
+            done = {str(r.get("source_image_gridfs_id")) for r in results}
+            pending = [f for f in image_refs if str(f["gridfs_id"]) not in done]
+
+        self.db.inferences.update_one(
+            {"_id": inference_id},
+            {"$set": {"progress": {"processed": len(image_refs) - len(pending), "total": len(image_refs)}}},
+        )
+        return pending
+
+    def owned_filter(self, inference_id: ObjectId) -> Dict[str, Any]:
+        """Query matching the job only while this runner's worker still holds its lease."""
+        query: Dict[str, Any] = {"_id": inference_id}
+        if self.worker_id:
+            query["worker_id"] = self.worker_id
+        return query
+
+    def check_lease(self, inference_id: ObjectId, matched: int = 1) -> None:
+        """Raises LeaseLostError once the heartbeat lost the lease or an owned write matched nothing."""
+        if self.worker_id and not matched:
+            self.lease_lost.set()
+        if self.lease_lost.is_set():
+            raise LeaseLostError(f"Worker {self.worker_id} lost the lease on inference {inference_id}")
+
+    def checkpoint(self, inference_id: ObjectId, results: List[Dict[str, Any]]) -> None:
+        """Persists the results of finished files and advances ``progress.processed``."""
+        self.check_lease(inference_id)
+        if not results:
+            return
+        files = {str(r["source_image_gridfs_id"]) for r in results}
+        result = self.db.inferences.update_one(
+            self.owned_filter(inference_id),
+            {
+                "$push": {"results": {"$each": results}},
+                "$inc": {"progress.processed": len(files)},
+            },
+        )
+        self.check_lease(inference_id, result.matched_count)
+
+    def complete_checkpointed(self, inference_id: ObjectId, image_refs: List[Dict[str, Any]]) -> None:
+        """Marks a checkpointed job completed, with its results in dataset order."""
+        inference_doc = self.db.inferences.find_one({"_id": inference_id}, {"results": 1})
+        order = {str(f["gridfs_id"]): i for i, f in enumerate(image_refs)}
+        results = sorted(
+            inference_doc.get("results", []),
+            key=lambda r: (order.get(str(r.get("source_image_gridfs_id")), len(order)), r.get("plane", 0)),
+        )
+        self.update_inference_status(inference_id=inference_id, status="completed", results=results)
+
+    def delete_orphan_artifacts(self, inference_id: ObjectId, results: List[Dict[str, Any]]) -> int:
+        """
+        Deletes GridFS artifacts an interrupted attempt wrote for files it never
+        checkpointed. Artifacts the result cache still points at are kept: the
+        resumed run reuses them instead of segmenting the file again.
+        """
+        referenced = {
+            str(a["gridfs_id"]) for r in results for a in r.get("artifacts", []) if a.get("gridfs_id")
+        }
+        removed = 0
+        for grid_out in self.fs.find({
+            "metadata.inference_id": str(inference_id),
+            "metadata.rendered_from": {"$exists": False},
+        }):
+            file_id = str(grid_out._id)
+            if file_id in referenced or self.db.result_cache.count_documents(
+                {"result.artifacts.gridfs_id": file_id}, limit=1
+            ):
+                continue
+            # Renderings are skipped by the scan above; they go with their label.
+            if (grid_out.metadata or {}).get("type") == "mask_label":
+                delete_renderings(self.fs, file_id)
+            delete_pyramids(self.db, self.fs, file_id)
+            self.fs.delete(grid_out._id)
+            removed += 1
+        return removed
+
     # The methods below are helpers inspired by the reference design. They make it
     # easier for runners to update job status in a consistent way.
 
@@ -57,6 +207,8 @@ class ModelRunner(ABC):
         if error is not None:
             update_doc["$set"]["notes"] = error
 
-        self.db.inferences.update_one({"_id": inference_id}, update_doc)
+        self.check_lease(inference_id)
+        result = self.db.inferences.update_one(self.owned_filter(inference_id), update_doc)
+        self.check_lease(inference_id, result.matched_count)
 
 
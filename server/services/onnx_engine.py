@@ -0,0 +1,170 @@
+import inspect
+import os
+import threading
+from typing import Optional
+
+import numpy as np
+
+
+# Attributes Cellpose reads off ``model.net`` besides calling it.
+NET_ATTRIBUTES = ("nout", "nbase", "nchan", "diam_mean", "diam_labels", "style_channels")
+
+_export_lock = threading.Lock()
+
+
+def onnx_path_for(model_path: str, quantize: bool = False, tile: int = 224, export_dir: Optional[str] = None) -> str:
+    """Where the exported (and optionally int8-quantized) network for ``model_path`` lives."""
+    name = f"{os.path.basename(model_path)}.{tile}{'.int8' if quantize else ''}.onnx"
+    return os.path.join(export_dir or os.path.dirname(model_path), name)
+
+
+def _is_fresh(path: str, model_path: str) -> bool:
+    return os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(model_path)
+
+
+def _input_channels(net) -> int:
+    nbase = getattr(net, "nbase", None)
+    if nbase:
+        return int(nbase[0])
+    return int(getattr(net, "nchan", 2))
+
+
+def export_onnx(net, path: str, tile: int = 224, opset: int = 17) -> str:
+    """
+    Exports a Cellpose network to ONNX for single ``tile`` x ``tile`` crops,
+    which is all Cellpose ever feeds it. The shape is fully static: the style
+    branch pools over the whole feature map, which the exporter can only
+    express with constant sizes.
+    """
+    import torch
+
+    class _Export(torch.nn.Module):
+        def __init__(self, inner):
+            super().__init__()
+            self.inner = inner
+
+        def forward(self, x):
+            out = self.inner(x)
+            return out[0], out[1]
+
+    net.eval()
+    kwargs = {}
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        kwargs["dynamo"] = False  # TorchScript exporter; no onnxscript dependency
+    dummy = torch.zeros((1, _input_channels(net), tile, tile), dtype=torch.float32)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    # CPnet converts its input to MKL-DNN layout on the CPU, which has no ONNX equivalent.
+    mkldnn = getattr(net, "mkldnn", False)
+    net.mkldnn = False
+    try:
+        with torch.no_grad():
+            # The exporter restores the wrapper's mode afterwards, which would
+            # put the net back in training mode unless the wrapper is in eval.
+            torch.onnx.export(
+                _Export(net).eval(),
+                dummy,
+                tmp_path,
+                input_names=["x"],
+                output_names=["y", "style"],
+                opset_version=opset,
+                **kwargs,
+            )
+    finally:
+        net.mkldnn = mkldnn
+    os.replace(tmp_path, path)  # other processes never see a half-written file
+    return path
+
+
+def quantize_onnx(src: str, dst: str) -> str:
+    """Dynamic int8 quantization of the exported network's weights."""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    tmp_path = f"{dst}.{os.getpid()}.tmp"
+    quantize_dynamic(src, tmp_path, weight_type=QuantType.QInt8)
+    os.replace(tmp_path, dst)
+    return dst
+
+
+def ensure_onnx(net, model_path: str, quantize: bool = False, tile: int = 224, export_dir: Optional[str] = None) -> str:
+    """
+    Returns the ONNX file for ``model_path``, exporting (and quantizing) it
+    first when it is missing or older than the weights.
+    """
+    fp32_path = onnx_path_for(model_path, False, tile, export_dir)
+    path = onnx_path_for(model_path, quantize, tile, export_dir)
+    with _export_lock:
+        if not _is_fresh(fp32_path, model_path):
+            print(f"Exporting Cellpose network to ONNX: {fp32_path}")
+            export_onnx(net, fp32_path, tile)
+        if quantize and not _is_fresh(path, fp32_path):
+            print(f"Quantizing ONNX network to int8: {path}")
+            quantize_onnx(fp32_path, path)
+    return path
+
+
+class OnnxNet:
+    """
+    Drop-in replacement for ``CellposeModel.net`` that runs the exported
+    network with ONNX Runtime on the CPU.
+
+    Cellpose calls the net with a float32 tensor of tiles and takes
+    ``(y, style)`` from the result; everything around that (tiling,
+    normalisation, flow dynamics) stays on the Cellpose code path.
+
+    Images smaller than one tile reach the net unpadded; the static graph
+    cannot take them, so those calls go to the original torch network.
+    """
+
+    def __init__(self, path: str, torch_net=None, threads: int = 0) -> None:
+        import onnxruntime as ort
+        import torch
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = threads or torch.get_num_threads()
+        options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.path = path
+        self.input_shape = tuple(self.session.get_inputs()[0].shape[1:])
+        self.torch_net = torch_net
+        if torch_net is not None:
+            # Sub-tile inputs run through it; BatchNorm must use its running stats.
+            torch_net.eval()
+
+        self.device = torch.device("cpu")
+        self.dtype = torch.float32
+        self.mkldnn = False
+        for attr in NET_ATTRIBUTES:
+            if torch_net is not None and hasattr(torch_net, attr):
+                setattr(self, attr, getattr(torch_net, attr))
+
+    def eval(self):
+        if self.torch_net is not None:
+            self.torch_net.eval()
+        return self
+
+    def to(self, *args, **kwargs):
+        return self
+
+    def __call__(self, x):
+        import torch
+
+        if tuple(x.shape[1:]) != self.input_shape and self.torch_net is not None:
+            with torch.no_grad():
+                return self.torch_net(x if isinstance(x, torch.Tensor) else torch.from_numpy(np.asarray(x)))[:2]
+
+        array = x.detach().cpu().numpy() if isinstance(x, torch.Tensor) else np.asarray(x)
+        array = array.astype(np.float32, copy=False)
+        # The graph takes one tile at a time; ORT parallelises within each tile.
+        outputs = [self.session.run(None, {"x": array[i:i + 1]}) for i in range(array.shape[0])]
+        y = np.concatenate([out[0] for out in outputs])
+        style = np.concatenate([out[1] for out in outputs])
+        return torch.from_numpy(y), torch.from_numpy(style)
+
+
+def attach_onnx_engine(model, model_path: str, quantize: bool = False, tile: int = 224,
+                       export_dir: Optional[str] = None, threads: int = 0):
+    """Swaps a loaded CellposeModel's torch network for an ONNX Runtime session."""
+    path = ensure_onnx(model.net, model_path, quantize, tile, export_dir)
+    model.net = OnnxNet(path, model.net, threads)
+    return model
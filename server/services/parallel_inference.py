@@ -0,0 +1,87 @@
+import multiprocessing
+import os
+import queue
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import List, Optional
+
+import numpy as np
+
+
+_worker_model = None
+
+
+def _core_slices(workers: int, cores_per_worker: int) -> List[Optional[List[int]]]:
+    """Splits the cores this process may use into one slice per worker."""
+    if not hasattr(os, "sched_getaffinity"):
+        return [None] * workers
+    cores = sorted(os.sched_getaffinity(0))
+    slices = []
+    for i in range(workers):
+        start = (i * cores_per_worker) % len(cores)
+        slices.append([cores[(start + j) % len(cores)] for j in range(min(cores_per_worker, len(cores)))])
+    return slices
+
+
+def _init_worker(model_path: str, threads: int, core_slices, engine_kwargs: dict) -> None:
+    """Pins the worker to its cores, sizes torch's thread pools and loads the model once."""
+    global _worker_model
+
+    try:
+        cores = core_slices.get_nowait()
+    except queue.Empty:
+        cores = None
+    if cores and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+
+    # Must be set before torch spins up its OpenMP pool.
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ[var] = str(threads)
+    import torch
+    torch.set_num_threads(threads)
+    torch.set_num_interop_threads(1)
+
+    from services.cellpose_runner import load_cellpose_model
+    _worker_model = load_cellpose_model(model_path, **engine_kwargs)
+
+
+def _segment_in_worker(imgs: List[np.ndarray], eval_kwargs: dict, options: dict) -> list:
+    from services.cellpose_runner import segment_images
+    return segment_images(_worker_model, imgs, eval_kwargs, options)
+
+
+def _segment_tile_in_worker(tile: np.ndarray, eval_kwargs: dict) -> np.ndarray:
+    from services.cellpose_runner import segment_image
+    return segment_image(_worker_model, tile, eval_kwargs)
+
+
+class ParallelSegmenter:
+    """
+    Per-job pool of segmentation processes.
+
+    Each of the ``workers`` processes is pinned to ``cores_per_worker`` cores,
+    runs torch with that many intra-op threads and keeps its own copy of the
+    model, so images are segmented on all cores at once.
+    """
+
+    def __init__(self, model_path: str, workers: int, cores_per_worker: int, engine_kwargs: Optional[dict] = None) -> None:
+        self.workers = workers
+        ctx = multiprocessing.get_context("spawn")
+        core_slices = ctx.Queue()
+        for cores in _core_slices(workers, cores_per_worker):
+            core_slices.put(cores)
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=ctx,
+            initializer=_init_worker,
+            initargs=(model_path, cores_per_worker, core_slices, engine_kwargs or {}),
+        )
+
+    def submit(self, imgs: List[np.ndarray], eval_kwargs: dict, options: dict) -> Future:
+        return self._executor.submit(_segment_in_worker, imgs, eval_kwargs, options)
+
+    def submit_tile(self, tile: np.ndarray, eval_kwargs: dict) -> Future:
+        """Segments one tile of a large image; the future yields its label mask."""
+        return self._executor.submit(_segment_tile_in_worker, tile, eval_kwargs)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,98 @@
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable, List
+
+from flask import current_app, has_app_context
+
+
+def _with_app_context(fn: Callable) -> Callable:
+    """Wraps ``fn`` so it runs inside the caller's app context on any thread."""
+    if not has_app_context():
+        return fn
+    app = current_app._get_current_object()
+
+    def wrapped(*args):
+        with app.app_context():
+            return fn(*args)
+
+    return wrapped
+
+
+class StagedPipeline:
+    """
+    Three-stage pipeline: load -> process -> store.
+
+    ``load`` (e.g. GridFS read + decode) runs in a thread pool up to
+    ``prefetch`` items ahead of ``process`` (e.g. the model), which runs on
+    the calling thread in item order. ``store`` (e.g. PNG encode + GridFS
+    write) runs in a second thread pool; at most ``max_pending_stores`` items
+    may wait there before ``process`` blocks, so memory stays bounded by
+    ``prefetch + max_pending_stores + 1`` items.
+
+    ``run`` returns the store results in item order and re-raises the first
+    exception from any stage.
+    """
+
+    def __init__(
+        self,
+        load: Callable[[Any], Any],
+        process: Callable[[Any], Any],
+        store: Callable[[Any, Any], Any],
+        prefetch: int = 2,
+        load_workers: int = 2,
+        store_workers: int = 2,
+        max_pending_stores: int = 4,
+    ) -> None:
+        self.load = _with_app_context(load)
+        self.process = process
+        self.store = _with_app_context(store)
+        self.prefetch = max(1, prefetch)
+        self.load_workers = max(1, load_workers)
+        self.store_workers = max(1, store_workers)
+        self.max_pending_stores = max(1, max_pending_stores)
+
+    def run(self, items: Iterable[Any]) -> List[Any]:
+        items = list(items)
+        results: List[Any] = [None] * len(items)
+        errors: List[BaseException] = []
+        store_slots = threading.BoundedSemaphore(self.max_pending_stores)
+
+        def release_slot(future):
+            if future.exception() is not None:
+                errors.append(future.exception())
+            store_slots.release()
+
+        with ThreadPoolExecutor(self.load_workers, thread_name_prefix="pipeline-load") as loaders, \
+                ThreadPoolExecutor(self.store_workers, thread_name_prefix="pipeline-store") as storers:
+            upcoming = iter(enumerate(items))
+            pending_loads = deque()
+            store_futures = []
+
+            def fill():
+                while len(pending_loads) < self.prefetch:
+                    try:
+                        index, item = next(upcoming)
+                    except StopIteration:
+                        return
+                    pending_loads.append((index, loaders.submit(self.load, item)))
+
+            fill()
+            while pending_loads:
+                if errors:
+                    raise errors[0]
+                index, load_future = pending_loads.popleft()
+                loaded = load_future.result()
+                fill()
+
+                output = self.process(loaded)
+
+                store_slots.acquire()  # backpressure on the store stage
+                store_future = storers.submit(self.store, loaded, output)
+                store_future.add_done_callback(release_slot)
+                store_futures.append((index, store_future))
+
+            for index, store_future in store_futures:
+                results[index] = store_future.result()
+
+        return results
@@ -0,0 +1,150 @@
+import datetime
+import json
+import time
+from typing import Any, Dict, Iterator, Optional
+
+from bson.objectid import ObjectId
+from pymongo.errors import OperationFailure
+
+
+# Fields pushed to clients; results are never sent over the stream.
+STATE_FIELDS = ("status", "progress", "notes", "finished_at", "model_id", "dataset_id", "preview")
+TERMINAL_STATUSES = ("completed", "failed")
+
+
+def _jsonable(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    if isinstance(value, dict):
+        return {k: _jsonable(v) for k, v in value.items()}
+    return value
+
+
+def compact_state(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """The part of an inference document a progress view needs."""
+    state = {"inference_id": str(doc["_id"])}
+    for field in STATE_FIELDS:
+        if field in doc:
+            state[field] = _jsonable(doc[field])
+    return state
+
+
+def sse_event(data: Dict[str, Any], event: str = "inference") -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class InferenceStream:
+    """
+    Server-Sent Events feed of status / progress changes of one user's
+    inferences, or of a single inference.
+
+    Changes come from a MongoDB change stream whose events are projected
+    down to ``STATE_FIELDS`` on the server, so checkpointed results never
+    travel to the web node. Without a replica set (change streams are
+    unavailable) the stream polls the same projection instead. An event is
+    only sent when an inference's compact state actually changed.
+    """
+
+    def __init__(self, db, user_id: str, inference_id: Optional[ObjectId] = None,
+                 heartbeat: float = 15, max_seconds: float = 300, poll_interval: float = 2) -> None:
+        self.db = db
+        self.user_id = ObjectId(user_id)
+        self.inference_id = inference_id
+        self.heartbeat = heartbeat
+        self.max_seconds = max_seconds
+        self.poll_interval = poll_interval
+        self._sent: Dict[str, Dict[str, Any]] = {}
+
+    def _query(self) -> Dict[str, Any]:
+        if self.inference_id is not None:
+            return {"_id": self.inference_id, "requested_by": self.user_id}
+        return {"requested_by": self.user_id, "archived": {"$ne": True}}
+
+    def _poll_query(self) -> Dict[str, Any]:
+        query = self._query()
+        if self.inference_id is None:
+            query["$or"] = [
+                {"status": {"$nin": list(TERMINAL_STATUSES)}},
+                {"_id": {"$in": [ObjectId(i) for i in self._sent]}},
+            ]
+        return query
+
+    def _projection(self, prefix: str = "") -> Dict[str, int]:
+        return {f"{prefix}{field}": 1 for field in ("_id",) + STATE_FIELDS}
+
+    def _delta(self, doc: Dict[str, Any]) -> Optional[str]:
+        state = compact_state(doc)
+        if self._sent.get(state["inference_id"]) == state:
+            return None
+        self._sent[state["inference_id"]] = state
+        return sse_event(state)
+
+    def _finished(self) -> bool:
+        """A single-inference stream closes once the job is done."""
+        if self.inference_id is None:
+            return False
+        state = self._sent.get(str(self.inference_id))
+        return bool(state) and state.get("status") in TERMINAL_STATUSES
+
+    def _snapshot(self) -> Iterator[str]:
+        query = self._query()
+        if self.inference_id is None:
+            # Clients reconnect every max_seconds; resend only what can still change.
+            query["status"] = {"$nin": list(TERMINAL_STATUSES)}
+        for doc in self.db.inferences.find(query, self._projection()):
+            event = self._delta(doc)
+            if event:
+                yield event
+
+    def _watch(self):
+        match = {"operationType": {"$in": ["insert", "update", "replace"]}}
+        if self.inference_id is not None:
+            match["documentKey._id"] = self.inference_id
+        match["fullDocument.requested_by"] = self.user_id
+        pipeline = [
+            {"$match": match},
+            {"$project": {"operationType": 1, **self._projection("fullDocument.")}},
+        ]
+        # try_next() waits up to a second on the server for the next change.
+        return self.db.inferences.watch(pipeline, full_document="updateLookup", max_await_time_ms=1000)
+
+    def events(self) -> Iterator[str]:
+        # Reconnect delay for the browser's EventSource, in milliseconds.
+        yield f"retry: {int(self.poll_interval * 1000)}\n\n"
+        try:
+            stream = self._watch()
+        except OperationFailure:
+            stream = None  # standalone server: change streams need a replica set
+
+        yield from self._snapshot()
+        if self._finished():
+            return
+
+        deadline = time.monotonic() + self.max_seconds
+        last_sent = time.monotonic()
+        try:
+            while time.monotonic() < deadline:
+                if stream is not None:
+                    change = stream.try_next()
+                    docs = [change["fullDocument"]] if change and change.get("fullDocument") else []
+                else:
+                    docs = list(self.db.inferences.find(self._poll_query(), self._projection()))
+
+                for doc in docs:
+                    event = self._delta(doc)
+                    if event:
+                        last_sent = time.monotonic()
+                        yield event
+                if self._finished():
+                    return
+
+                if time.monotonic() - last_sent >= self.heartbeat:
+                    last_sent = time.monotonic()
+                    yield ": keep-alive\n\n"
+                if stream is None:
+                    time.sleep(self.poll_interval)
+        finally:
+            if stream is not None:
+                stream.close()
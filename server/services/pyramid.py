@@ -0,0 +1,371 @@
+import contextlib
+import datetime
+import io
+import math
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from bson.objectid import ObjectId
+from flask import current_app
+from pymongo.errors import DuplicateKeyError
+from PIL import Image, PngImagePlugin
+
+from services.colorize import display_range, to_class_rgb, to_display_rgb, to_instance_rgb
+from services.image_reader import open_image
+
+# Class / instance renderings of a label mask, applied band by band.
+LABEL_VIEWS = {
+    "class": to_class_rgb,
+    "instance": to_instance_rgb,
+}
+# Pixels sampled to pick the display range of a source image.
+RANGE_SAMPLE_PIXELS = 1 << 20
+
+# (width, height, read rows [y0, y1) as uint8 RGB, is a mask)
+Reader = Tuple[int, int, Callable[[int, int], np.ndarray], bool]
+
+
+class PyramidPending(RuntimeError):
+    """Raised when another request or worker is still building the pyramid."""
+
+
+def pyramid_options() -> Dict[str, Any]:
+    """``build_pyramid`` options from the app config."""
+    return {
+        "build_timeout": current_app.config["PYRAMID_BUILD_TIMEOUT"],
+        "tile_size": current_app.config["PYRAMID_TILE_SIZE"],
+        "thumbnail_size": current_app.config["THUMBNAIL_SIZE"],
+        "image_format": current_app.config["PYRAMID_IMAGE_FORMAT"],
+        "compress_level": current_app.config["PNG_COMPRESS_LEVEL"],
+        "spool_min_bytes": current_app.config["IMAGE_SPOOL_MIN_BYTES"],
+        "spool_dir": current_app.config["IMAGE_SPOOL_DIR"],
+    }
+
+
+def _pyramid_key(file_id, view: Optional[str], plane: int) -> Dict[str, Any]:
+    return {"metadata.pyramid_of": str(file_id), "metadata.view": view, "metadata.plane": plane}
+
+
+def _descriptor_key(file_id, view: Optional[str], plane: int) -> Dict[str, Any]:
+    return {"file_id": str(file_id), "view": view, "plane": plane}
+
+
+def _claim(db, key: Dict[str, Any], build_timeout: float) -> Optional[Tuple[ObjectId, bool]]:
+    """
+    Claims the build of a pyramid by inserting its descriptor as "building"
+    (unique per file / view / plane). A claim older than ``build_timeout``
+    belongs to a builder that died and is taken over. Returns (claim id,
+    taken over) or None when another builder holds the claim.
+    """
+    now = datetime.datetime.utcnow()
+    claim_id = ObjectId()
+    try:
+        db.pyramids.insert_one({**key, "status": "building", "claim": claim_id, "claimed_at": now})
+        return claim_id, False
+    except DuplicateKeyError:
+        pass
+    taken = db.pyramids.update_one(
+        {**key, "status": "building", "claimed_at": {"$lt": now - datetime.timedelta(seconds=build_timeout)}},
+        {"$set": {"claim": claim_id, "claimed_at": now}},
+    )
+    return (claim_id, True) if taken.matched_count else None
+
+
+def level_count(width: int, height: int, tile_size: int) -> int:
+    """Levels from full resolution (0) down to the first one that fits in a single tile."""
+    levels = 1
+    while max(width, height) > tile_size:
+        width, height = max(1, width // 2), max(1, height // 2)
+        levels += 1
+    return levels
+
+
+def _level_sizes(width: int, height: int, levels: int) -> List[Tuple[int, int]]:
+    sizes = [(width, height)]
+    for _ in range(levels - 1):
+        width, height = sizes[-1]
+        sizes.append((max(1, width // 2), max(1, height // 2)))
+    return sizes
+
+
+def _resolve(grid_out, view: Optional[str], plane: int) -> Tuple[Optional[str], int]:
+    """Normalised (view, plane) of a pyramid: views only exist for label masks, planes for source images."""
+    metadata = grid_out.metadata or {}
+    if metadata.get("type") == "mask_label":
+        view = view or "instance"
+        if view not in LABEL_VIEWS:
+            raise ValueError(f"Unknown mask view '{view}'. Available: {list(LABEL_VIEWS)}")
+        return view, 0
+    if metadata.get("type") not in (None, "image", "mask_class", "mask_instance"):
+        raise ValueError(f"No pyramid for {metadata.get('type')} files")
+    if view:
+        raise ValueError("Only label masks have views")
+    return None, 0 if metadata.get("type") in ("mask_class", "mask_instance") else plane
+
+
+def _open_reader(resources: contextlib.ExitStack, fs, grid_out, view: Optional[str], plane: int,
+                 spool_min_bytes: int, spool_dir: Optional[str]) -> Reader:
+    """
+    Row-band reader of what the viewer shows for a source image or mask
+    artifact; the image source it reads from is closed with ``resources``.
+    """
+    file_type = (grid_out.metadata or {}).get("type")
+    if file_type in ("mask_class", "mask_instance"):
+        # PNG has no random access, so the rendering is decoded once, as 8-bit
+        # palette indices. It is our own artifact: Pillow's decompression-bomb
+        # limit (Image.open) is meant for untrusted uploads and is skipped.
+        img = PngImagePlugin.PngImageFile(io.BytesIO(grid_out.read()))
+        img.load()
+        return img.width, img.height, lambda y0, y1: np.asarray(img.crop((0, y0, img.width, y1)).convert("RGB")), True
+
+    if file_type == "mask_label":
+        # Wide (TIFF) labels are spooled and memory-mapped rather than decoded into RAM.
+        source = resources.enter_context(open_image(fs, grid_out._id, spool_min_bytes=0, spool_dir=spool_dir))
+        height, width = source.shape[:2]
+        render = LABEL_VIEWS[view]
+        return width, height, lambda y0, y1: render(source.read_region((y0, y1, 0, width))), True
+
+    source = resources.enter_context(
+        open_image(fs, grid_out._id, spool_min_bytes=spool_min_bytes, spool_dir=spool_dir)
+    )
+    if not 0 <= plane < source.planes:
+        raise IndexError(f"Plane {plane} out of range for an image with {source.planes} planes")
+    height, width = source.shape[:2]
+    # One display range for the whole image, from a strided sample of the plane.
+    step = max(1, math.ceil(math.sqrt(height * width / RANGE_SAMPLE_PIXELS)))
+    sample = np.asarray(source.read_plane(plane)[::step, ::step])
+    value_range = None if sample.dtype == np.uint8 else display_range(sample)
+    return width, height, lambda y0, y1: to_display_rgb(source.read_region((y0, y1, 0, width), plane), value_range), False
+
+
+def _downsample(band: np.ndarray, is_mask: bool, level_size: Tuple[int, int]) -> np.ndarray:
+    """Halves a band of a level (nearest for masks, 2x2 mean for images); 1-pixel axes stay."""
+    fx = 2 if level_size[0] > 1 else 1
+    fy = 2 if level_size[1] > 1 else 1
+    rows, cols = band.shape[0] // fy, band.shape[1] // fx
+    band = band[:rows * fy, :cols * fx]
+    if is_mask:
+        return band[::fy, ::fx]
+    blocks = band.reshape(rows, fy, cols, fx, band.shape[2]).sum(axis=(1, 3), dtype=np.uint16)
+    return ((blocks + fx * fy // 2) // (fx * fy)).astype(np.uint8)
+
+
+def _encode(tile: np.ndarray, tile_format: str, compress_level: int) -> bytes:
+    bytes_io = io.BytesIO()
+    if tile_format == "png":
+        Image.fromarray(tile).save(bytes_io, format="PNG", compress_level=compress_level)
+    else:
+        Image.fromarray(tile).save(bytes_io, format="JPEG", quality=85)
+    return bytes_io.getvalue()
+
+
+class _PyramidWriter:
+    """
+    Streams full-resolution row bands into every level at once. Each level
+    keeps less than one tile row of pending pixels, so memory is bounded by
+    the image width times the tile size, whatever the image height.
+    """
+
+    def __init__(self, fs, file_id, base_metadata: dict, sizes, tile_size: int, is_mask: bool,
+                 tile_format: str, compress_level: int, thumbnail_level: int) -> None:
+        self.fs = fs
+        self.file_id = file_id
+        self.base_metadata = base_metadata
+        self.sizes = sizes
+        self.tile_size = tile_size
+        self.is_mask = is_mask
+        self.tile_format = tile_format
+        self.extension = "png" if tile_format == "png" else "jpg"
+        self.compress_level = compress_level
+        self.thumbnail_level = thumbnail_level
+        self.pending: List[Optional[np.ndarray]] = [None] * len(sizes)
+        self.tile_rows = [0] * len(sizes)
+        self.thumbnail_bands: List[np.ndarray] = []
+        self.written: List[Any] = []
+
+    def feed(self, level: int, band: np.ndarray) -> None:
+        pending = self.pending[level]
+        rows = band if pending is None else np.concatenate([pending, band])
+        while rows.shape[0] >= self.tile_size:
+            self._emit(level, rows[:self.tile_size])
+            rows = rows[self.tile_size:]
+        self.pending[level] = rows
+
+    def finish(self) -> None:
+        # Flushing a level feeds the next one, so go top-down through the levels.
+        for level in range(len(self.sizes)):
+            rows = self.pending[level]
+            if rows is not None and rows.shape[0]:
+                self._emit(level, rows)
+            self.pending[level] = None
+
+    def _emit(self, level: int, rows: np.ndarray) -> None:
+        tile_y = self.tile_rows[level]
+        self.tile_rows[level] += 1
+        for x in range(0, rows.shape[1], self.tile_size):
+            tile_x = x // self.tile_size
+            self.written.append(self.fs.put(
+                _encode(np.ascontiguousarray(rows[:, x:x + self.tile_size]), self.tile_format, self.compress_level),
+                filename=f"tile_{self.file_id}_{level}_{tile_x}_{tile_y}.{self.extension}",
+                metadata={**self.base_metadata, "type": "tile", "level": level, "x": tile_x, "y": tile_y},
+            ))
+        if level == self.thumbnail_level:
+            self.thumbnail_bands.append(rows)
+        if level + 1 < len(self.sizes):
+            self.feed(level + 1, _downsample(rows, self.is_mask, self.sizes[level]))
+
+
+def build_pyramid(db, fs, file_id, view: Optional[str] = None, plane: int = 0, tile_size: int = 256,
+                  thumbnail_size: int = 256, image_format: str = "jpeg", compress_level: int = 6,
+                  spool_min_bytes: int = 32 * 1024 ** 2, spool_dir: Optional[str] = None,
+                  build_timeout: float = 600) -> Dict[str, Any]:
+    """
+    Stores a thumbnail and a tile pyramid of a source image or mask artifact
+    in GridFS and returns its descriptor.
+
+    Level 0 is full resolution; each further level halves the size until the
+    image fits in one tile. Tiles are ``tile_size`` squares (smaller at the
+    right / bottom edges), each a GridFS file tagged with
+    ``pyramid_of / view / plane / level / x / y``; label masks get one
+    pyramid per ``view``. The source is read in row bands, so large images
+    never sit in memory whole.
+
+    The descriptor lives in ``db.pyramids``: it is inserted as "building"
+    before any tile is written, so concurrent callers raise PyramidPending
+    instead of building the same pyramid twice, and marked "ready" once the
+    thumbnail is stored. A failed build removes its tiles and its claim.
+    """
+    grid_out = fs.get(ObjectId(file_id))
+    view, plane = _resolve(grid_out, view, plane)
+    existing = get_pyramid(db, file_id, view, plane)
+    if existing is not None:
+        return existing
+
+    key = _descriptor_key(file_id, view, plane)
+    claim = _claim(db, key, build_timeout)
+    if claim is None:
+        existing = get_pyramid(db, file_id, view, plane)
+        if existing is not None:
+            return existing
+        raise PyramidPending(f"Pyramid of {file_id} is being built")
+    claim_id, taken_over = claim
+    if taken_over:
+        # Tiles left behind by the builder whose claim expired
+        for stale in fs.find(_pyramid_key(file_id, view, plane)):
+            fs.delete(stale._id)
+
+    tile_size = max(2, tile_size - tile_size % 2)  # bands must halve evenly
+    with contextlib.ExitStack() as resources:
+        width, height, read_rows, is_mask = _open_reader(
+            resources, fs, grid_out, view, plane, spool_min_bytes, spool_dir
+        )
+        tile_format = "png" if is_mask or image_format == "png" else "jpeg"
+        levels = level_count(width, height, tile_size)
+        sizes = _level_sizes(width, height, levels)
+        # Smallest level still at least as large as the thumbnail (under twice its size).
+        thumbnail_level = max([level for level, size in enumerate(sizes) if max(size) >= thumbnail_size], default=0)
+
+        writer = _PyramidWriter(
+            fs, file_id, {"pyramid_of": str(file_id), "view": view, "plane": plane},
+            sizes, tile_size, is_mask, tile_format, compress_level, thumbnail_level,
+        )
+        try:
+            for y0 in range(0, height, tile_size):
+                writer.feed(0, read_rows(y0, min(y0 + tile_size, height)))
+            writer.finish()
+
+            thumbnail = Image.fromarray(np.concatenate(writer.thumbnail_bands))
+            thumbnail.thumbnail((thumbnail_size, thumbnail_size), Image.NEAREST if is_mask else Image.BILINEAR)
+            descriptor = {
+                "width": width,
+                "height": height,
+                "tile_size": tile_size,
+                "levels": levels,
+                "format": tile_format,
+                "view": view,
+                "plane": plane,
+            }
+            thumbnail_id = fs.put(
+                _encode(np.asarray(thumbnail), tile_format, compress_level),
+                filename=f"thumb_{file_id}.{writer.extension}",
+                metadata={**writer.base_metadata, "type": "thumbnail"},
+            )
+            writer.written.append(thumbnail_id)
+            descriptor["thumbnail_id"] = str(thumbnail_id)
+            ready = db.pyramids.update_one(
+                {**key, "claim": claim_id},
+                {"$set": {**descriptor, "status": "ready", "built_at": datetime.datetime.utcnow()},
+                 "$unset": {"claim": "", "claimed_at": ""}},
+            )
+            if not ready.matched_count:
+                raise PyramidPending(f"Build of the pyramid of {file_id} was taken over")
+        except BaseException:
+            for tile_id in writer.written:
+                fs.delete(tile_id)
+            db.pyramids.delete_one({**key, "claim": claim_id})
+            raise
+    return descriptor
+
+
+def get_pyramid(db, file_id, view: Optional[str] = None, plane: int = 0) -> Optional[Dict[str, Any]]:
+    """Descriptor of a finished pyramid, or None."""
+    return db.pyramids.find_one(
+        {**_descriptor_key(file_id, view, plane), "status": "ready"},
+        {"_id": 0, "file_id": 0, "status": 0, "built_at": 0},
+    )
+
+
+def ensure_pyramid(db, fs, file_id, view: Optional[str] = None, plane: int = 0, **options) -> Dict[str, Any]:
+    """Descriptor of a file's pyramid, building it when no worker did (see ``build_result_pyramids``)."""
+    return get_pyramid(db, file_id, view, plane) or build_pyramid(db, fs, file_id, view, plane, **options)
+
+
+def build_result_pyramids(db, fs, inference: Dict[str, Any], **options) -> int:
+    """
+    Builds the pyramids the viewer needs for a completed inference: source
+    images (per plane), class / instance masks and both views of label
+    masks. Failures are logged and skipped. Returns the number built.
+    """
+    targets = []
+    for result in inference.get("results", []):
+        if result.get("source_image_gridfs_id"):
+            targets.append((result["source_image_gridfs_id"], None, result.get("plane") or 0))
+        artifacts = result.get("artifacts") or [
+            {"kind": f"{view}_mask", "gridfs_id": result[f"{view}_mask_id"]}
+            for view in ("class", "instance") if result.get(f"{view}_mask_id")
+        ]
+        for artifact in artifacts:
+            if artifact.get("kind") in ("class_mask", "instance_mask"):
+                targets.append((artifact["gridfs_id"], None, 0))
+            elif artifact.get("kind") == "label_mask":
+                targets.extend((artifact["gridfs_id"], view, 0) for view in LABEL_VIEWS)
+
+    built = 0
+    for file_id, view, plane in targets:
+        if get_pyramid(db, file_id, view, plane) is not None:
+            continue
+        try:
+            build_pyramid(db, fs, file_id, view, plane, **options)
+            built += 1
+        except PyramidPending:
+            continue
+        except Exception as e:
+            current_app.logger.warning(f"Pyramid of {file_id} not built: {e}")
+    return built
+
+
+def get_tile(fs, file_id, level: int, x: int, y: int, view: Optional[str] = None, plane: int = 0):
+    return fs.find_one({
+        **_pyramid_key(file_id, view, plane),
+        "metadata.type": "tile",
+        "metadata.level": level,
+        "metadata.x": x,
+        "metadata.y": y,
+    })
+
+
+def delete_pyramids(db, fs, file_id) -> None:
+    """Removes every tile, thumbnail and descriptor built for a file (all views and planes)."""
+    for stored in fs.find({"metadata.pyramid_of": str(file_id)}):
+        fs.delete(stored._id)
+    db.pyramids.delete_many({"file_id": str(file_id)})
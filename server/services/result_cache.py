@@ -0,0 +1,115 @@
+import copy
+import datetime
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from bson.objectid import ObjectId
+
+
+# Params that change how a job runs but not what it produces.
+EXECUTION_ONLY_PARAMS = {
+    "execution_mode", "batch_size", "images_per_batch", "mode", "source_inference_id", "use_cache", "pipeline",
+    "workers", "cores_per_worker",
+}
+
+_weights_versions: Dict[Tuple[str, float, int], str] = {}
+_weights_lock = threading.Lock()
+
+
+def weights_version(model_path: str) -> str:
+    """
+    SHA-256 of the model weights, memoized by (path, mtime, size) so it is
+    hashed once per process and again only when the file changes.
+    """
+    stat = os.stat(model_path)
+    memo_key = (model_path, stat.st_mtime, stat.st_size)
+    with _weights_lock:
+        if memo_key not in _weights_versions:
+            digest = hashlib.sha256()
+            with open(model_path, "rb") as f:
+                for block in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(block)
+            _weights_versions[memo_key] = digest.hexdigest()
+        return _weights_versions[memo_key]
+
+
+def normalize_params(params: Dict[str, Any]) -> str:
+    """Canonical JSON of the params that affect segmentation output."""
+    relevant = {k: v for k, v in params.items() if k not in EXECUTION_ONLY_PARAMS}
+    return json.dumps(relevant, sort_keys=True, default=str)
+
+
+class ResultCache:
+    """
+    Cache of per-image results keyed by (source SHA-256, model id, weights
+    version, normalized params). Entries point at existing GridFS artifacts,
+    which are reused as-is on a hit.
+    """
+
+    def __init__(self, db, fs, model_id: str, version: str, params_key: str) -> None:
+        self.db = db
+        self.fs = fs
+        self.model_id = model_id
+        self.version = version
+        self.params_key = params_key
+        self.hits = 0
+        self.misses = 0
+        self._counter_lock = threading.Lock()
+
+    def _key(self, source_sha256: str) -> Dict[str, str]:
+        return {
+            "source_sha256": source_sha256,
+            "model_id": self.model_id,
+            "weights_version": self.version,
+            "params": self.params_key,
+        }
+
+    def invalidate_stale(self) -> int:
+        """Drops entries produced by other versions of this model's weights."""
+        result = self.db.result_cache.delete_many(
+            {"model_id": self.model_id, "weights_version": {"$ne": self.version}}
+        )
+        return result.deleted_count
+
+    def lookup(self, source_sha256: str) -> Optional[Dict[str, Any]]:
+        entry = self.db.result_cache.find_one(self._key(source_sha256))
+        if entry is not None:
+            artifact_ids = [a["gridfs_id"] for a in entry["result"].get("artifacts", [])]
+            if all(self.fs.exists(ObjectId(gf)) for gf in artifact_ids):
+                with self._counter_lock:
+                    self.hits += 1
+                return copy.deepcopy(entry["result"])
+            # An artifact was deleted underneath us; the entry is useless.
+            self.db.result_cache.delete_one({"_id": entry["_id"]})
+
+        with self._counter_lock:
+            self.misses += 1
+        return None
+
+    def store(self, source_sha256: str, result: Dict[str, Any]) -> None:
+        cached = {k: v for k, v in result.items() if k not in ("source_filename", "source_image_gridfs_id")}
+        self.db.result_cache.update_one(
+            self._key(source_sha256),
+            {"$set": {"result": cached, "created_at": datetime.datetime.utcnow()}},
+            upsert=True,
+        )
+
+    def record_stats(self) -> Dict[str, int]:
+        """Adds this job's counters to the persistent per-model totals."""
+        stats = {"hits": self.hits, "misses": self.misses}
+        self.db.result_cache_stats.update_one(
+            {"_id": self.model_id}, {"$inc": stats}, upsert=True
+        )
+        return stats
+
+
+def forget_artifact(db, gridfs_id: str) -> None:
+    """Removes cache entries that point at an artifact about to be deleted."""
+    db.result_cache.delete_many({"result.artifacts.gridfs_id": str(gridfs_id)})
+
+
+def source_sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
@@ -0,0 +1,140 @@
+import os
+import tempfile
+from collections import deque
+from typing import Callable, List, Tuple
+
+import numpy as np
+
+
+Box = Tuple[int, int, int, int]  # (y0, y1, x0, x1)
+
+
+def tile_grid(height: int, width: int, tile_size: int, overlap: int) -> List[Tuple[Box, Box]]:
+    """
+    Overlapping tiles covering an image, each paired with its core box.
+
+    Cores are the tiles shrunk by half the overlap on every interior side, so
+    they partition the image exactly: every pixel (and therefore every cell
+    centroid) belongs to one core.
+    """
+    stride = max(1, tile_size - overlap)
+
+    def spans(length):
+        starts = list(range(0, max(length - tile_size, 0) + 1, stride))
+        if starts[-1] + tile_size < length:
+            starts.append(length - tile_size)
+        out = []
+        for i, start in enumerate(starts):
+            end = min(start + tile_size, length)
+            core_start = 0 if i == 0 else (starts[i - 1] + tile_size + start) // 2
+            core_end = length if i == len(starts) - 1 else (end + starts[i + 1]) // 2
+            out.append((start, end, core_start, core_end))
+        return out
+
+    tiles = []
+    for y0, y1, cy0, cy1 in spans(height):
+        for x0, x1, cx0, cx1 in spans(width):
+            tiles.append(((y0, y1, x0, x1), (cy0, cy1, cx0, cx1)))
+    return tiles
+
+
+def is_blank(tile: np.ndarray, threshold: float) -> bool:
+    """True when a tile's intensity range is too flat to contain any cells."""
+    return float(tile.max()) - float(tile.min()) <= threshold
+
+
+def stitch_tile(labels: np.ndarray, tile_masks: np.ndarray, box: Box, core: Box, next_label: int) -> int:
+    """
+    Copies the cells of one tile into the global label image.
+
+    A cell is kept only by the tile whose core contains its centroid, so cells
+    cut by a seam are taken whole from the neighbouring tile instead of being
+    duplicated or split. Returns the next free global label.
+    """
+    y0, y1, x0, x1 = box
+    cy0, cy1, cx0, cx1 = core
+
+    n = int(tile_masks.max())
+    if n == 0:
+        return next_label
+
+    flat = tile_masks.ravel().astype(np.int64, copy=False)
+    counts = np.bincount(flat, minlength=n + 1)
+    rows, cols = np.divmod(np.arange(flat.size), tile_masks.shape[1])
+    sum_y = np.bincount(flat, weights=rows, minlength=n + 1)
+    sum_x = np.bincount(flat, weights=cols, minlength=n + 1)
+
+    present = counts > 0
+    present[0] = False
+    with np.errstate(invalid="ignore", divide="ignore"):
+        centroid_y = sum_y / counts + y0
+        centroid_x = sum_x / counts + x0
+    keep = present & (centroid_y >= cy0) & (centroid_y < cy1) & (centroid_x >= cx0) & (centroid_x < cx1)
+
+    relabel = np.zeros(n + 1, dtype=labels.dtype)
+    kept = np.flatnonzero(keep)
+    relabel[kept] = np.arange(next_label, next_label + len(kept), dtype=labels.dtype)
+
+    region = labels[y0:y1, x0:x1]
+    new = relabel[tile_masks]
+    write = (new > 0) & (region == 0)
+    region[write] = new[write]
+    return next_label + len(kept)
+
+
+def allocate_labels(height: int, width: int, memmap_pixels: int):
+    """Global label image; spilled to a temporary memory-mapped file when large."""
+    if height * width < memmap_pixels:
+        return np.zeros((height, width), dtype=np.uint32)
+    fd, path = tempfile.mkstemp(suffix=".npy")
+    os.close(fd)
+    labels = np.lib.format.open_memmap(path, mode="w+", dtype=np.uint32, shape=(height, width))
+    os.unlink(path)  # freed once the mapping is closed
+    return labels
+
+
+def segment_tiled(
+    read_region: Callable[[Box], np.ndarray],
+    shape: Tuple[int, int],
+    segment: Callable[[np.ndarray], object],
+    tile_size: int = 2048,
+    overlap: int = 128,
+    blank_threshold: float = 0.0,
+    max_in_flight: int = 1,
+    memmap_pixels: int = 64 * 1024 ** 2,
+) -> np.ndarray:
+    """
+    Segments an image tile by tile and stitches the instance labels.
+
+    ``read_region(box)`` returns the pixels of one tile, so the full image
+    never needs to be held by the network. Decode memory is only bounded
+    when ``read_region`` is: TIFF planes (``image_reader.PlaneView``) read
+    just the tile, while PNG / JPEG inputs are already decoded whole. ``segment(tile)`` returns the
+    tile's label mask, or a future of it to segment up to ``max_in_flight``
+    tiles concurrently. Blank tiles are skipped without running the model.
+    """
+    height, width = shape
+    labels = allocate_labels(height, width, memmap_pixels)
+    next_label = 1
+
+    pending = deque()
+
+    def drain(limit):
+        nonlocal next_label
+        while len(pending) > limit:
+            box, core, result = pending.popleft()
+            tile_masks = result.result() if hasattr(result, "result") else result
+            next_label = stitch_tile(labels, np.asarray(tile_masks), box, core, next_label)
+
+    skipped = 0
+    for box, core in tile_grid(height, width, tile_size, overlap):
+        tile = read_region(box)
+        if is_blank(tile, blank_threshold):
+            skipped += 1
+            continue
+        pending.append((box, core, segment(tile)))
+        drain(max(0, max_in_flight - 1))
+    drain(0)
+
+    print(f"Tiled inference: {next_label - 1} cells, {skipped} blank tiles skipped")
+    return labels
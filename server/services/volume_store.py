@@ -0,0 +1,187 @@
+import io
+import mimetypes
+import struct
+import zlib
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from bson.objectid import ObjectId
+from PIL import Image
+
+from services.colorize import to_display_rgb
+from services.mask_render import RENDER_VIEWS, encode_label_mask
+
+
+VOLUME_KINDS = ("label_volume", "image_volume")
+
+
+def save_volume(fs, data: np.ndarray, filename: str, metadata: Optional[Dict[str, Any]] = None, level: int = 6):
+    """
+    Stores a (Z, ...) array as one GridFS file of independently
+    zlib-compressed slices, streamed slice by slice.
+
+    ``metadata.volume`` records shape, dtype and the byte offset of every
+    slice, so a single slice is read by seeking into the file; GridFS then
+    fetches only the chunks that slice spans.
+    """
+    data = np.asarray(data)
+    offsets = [0]
+    with fs.new_file(filename=filename) as grid_in:
+        for z in range(data.shape[0]):
+            piece = zlib.compress(np.ascontiguousarray(data[z]).tobytes(), level)
+            grid_in.write(piece)
+            offsets.append(offsets[-1] + len(piece))
+        grid_in.metadata = {
+            **(metadata or {}),
+            "volume": {
+                "shape": list(data.shape),
+                "dtype": data.dtype.str,
+                "codec": "zlib",
+                "offsets": offsets,
+            },
+        }
+    return grid_in._id
+
+
+def volume_info(grid_out) -> Dict[str, Any]:
+    info = (grid_out.metadata or {}).get("volume")
+    if not info:
+        raise ValueError(f"{grid_out.filename} is not a volume artifact")
+    return info
+
+
+def read_slice(fs, file_id, z: int) -> Tuple[np.ndarray, Dict[str, Any]]:
+    """Decodes slice ``z`` of a volume artifact; returns (slice, volume metadata)."""
+    grid_out = fs.get(ObjectId(file_id))
+    info = volume_info(grid_out)
+    depth = info["shape"][0]
+    if not 0 <= z < depth:
+        raise IndexError(f"Slice {z} out of range for a volume of depth {depth}")
+
+    start, end = info["offsets"][z], info["offsets"][z + 1]
+    grid_out.seek(start)
+    data = zlib.decompress(grid_out.read(end - start))
+    return np.frombuffer(data, dtype=np.dtype(info["dtype"])).reshape(info["shape"][1:]), grid_out.metadata
+
+
+def render_slice(fs, file_id, z: int, view: Optional[str] = None, compress_level: int = 6) -> Tuple[bytes, str]:
+    """
+    One slice as (bytes, mimetype). Label volumes render as the class /
+    instance ``view`` PNG; without a view the raw labels are sent as a
+    16-bit PNG, or as a 32-bit TIFF when the slice has ids above 65535.
+    Image volumes are scaled to 8-bit PNG for display.
+    """
+    slice_data, metadata = read_slice(fs, file_id, z)
+    if metadata.get("type") == "label_volume":
+        if view:
+            if view not in RENDER_VIEWS:
+                raise ValueError(f"Unknown mask view '{view}'. Available: {list(RENDER_VIEWS)}")
+            return RENDER_VIEWS[view](slice_data, compress_level), "image/png"
+        if slice_data.size and slice_data.max() <= np.iinfo(np.uint16).max:
+            slice_data = slice_data.astype(np.uint16)
+        data, extension = encode_label_mask(slice_data, compress_level)
+        return data, mimetypes.guess_type(f"slice.{extension}")[0] or "application/octet-stream"
+
+    bytes_io = io.BytesIO()
+    Image.fromarray(to_display_rgb(slice_data)).save(bytes_io, format="PNG", compress_level=compress_level)
+    return bytes_io.getvalue(), "image/png"
+
+
+# Downloads: volumes are shipped as multi-page TIFFs whose strips are the
+# stored zlib slices (TIFF compression 8, Adobe Deflate, is a zlib stream),
+# so an export is written slice by slice without decoding or recompressing.
+
+_SHORT, _LONG, _LONG8 = 3, 4, 16
+_SAMPLE_FORMATS = {"u": 1, "b": 1, "i": 2, "f": 3}
+_CLASSIC_TIFF_LIMIT = 2 ** 32
+
+
+def _tiff_tags(shape: List[int], dtype: np.dtype, big: bool, strip_offset: int, strip_size: int) -> list:
+    """(tag, type, values) of one page, stored as a single strip."""
+    height, width = shape[1], shape[2]
+    samples = shape[3] if len(shape) > 3 else 1
+    rgb = samples >= 3
+    extra = samples - (3 if rgb else 1)
+    offset_type = _LONG8 if big else _LONG
+    tags = [
+        (256, _LONG, [width]),
+        (257, _LONG, [height]),
+        (258, _SHORT, [dtype.itemsize * 8] * samples),
+        (259, _SHORT, [8]),
+        (262, _SHORT, [2 if rgb else 1]),
+        (273, offset_type, [strip_offset]),
+        (277, _SHORT, [samples]),
+        (278, _LONG, [height]),
+        (279, offset_type, [strip_size]),
+        (284, _SHORT, [1]),
+    ]
+    if extra:
+        tags.append((338, _SHORT, [0] * extra))
+    tags.append((339, _SHORT, [_SAMPLE_FORMATS.get(dtype.kind, 1)] * samples))
+    return tags
+
+
+def _tiff_ifd(tags: list, ifd_offset: int, next_ifd: int, big: bool, endian: str) -> bytes:
+    """One IFD at ``ifd_offset``; values that do not fit an entry follow it."""
+    formats = {_SHORT: "H", _LONG: "I", _LONG8: "Q"}
+    count_format, slot = ("Q", 8) if big else ("I", 4)
+    header_size = 8 if big else 2
+    ifd_size = header_size + len(tags) * (20 if big else 12) + slot
+    entries, overflow = [], b""
+    for tag, kind, values in tags:
+        data = struct.pack(f"{endian}{len(values)}{formats[kind]}", *values)
+        if len(data) <= slot:
+            value = data.ljust(slot, b"\0")
+        else:
+            value = struct.pack(f"{endian}{count_format}", ifd_offset + ifd_size + len(overflow))
+            overflow += data + b"\0" * (len(data) % 2)
+        entries.append(struct.pack(f"{endian}HH{count_format}", tag, kind, len(values)) + value)
+    count = struct.pack(f"{endian}{'Q' if big else 'H'}", len(tags))
+    return count + b"".join(entries) + struct.pack(f"{endian}{count_format}", next_ifd) + overflow
+
+
+def volume_tiff(fs, file_id) -> Tuple[int, Callable[[], Iterator[bytes]]]:
+    """
+    A volume artifact as a multi-page TIFF for downloads: (size in bytes,
+    producer of its chunks). Memory use is one compressed slice; BigTIFF is
+    used once the file would pass 4 GiB.
+    """
+    grid_out = fs.get(ObjectId(file_id))
+    info = volume_info(grid_out)
+    shape, dtype, offsets = info["shape"], np.dtype(info["dtype"]), info["offsets"]
+    depth = shape[0]
+    if not depth:
+        raise ValueError(f"{grid_out.filename} has no slices")
+    endian = ">" if dtype.byteorder == ">" else "<"
+    strips = [offsets[z + 1] - offsets[z] for z in range(depth)]
+
+    def layout(big: bool):
+        header = 16 if big else 8
+        ifd_size = len(_tiff_ifd(_tiff_tags(shape, dtype, big, 0, 0), 0, 0, big, endian))
+        ifds, position = [], header
+        for strip in strips:
+            ifds.append(position)
+            position += ifd_size + strip + strip % 2  # IFDs start on a word boundary
+        return header, ifd_size, ifds, position
+
+    big = False
+    header_size, ifd_size, ifds, size = layout(big)
+    if size >= _CLASSIC_TIFF_LIMIT:
+        big = True
+        header_size, ifd_size, ifds, size = layout(big)
+
+    def produce() -> Iterator[bytes]:
+        prefix = b"II" if endian == "<" else b"MM"
+        if big:
+            yield prefix + struct.pack(f"{endian}HHHQ", 43, 8, 0, ifds[0])
+        else:
+            yield prefix + struct.pack(f"{endian}HI", 42, ifds[0])
+        for z in range(depth):
+            strip_offset = ifds[z] + ifd_size
+            next_ifd = ifds[z + 1] if z + 1 < depth else 0
+            tags = _tiff_tags(shape, dtype, big, strip_offset, strips[z])
+            yield _tiff_ifd(tags, ifds[z], next_ifd, big, endian)
+            grid_out.seek(offsets[z])
+            yield grid_out.read(strips[z]) + b"\0" * (strips[z] % 2)
+
+    return size, produce
@@ -0,0 +1,80 @@
+import zipfile
+from typing import Callable, Iterable, Iterator, Optional, Tuple
+
+# Entries that are already compressed are stored as-is; deflating them again
+# costs CPU for no size gain.
+STORED_EXTENSIONS = (".png", ".jpg", ".jpeg", ".npz", ".tif", ".tiff", ".gz", ".zip")
+
+# (path inside the archive, size in bytes if known, callable returning the data chunks)
+ZipEntry = Tuple[str, Optional[int], Callable[[], Iterable[bytes]]]
+
+
+def gridfs_chunks(grid_out) -> Iterator[bytes]:
+    """A GridFS file chunk by chunk, as stored (no full read into memory)."""
+    while True:
+        chunk = grid_out.readchunk()
+        if not chunk:
+            return
+        yield chunk
+
+
+class _StreamBuffer:
+    """Write-only, unseekable sink; zipfile then writes data descriptors."""
+
+    def __init__(self) -> None:
+        self._parts = []
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def take(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
+
+
+def stream_zip(entries: Iterable[ZipEntry], date_time=(1980, 1, 1, 0, 0, 0),
+               on_error: Optional[Callable[[str, Exception], None]] = None) -> Iterator[bytes]:
+    """
+    Builds a ZIP archive on the fly, yielding it piece by piece as entries are
+    copied in. Memory use is bounded by one chunk per entry, whatever the size
+    of the archive.
+
+    An entry whose source cannot be opened is skipped (and reported through
+    ``on_error``) before its header is written.
+    """
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, "w", allowZip64=True) as zf:
+        for path, size, produce in entries:
+            try:
+                chunks = iter(produce())
+                first = next(chunks, b"")
+            except Exception as e:
+                if on_error:
+                    on_error(path, e)
+                continue
+
+            info = zipfile.ZipInfo(path, date_time=date_time)
+            stored = path.lower().endswith(STORED_EXTENSIONS)
+            info.compress_type = zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED
+            # Zip64 extra fields are only needed when the size may pass 4 GiB.
+            force_zip64 = size is None or size >= zipfile.ZIP64_LIMIT // 2
+
+            with zf.open(info, "w", force_zip64=force_zip64) as dest:
+                dest.write(first)
+                try:
+                    for chunk in chunks:
+                        dest.write(chunk)
+                        data = buffer.take()
+                        if data:
+                            yield data
+                except Exception as e:
+                    # The header is already sent; the entry ends truncated.
+                    if on_error:
+                        on_error(path, e)
+            yield buffer.take()
+    yield buffer.take()  # central directory
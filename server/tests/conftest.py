@@ -0,0 +1,98 @@
+import io
+import os
+import sys
+
+import mongomock
+import mongomock.gridfs
+import numpy as np
+import pytest
+from PIL import Image
+from scipy import ndimage
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+mongomock.gridfs.enable_gridfs_integration()
+
+import gridfs  # noqa: E402
+
+import db as db_module  # noqa: E402
+from app import create_app  # noqa: E402
+from services import cellpose_runner  # noqa: E402
+from services.model_pool import get_model_pool  # noqa: E402
+from utils.security import create_jwt_token  # noqa: E402
+
+
+class ThresholdModel:
+    """Stand-in for CellposeModel: connected components of pixels above 100."""
+
+    diam_labels = 30.0
+
+    def __init__(self, **kwargs):
+        self.net = None
+
+    def eval(self, x, **kwargs):
+        x = np.asarray(x)
+        if "channel_axis" in kwargs or (x.ndim == 3 and "z_axis" not in kwargs):
+            x = x[..., 0]
+        if x.ndim == 3:
+            masks = np.stack([ndimage.label(plane > 100)[0] for plane in x])
+        else:
+            masks = ndimage.label(x > 100)[0]
+        flows = np.zeros((2,) + x.shape, np.float32)
+        return masks.astype(np.uint16), [None, flows, x.astype(np.float32) - 100], None
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setattr(cellpose_runner.models, "CellposeModel", ThresholdModel)
+    get_model_pool().clear()
+
+    app = create_app("development")
+    app.config.update(TESTING=True, JWT_SECRET_KEY="test-secret-key-of-at-least-32-bytes")
+    (tmp_path / "models").mkdir()
+    (tmp_path / "models" / "trained_cellpose").write_bytes(b"weights")
+    app.root_path = str(tmp_path)
+
+    client = mongomock.MongoClient()
+    db_module.mongo.db = client.db
+    db_module.fs = gridfs.GridFS(client.db)
+    yield app
+    get_model_pool().clear()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def auth(app):
+    """(user id, Authorization headers) of a fresh user."""
+    with app.app_context():
+        user_id = str(db_module.get_db().users.insert_one({"username": "tester"}).inserted_id)
+        return user_id, {"Authorization": f"Bearer {create_jwt_token(user_id)}"}
+
+
+def blobs(seed: int, size: int = 64, count: int = 4) -> np.ndarray:
+    """Dark image with ``count`` bright 6x6 squares."""
+    rng = np.random.default_rng(seed)
+    img = np.zeros((size, size), np.uint8)
+    for cy, cx in rng.integers(5, size - 5, (count, 2)):
+        img[cy - 3:cy + 3, cx - 3:cx + 3] = 200
+    return img
+
+
+def png_bytes(img: np.ndarray) -> bytes:
+    buffer = io.BytesIO()
+    Image.fromarray(img).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def upload_dataset(client, headers, images) -> str:
+    data = {
+        "files": [(io.BytesIO(png_bytes(img)), f"img{i}.png") for i, img in enumerate(images)],
+        "name": "dataset",
+    }
+    response = client.post("/api/datasets/upload", data=data, headers=headers, content_type="multipart/form-data")
+    assert response.status_code == 201, response.get_data(as_text=True)
+    return response.get_json()["dataset_id"]
@@ -0,0 +1,77 @@
+import pytest
+
+from conftest import blobs, upload_dataset
+from db import get_fs
+from services.cellpose_runner import CellposeRunner
+
+
+def _fail_on_call(monkeypatch, n):
+    """Makes the n-th segmentation unit of the next job raise, as if its worker died."""
+    real = CellposeRunner._segment_unit
+    calls = {"count": 0}
+
+    def segment_unit(self, loaded):
+        calls["count"] += 1
+        if calls["count"] == n:
+            raise RuntimeError("worker killed")
+        return real(self, loaded)
+
+    monkeypatch.setattr(CellposeRunner, "_segment_unit", segment_unit)
+    return lambda: monkeypatch.setattr(CellposeRunner, "_segment_unit", real)
+
+
+def _artifact_ids(results):
+    return {a["gridfs_id"] for r in results for a in r.get("artifacts", [])}
+
+
+@pytest.mark.parametrize("params", [
+    {"execution_mode": "sequential", "pipeline": False},
+    {"execution_mode": "sequential", "pipeline": True},
+    {"execution_mode": "batched", "images_per_batch": 2},
+])
+def test_resume_skips_checkpointed_files_and_removes_orphans(app, client, auth, monkeypatch, params):
+    _, headers = auth
+    dataset_id = upload_dataset(client, headers, [blobs(i) for i in range(6)])
+
+    restore = _fail_on_call(monkeypatch, 3)
+    response = client.post("/api/inferences/start", json={"dataset_id": dataset_id, "params": params}, headers=headers)
+    restore()
+    assert response.status_code == 500
+
+    failed = client.get("/api/inferences/", headers=headers).get_json()[0]
+    inference_id = failed["_id"]
+    assert failed["status"] == "failed"
+    checkpointed = [r["source_filename"] for r in failed["results"]]
+    assert 0 < len(checkpointed) < 6
+    assert failed["progress"]["processed"] == len(checkpointed)
+
+    with app.app_context():
+        orphan = get_fs().put(b"partial", filename="orphan.png", metadata={"inference_id": inference_id})
+
+    assert client.post(f"/api/inferences/{inference_id}/resume", headers=headers).status_code == 200
+
+    done = client.get(f"/api/inferences/{inference_id}", headers=headers).get_json()
+    filenames = [r["source_filename"] for r in done["results"]]
+    assert done["status"] == "completed"
+    assert filenames == [f"img{i}.png" for i in range(6)]
+    assert done["progress"] == {"processed": 6, "total": 6}
+
+    with app.app_context():
+        fs = get_fs()
+        assert not fs.exists(orphan)
+        stored = {
+            str(f._id) for f in fs.find({"metadata.inference_id": inference_id, "metadata.rendered_from": {"$exists": False}})
+        }
+    # Every artifact the job wrote is referenced exactly once by its results.
+    assert stored == _artifact_ids(done["results"])
+    assert len(_artifact_ids(done["results"])) == sum(len(r["artifacts"]) for r in done["results"])
+
+
+def test_resume_does_not_rerun_completed_jobs(client, auth):
+    _, headers = auth
+    dataset_id = upload_dataset(client, headers, [blobs(0), blobs(1)])
+    inference_id = client.post(
+        "/api/inferences/start", json={"dataset_id": dataset_id}, headers=headers
+    ).get_json()["inference_id"]
+
+    assert client.post(f"/api/inferences/{inference_id}/resume", headers=headers).status_code == 400
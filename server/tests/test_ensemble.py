@@ -0,0 +1,93 @@
+import pytest
+
+from conftest import blobs, upload_dataset
+from services import cellpose_runner, ensemble_runner
+from services.ensemble_runner import merge_member_results, tag_artifacts
+
+FILE_REF = {"filename": "a.png", "gridfs_id": "f1"}
+
+
+def _result(prefix):
+    return {
+        "source_filename": "a.png",
+        "source_image_gridfs_id": "f1",
+        "class_mask_id": f"{prefix}-class",
+        "instance_mask_id": f"{prefix}-instance",
+        "cell_count": 3,
+        "artifacts": [
+            {"kind": "class_mask", "gridfs_id": f"{prefix}-class", "filename": "a_class.png"},
+            {"kind": "instance_mask", "gridfs_id": f"{prefix}-instance", "filename": "a_instance.png"},
+        ],
+    }
+
+
+def test_tag_artifacts_files_them_per_model():
+    tagged = tag_artifacts("m1", _result("x"))
+
+    assert [a["filename"] for a in tagged] == ["m1/a_class.png", "m1/a_instance.png"]
+    assert {a["model_id"] for a in tagged} == {"m1"}
+    assert [a["gridfs_id"] for a in tagged] == ["x-class", "x-instance"]
+
+
+def test_merge_keeps_every_member_under_its_model_id():
+    merged = merge_member_results({**FILE_REF, "plane": 2}, [("m1", _result("x")), ("m2", _result("y"))])
+
+    assert merged["source_filename"] == "a.png"
+    assert merged["source_image_gridfs_id"] == "f1"
+    assert merged["plane"] == 2
+    assert merged["models"] == {
+        "m1": {"class_mask_id": "x-class", "instance_mask_id": "x-instance", "cell_count": 3},
+        "m2": {"class_mask_id": "y-class", "instance_mask_id": "y-instance", "cell_count": 3},
+    }
+    assert [(a["model_id"], a["filename"]) for a in merged["artifacts"]] == [
+        ("m1", "m1/a_class.png"), ("m1", "m1/a_instance.png"),
+        ("m2", "m2/a_class.png"), ("m2", "m2/a_instance.png"),
+    ]
+
+
+def test_merge_copies_primary_mask_ids_from_the_first_member():
+    first = {**_result("x"), "label_mask_id": "x-labels"}
+    merged = merge_member_results(FILE_REF, [("m1", first), ("m2", _result("y"))])
+
+    assert merged["class_mask_id"] == "x-class"
+    assert merged["instance_mask_id"] == "x-instance"
+    assert merged["label_mask_id"] == "x-labels"
+    assert "plane" not in merged
+
+
+@pytest.fixture
+def opened(monkeypatch):
+    """Counts source images opened by the ensemble, with the ONNX member running the stand-in model."""
+    monkeypatch.setattr(cellpose_runner, "attach_onnx_engine", lambda model, *args, **kwargs: model)
+    calls = []
+    real = ensemble_runner.open_image
+
+    def open_image(*args, **kwargs):
+        calls.append(args)
+        return real(*args, **kwargs)
+
+    monkeypatch.setattr(ensemble_runner, "open_image", open_image)
+    return calls
+
+
+def test_ensemble_job_opens_each_image_once_and_tags_every_artifact(client, auth, opened):
+    _, headers = auth
+    dataset_id = upload_dataset(client, headers, [blobs(0), blobs(1), blobs(2)])
+
+    response = client.post(
+        "/api/inferences/start",
+        json={"dataset_id": dataset_id, "model_ids": ["cellpose_model", "cellpose_onnx"]},
+        headers=headers,
+    )
+    inference = client.get(f"/api/inferences/{response.get_json()['inference_id']}", headers=headers).get_json()
+
+    assert inference["status"] == "completed"
+    assert len(opened) == 3
+    for result in inference["results"]:
+        assert sorted(result["models"]) == ["cellpose_model", "cellpose_onnx"]
+        by_model = {}
+        for artifact in result["artifacts"]:
+            assert artifact["filename"].startswith(f"{artifact['model_id']}/")
+            by_model.setdefault(artifact["model_id"], set()).add(artifact["kind"])
+        assert by_model["cellpose_model"] == by_model["cellpose_onnx"]
+        assert result["class_mask_id"] == result["models"]["cellpose_model"]["class_mask_id"]
@@ -0,0 +1,107 @@
+import io
+import json
+import zipfile
+
+import pytest
+from bson.objectid import ObjectId
+
+from conftest import blobs, upload_dataset
+from db import get_db, get_fs
+from services.export_archive import cached_export, invalidate_export, stream_and_store_export
+
+
+@pytest.fixture
+def inference_id(app, client, auth):
+    _, headers = auth
+    app.config.update(EXPORT_CACHE_ENABLED=True)
+    dataset_id = upload_dataset(client, headers, [blobs(0), blobs(1)])
+    return client.post("/api/inferences/start", json={"dataset_id": dataset_id}, headers=headers).get_json()["inference_id"]
+
+
+def _inference(app, inference_id):
+    with app.app_context():
+        return get_db().inferences.find_one({"_id": ObjectId(inference_id)})
+
+
+def _exports(app):
+    with app.app_context():
+        return list(get_fs().find({"metadata.type": "export"}))
+
+
+def _download(client, headers, inference_id):
+    """(X-Export-Cache, body) of one download; the streamed body is read before returning."""
+    response = client.get(f"/api/inferences/{inference_id}/download", headers=headers)
+    data = response.get_data()
+    response.close()
+    return response.headers["X-Export-Cache"], data
+
+
+def _manifest(data):
+    return json.loads(zipfile.ZipFile(io.BytesIO(data)).read("manifest.json"))
+
+
+def test_second_download_is_served_from_the_stored_archive(app, client, auth, inference_id):
+    _, headers = auth
+
+    first_cache, first = _download(client, headers, inference_id)
+    second_cache, second = _download(client, headers, inference_id)
+
+    assert (first_cache, second_cache) == ("miss", "hit")
+    assert first == second
+    assert _inference(app, inference_id)["export"]["results_version"] == 0
+    assert len(_exports(app)) == 1
+
+
+def test_invalidate_bumps_the_version_and_deletes_the_archive(app, client, auth, inference_id):
+    _, headers = auth
+    _download(client, headers, inference_id)
+
+    with app.app_context():
+        invalidate_export(get_db(), get_fs(), ObjectId(inference_id))
+        invalidate_export(get_db(), get_fs(), ObjectId(inference_id))
+        inference = get_db().inferences.find_one({"_id": ObjectId(inference_id)})
+        assert cached_export(get_db(), get_fs(), inference) is None
+
+    assert inference["results_version"] == 2
+    assert "export" not in inference
+    assert _exports(app) == []
+
+
+def test_classifying_results_rebuilds_the_archive(app, client, auth, inference_id):
+    _, headers = auth
+    _download(client, headers, inference_id)
+
+    client.post(
+        f"/api/inferences/{inference_id}/classify",
+        json={"result_classifications": [{"source_filename": "img0.png", "label": "tumour", "confidence": 0.9}]},
+        headers=headers,
+    )
+    cache, rebuilt = _download(client, headers, inference_id)
+
+    assert cache == "miss"
+    assert _inference(app, inference_id)["export"]["results_version"] == 1
+    assert len(_exports(app)) == 1
+    assert "tumour" in json.dumps(_manifest(rebuilt))
+
+
+def test_archive_built_from_stale_results_is_not_recorded(app, inference_id):
+    with app.app_context():
+        db, fs = get_db(), get_fs()
+        inference = db.inferences.find_one({"_id": ObjectId(inference_id)})
+        stream = stream_and_store_export(db, fs, inference)
+        next(stream)
+        # The results change while the archive is still streaming.
+        invalidate_export(db, fs, inference["_id"])
+        for _ in stream:
+            pass
+
+        assert "export" not in db.inferences.find_one({"_id": inference["_id"]})
+    assert _exports(app) == []
+
+
+def test_deleting_the_inference_deletes_its_archive(app, client, auth, inference_id):
+    _, headers = auth
+    _download(client, headers, inference_id)
+
+    assert client.delete(f"/api/inferences/{inference_id}", headers=headers).status_code == 200
+    assert _exports(app) == []
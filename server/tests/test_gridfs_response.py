@@ -0,0 +1,103 @@
+import os
+
+import pytest
+
+from db import get_fs
+
+
+@pytest.fixture
+def stored(app):
+    """(file id, content) of a GridFS file spanning several chunks."""
+    content = os.urandom(600 * 1024)
+    with app.app_context():
+        file_id = get_fs().put(content, filename="blob.bin", chunk_size=255 * 1024)
+    return str(file_id), content
+
+
+def test_full_response_has_validators(client, auth, stored):
+    _, headers = auth
+    file_id, content = stored
+
+    response = client.get(f"/api/files/{file_id}", headers=headers)
+
+    assert response.status_code == 200
+    assert response.data == content
+    assert response.headers["Accept-Ranges"] == "bytes"
+    assert response.headers["Content-Length"] == str(len(content))
+    assert response.headers["ETag"]
+    assert response.headers["Last-Modified"]
+    assert "private" in response.headers["Cache-Control"]
+
+
+def test_matching_etag_is_not_modified(client, auth, stored):
+    _, headers = auth
+    file_id, _ = stored
+    etag = client.get(f"/api/files/{file_id}", headers=headers).headers["ETag"]
+
+    response = client.get(f"/api/files/{file_id}", headers={**headers, "If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert response.data == b""
+    assert client.get(f"/api/files/{file_id}", headers={**headers, "If-None-Match": '"other"'}).status_code == 200
+
+
+def test_if_modified_since(client, auth, stored):
+    _, headers = auth
+    file_id, _ = stored
+    last_modified = client.get(f"/api/files/{file_id}", headers=headers).headers["Last-Modified"]
+
+    response = client.get(f"/api/files/{file_id}", headers={**headers, "If-Modified-Since": last_modified})
+
+    assert response.status_code == 304
+
+
+@pytest.mark.parametrize("header,start,stop", [
+    ("bytes=0-99", 0, 100),
+    ("bytes=261000-262000", 261000, 262001),  # crosses a chunk boundary
+    ("bytes=-500", 600 * 1024 - 500, 600 * 1024),
+    ("bytes=614000-", 614000, 600 * 1024),
+])
+def test_single_range(client, auth, stored, header, start, stop):
+    _, headers = auth
+    file_id, content = stored
+
+    response = client.get(f"/api/files/{file_id}", headers={**headers, "Range": header})
+
+    assert response.status_code == 206
+    assert response.data == content[start:stop]
+    assert response.headers["Content-Range"] == f"bytes {start}-{stop - 1}/{len(content)}"
+    assert response.headers["Content-Length"] == str(stop - start)
+
+
+def test_unsatisfiable_range(client, auth, stored):
+    _, headers = auth
+    file_id, content = stored
+
+    response = client.get(f"/api/files/{file_id}", headers={**headers, "Range": f"bytes={len(content)}-"})
+
+    assert response.status_code == 416
+    assert response.headers["Content-Range"] == f"bytes */{len(content)}"
+
+
+def test_multiple_ranges_get_the_whole_file(client, auth, stored):
+    _, headers = auth
+    file_id, content = stored
+
+    response = client.get(f"/api/files/{file_id}", headers={**headers, "Range": "bytes=0-9,20-29"})
+
+    assert response.status_code == 200
+    assert response.data == content
+
+
+def test_if_range(client, auth, stored):
+    _, headers = auth
+    file_id, content = stored
+    etag = client.get(f"/api/files/{file_id}", headers=headers).headers["ETag"]
+
+    current = client.get(f"/api/files/{file_id}", headers={**headers, "Range": "bytes=0-9", "If-Range": etag})
+    stale = client.get(f"/api/files/{file_id}", headers={**headers, "Range": "bytes=0-9", "If-Range": '"stale"'})
+
+    assert current.status_code == 206
+    assert current.data == content[:10]
+    assert stale.status_code == 200
+    assert stale.data == content
@@ -0,0 +1,88 @@
+import io
+
+from conftest import blobs, png_bytes, upload_dataset
+
+
+def _start(client, headers, dataset_id, **params):
+    response = client.post("/api/inferences/start", json={"dataset_id": dataset_id, "params": params}, headers=headers)
+    return response
+
+
+def _get(client, headers, inference_id):
+    return client.get(f"/api/inferences/{inference_id}", headers=headers).get_json()
+
+
+def _add_files(client, headers, dataset_id, images, first=0):
+    data = {"files": [(io.BytesIO(png_bytes(img)), f"new{first + i}.png") for i, img in enumerate(images)]}
+    response = client.post(
+        f"/api/datasets/{dataset_id}/files", data=data, headers=headers, content_type="multipart/form-data"
+    )
+    assert response.status_code in (200, 201), response.get_data(as_text=True)
+
+
+def test_incremental_job_processes_only_new_files(client, auth):
+    _, headers = auth
+    dataset_id = upload_dataset(client, headers, [blobs(0), blobs(1)])
+    base_id = _start(client, headers, dataset_id, flow_threshold=0.4).get_json()["inference_id"]
+    _add_files(client, headers, dataset_id, [blobs(2)])
+
+    job = _get(client, headers, _start(client, headers, dataset_id, flow_threshold=0.4, mode="incremental").get_json()["inference_id"])
+
+    assert str(job["base_inference_id"]) == base_id
+    assert job["incremental"] == {"carried": 2, "processed": 1}
+    assert [r["source_filename"] for r in job["results"]] == ["img0.png", "img1.png", "new0.png"]
+    base_artifacts = {a["gridfs_id"] for r in _get(client, headers, base_id)["results"] for a in r["artifacts"]}
+    assert base_artifacts <= {a["gridfs_id"] for r in job["results"] for a in r["artifacts"]}
+
+
+def test_execution_only_params_do_not_block_the_base(client, auth):
+    _, headers = auth
+    dataset_id = upload_dataset(client, headers, [blobs(0), blobs(1)])
+    base_id = _start(
+        client, headers, dataset_id, flow_threshold=0.4, execution_mode="sequential", pipeline=False
+    ).get_json()["inference_id"]
+
+    job = _get(client, headers, _start(
+        client, headers, dataset_id, flow_threshold=0.4, mode="incremental", images_per_batch=4
+    ).get_json()["inference_id"])
+
+    assert str(job["base_inference_id"]) == base_id
+    assert job["incremental"] == {"carried": 2, "processed": 0}
+
+
+def test_latest_matching_inference_is_the_base(client, auth):
+    _, headers = auth
+    dataset_id = upload_dataset(client, headers, [blobs(0)])
+    _start(client, headers, dataset_id, flow_threshold=0.4)
+    latest = _start(client, headers, dataset_id, flow_threshold=0.4).get_json()["inference_id"]
+    _start(client, headers, dataset_id, flow_threshold=0.6)
+
+    job = _get(client, headers, _start(client, headers, dataset_id, flow_threshold=0.4, mode="incremental").get_json()["inference_id"])
+
+    assert str(job["base_inference_id"]) == latest
+
+
+def test_different_params_have_no_base(client, auth):
+    _, headers = auth
+    dataset_id = upload_dataset(client, headers, [blobs(0), blobs(1)])
+    _start(client, headers, dataset_id, flow_threshold=0.4)
+
+    job = _get(client, headers, _start(client, headers, dataset_id, flow_threshold=0.5, mode="incremental").get_json()["inference_id"])
+
+    assert job.get("base_inference_id") is None
+    assert job["status"] == "completed"
+    assert len(job["results"]) == 2
+
+
+def test_explicit_base_must_match(client, auth):
+    _, headers = auth
+    dataset_id = upload_dataset(client, headers, [blobs(0)])
+    base_id = _start(client, headers, dataset_id, flow_threshold=0.4).get_json()["inference_id"]
+
+    mismatched = _start(client, headers, dataset_id, flow_threshold=0.5, mode="incremental", base_inference_id=base_id)
+    invalid = _start(client, headers, dataset_id, mode="incremental", base_inference_id="not-an-id")
+    preview = _start(client, headers, dataset_id, mode="incremental", preview=True)
+
+    assert mismatched.status_code == 400
+    assert invalid.status_code == 400
+    assert preview.status_code == 400
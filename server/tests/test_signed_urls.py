@@ -0,0 +1,78 @@
+import time
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from conftest import blobs, upload_dataset
+from utils.signed_urls import sign_file_url, url_expiry, verify_file_signature
+
+
+@pytest.fixture
+def ctx(app):
+    app.config.update(FILE_URL_TTL=3600, FILE_URL_BUCKET=900)
+    with app.test_request_context():
+        yield app
+
+
+def _query(url):
+    return {k: v[0] for k, v in parse_qs(urlparse(url).query).items()}
+
+
+def test_expiry_is_shared_within_a_bucket(ctx):
+    start = 1_800_000_000 - 3600  # now + TTL lands exactly on a bucket boundary
+
+    assert url_expiry(start) == url_expiry(start + 899) == 1_800_000_900
+    assert url_expiry(start + 900) == 1_800_001_800
+
+
+@pytest.mark.parametrize("offset", [0, 1, 450, 899, 900, 1234])
+def test_expiry_stays_within_ttl_and_one_bucket(ctx, offset):
+    now = 1_700_000_000 + offset
+    expires = url_expiry(now)
+
+    assert expires % 900 == 0
+    assert 3600 < expires - now <= 3600 + 900
+
+
+def test_urls_issued_in_one_bucket_are_identical(ctx):
+    expires = url_expiry()
+
+    assert sign_file_url("abc", expires=expires) == sign_file_url("abc", expires=expires)
+    assert sign_file_url("abc", "class", expires) != sign_file_url("abc", "instance", expires)
+
+
+def test_signature_verification(ctx):
+    expires = url_expiry()
+    query = _query(sign_file_url("abc", "class", expires))
+
+    assert verify_file_signature("abc", "class", query["exp"], query["sig"]) == (True, "")
+    assert verify_file_signature("abd", "class", query["exp"], query["sig"])[0] is False
+    assert verify_file_signature("abc", "instance", query["exp"], query["sig"])[0] is False
+    assert verify_file_signature("abc", "class", str(expires + 900), query["sig"])[0] is False
+    assert verify_file_signature("abc", "class", None, query["sig"]) == (False, "Missing or invalid expiry")
+
+
+def test_expired_urls_are_refused(ctx):
+    expires = int(time.time()) - 1
+    query = _query(sign_file_url("abc", expires=expires))
+
+    assert verify_file_signature("abc", None, query["exp"], query["sig"]) == (False, "URL expired")
+
+
+def test_signed_route_is_public_and_cacheable_until_expiry(app, client, auth):
+    _, headers = auth
+    app.config.update(SIGNED_FILE_URLS=True)
+    dataset_id = upload_dataset(client, headers, [blobs(0)])
+    inference_id = client.post(
+        "/api/inferences/start", json={"dataset_id": dataset_id}, headers=headers
+    ).get_json()["inference_id"]
+    inference = client.get(f"/api/inferences/{inference_id}", headers=headers).get_json()
+    url = inference["results"][0]["source_image_url"]
+
+    response = client.get(url)
+    tampered = client.get(url.replace("sig=", "sig=x"))
+
+    assert response.status_code == 200
+    assert "public" in response.headers["Cache-Control"]
+    assert 0 < response.cache_control.max_age <= inference["urls_expire_at"] - time.time() + 1
+    assert tampered.status_code == 403
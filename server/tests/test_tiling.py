@@ -0,0 +1,99 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+from scipy import ndimage
+
+from services.tiling import segment_tiled, tile_grid
+
+
+def _segment(tile):
+    return ndimage.label(tile > 100)[0]
+
+
+def _cells(labels):
+    """Set of cells, each as a frozenset of flat pixel indices, so label numbering is ignored."""
+    flat = labels.ravel()
+    order = np.argsort(flat, kind="stable")
+    bounds = np.searchsorted(flat[order], np.arange(1, int(flat.max()) + 2))
+    return {frozenset(order[bounds[i]:bounds[i + 1]].tolist()) for i in range(len(bounds) - 1) if bounds[i] < bounds[i + 1]}
+
+
+def _cell_image(height, width, seed, spacing=16, radius=4):
+    """Square cells on a jittered grid, many of them straddling tile seams."""
+    rng = np.random.default_rng(seed)
+    img = np.zeros((height, width), np.uint8)
+    jitter = spacing // 2 - radius - 1  # keeps neighbours at least two pixels apart
+    for cy in range(spacing // 2, height - spacing // 2, spacing):
+        for cx in range(spacing // 2, width - spacing // 2, spacing):
+            y, x = (cy, cx) + rng.integers(-jitter, jitter + 1, 2)
+            img[y - radius:y + radius, x - radius:x + radius] = 200
+    return img
+
+
+@pytest.mark.parametrize("height,width,tile_size,overlap", [
+    (100, 100, 32, 8),
+    (97, 130, 40, 12),
+    (50, 50, 64, 16),  # a single tile
+])
+def test_tile_cores_partition_the_image(height, width, tile_size, overlap):
+    covered = np.zeros((height, width), np.int32)
+    for (y0, y1, x0, x1), (cy0, cy1, cx0, cx1) in tile_grid(height, width, tile_size, overlap):
+        assert y1 - y0 <= tile_size and x1 - x0 <= tile_size
+        assert y0 <= cy0 < cy1 <= y1 and x0 <= cx0 < cx1 <= x1
+        covered[cy0:cy1, cx0:cx1] += 1
+    assert (covered == 1).all()
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_tiled_labels_match_whole_image(seed):
+    img = _cell_image(160, 200, seed)
+    whole = _segment(img)
+
+    tiled = segment_tiled(
+        lambda box: img[box[0]:box[1], box[2]:box[3]], img.shape, _segment, tile_size=48, overlap=16,
+    )
+
+    assert tiled.max() == whole.max()
+    assert _cells(tiled) == _cells(whole)
+
+
+def test_concurrent_tiles_stitch_identically():
+    img = _cell_image(128, 128, 3)
+    read = lambda box: img[box[0]:box[1], box[2]:box[3]]  # noqa: E731
+    serial = segment_tiled(read, img.shape, _segment, tile_size=40, overlap=12)
+
+    with ThreadPoolExecutor(2) as pool:
+        concurrent = segment_tiled(
+            read, img.shape, lambda tile: pool.submit(_segment, tile), tile_size=40, overlap=12, max_in_flight=3,
+        )
+
+    assert np.array_equal(serial, concurrent)
+
+
+def test_blank_tiles_are_not_segmented():
+    img = np.zeros((128, 128), np.uint8)
+    img[10:18, 10:18] = 200
+    segmented = []
+
+    def segment(tile):
+        segmented.append(tile.shape)
+        return _segment(tile)
+
+    labels = segment_tiled(
+        lambda box: img[box[0]:box[1], box[2]:box[3]], img.shape, segment, tile_size=64, overlap=16,
+    )
+
+    assert len(segmented) < len(tile_grid(128, 128, 64, 16))
+    assert labels.max() == 1
+
+
+def test_large_label_images_are_memory_mapped():
+    img = _cell_image(96, 96, 4)
+    labels = segment_tiled(
+        lambda box: img[box[0]:box[1], box[2]:box[3]], img.shape, _segment,
+        tile_size=40, overlap=12, memmap_pixels=1,
+    )
+
+    assert isinstance(labels, np.memmap)
+    assert _cells(labels) == _cells(_segment(img))
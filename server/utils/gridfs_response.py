@@ -0,0 +1,82 @@
+import mimetypes
+from typing import Iterator, Optional
+
+from flask import Response, request
+
+
+def gridfs_etag(grid_out) -> str:
+    """GridFS files never change once written, so the id (or stored md5) identifies the content."""
+    md5 = getattr(grid_out, "md5", None)
+    return md5 or f"{grid_out._id}-{grid_out.length}"
+
+
+def iter_gridfs_range(grid_out, start: int, stop: int) -> Iterator[bytes]:
+    """Bytes [start, stop) of a GridFS file, read one chunk at a time."""
+    grid_out.seek(start)
+    remaining = stop - start
+    chunk_size = grid_out.chunk_size or 255 * 1024
+    while remaining > 0:
+        data = grid_out.read(min(chunk_size, remaining))
+        if not data:
+            return
+        remaining -= len(data)
+        yield data
+
+
+def send_gridfs_file(grid_out, mimetype: Optional[str] = None, max_age: int = 0,
+                     download_name: Optional[str] = None, public: bool = False) -> Response:
+    """
+    Streams a GridFS file with validators and byte ranges.
+
+    Sends ETag / Last-Modified / Content-Length, answers matching
+    If-None-Match / If-Modified-Since with 304, and serves ``Range``
+    requests (honouring If-Range) with 206 or 416. Responses are private
+    unless ``public`` (signed URLs, whose content can never change while
+    the URL is valid) is set.
+    """
+    mimetype = mimetype or mimetypes.guess_type(grid_out.filename or "")[0] or "application/octet-stream"
+    etag = gridfs_etag(grid_out)
+    length = grid_out.length
+
+    response = Response(mimetype=mimetype)
+    response.set_etag(etag)
+    response.last_modified = grid_out.upload_date
+    response.accept_ranges = "bytes"
+    if public:
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.private = True
+    response.cache_control.max_age = max_age
+    if download_name:
+        response.headers["Content-Disposition"] = f"attachment;filename={download_name}"
+
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains_weak(etag)
+    else:
+        not_modified = bool(
+            request.if_modified_since and grid_out.upload_date
+            and grid_out.upload_date.replace(microsecond=0, tzinfo=None)
+            <= request.if_modified_since.replace(tzinfo=None)
+        )
+    if not_modified:
+        response.status_code = 304
+        return response
+
+    start, stop = 0, length
+    byte_range = request.range
+    # Multi-range requests get the whole file rather than a multipart body.
+    if_range = request.headers.get("If-Range")
+    if byte_range and len(byte_range.ranges) == 1 and (not if_range or request.if_range.etag == etag):
+        span = byte_range.range_for_length(length)
+        if span is None:
+            response.status_code = 416
+            response.headers["Content-Range"] = f"bytes */{length}"
+            return response
+        start, stop = span
+        response.status_code = 206
+        response.content_range = byte_range.make_content_range(length)
+
+    response.response = iter_gridfs_range(grid_out, start, stop)
+    response.content_length = stop - start
+    return response
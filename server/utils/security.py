@@ -5,6 +5,8 @@ from flask import request, jsonify, current_app
 from functools import wraps
 import datetime
 
+from utils.signed_urls import verify_stream_token
+
 def hash_password(password : str) -> str:
     salt = bcrypt.gensalt()
     hashed_bytes = bcrypt.hashpw(password.encode('utf-8'), salt)
@@ -50,4 +52,20 @@ def jwt_required(f):  #we use this to protect routes
         return f(current_user_id=current_user_id, *args, **kwargs)
     return decorated
 
+def stream_token_required(f):  #for EventSource streams, which cannot send an Authorization header
+    authenticated = jwt_required(f)
+
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        token = request.args.get('token')
+        if not token or 'Authorization' in request.headers:
+            return authenticated(*args, **kwargs)
 
+        # ?token= is a short-lived stream token (utils.signed_urls.sign_stream_token),
+        # never the JWT, which would otherwise end up in proxy and access logs
+        current_user_id, error = verify_stream_token(token, kwargs.get('inference_id'))
+        if error:
+            return jsonify({'message': error}), 401
+
+        return f(current_user_id=current_user_id, *args, **kwargs)
+    return decorated
@@ -0,0 +1,102 @@
+import base64
+import hashlib
+import hmac
+import time
+from typing import Dict, Optional, Tuple
+
+from flask import current_app, url_for
+
+
+def _secret() -> bytes:
+    return (current_app.config['FILE_URL_SECRET'] or current_app.config['JWT_SECRET_KEY']).encode('utf-8')
+
+
+def _signature(file_id: str, view: Optional[str], expires: int) -> str:
+    message = f"{file_id}:{view or ''}:{expires}".encode('utf-8')
+    digest = hmac.new(_secret(), message, hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b'=').decode('ascii')
+
+
+def url_expiry(now: Optional[float] = None) -> int:
+    """
+    Expiry shared by every URL issued in the same FILE_URL_BUCKET window, so
+    repeated page loads get identical URLs (and cache hits). URLs stay valid
+    for between FILE_URL_TTL and FILE_URL_TTL + FILE_URL_BUCKET seconds.
+    """
+    now = time.time() if now is None else now
+    bucket = max(int(current_app.config['FILE_URL_BUCKET']), 1)
+    return (int(now + current_app.config['FILE_URL_TTL']) // bucket + 1) * bucket
+
+
+def sign_file_url(file_id, view: Optional[str] = None, expires: Optional[int] = None) -> str:
+    """Relative URL that serves a GridFS file without a JWT until ``expires``."""
+    expires = expires or url_expiry()
+    params = {'exp': expires, 'sig': _signature(str(file_id), view, expires)}
+    if view:
+        params['view'] = view
+    return url_for('files.get_signed_file', file_id=str(file_id), **params)
+
+
+def sign_pyramid_urls(file_id, view: Optional[str] = None, plane: Optional[int] = None,
+                      expires: Optional[int] = None) -> Dict[str, str]:
+    """
+    Signed URLs of a file's pyramid: its descriptor, thumbnail and a tile URL
+    template with ``{level}/{x}/{y}`` placeholders. One signature covers
+    every tile of the file / view.
+    """
+    expires = expires or url_expiry()
+    params = {'exp': expires, 'sig': _signature(str(file_id), view, expires)}
+    if view:
+        params['view'] = view
+    if plane:
+        params['plane'] = plane
+    file_id = str(file_id)
+    tile_url = url_for('files.get_signed_tile', file_id=file_id, level=0, x=0, y=0, **params)
+    return {
+        'pyramid': url_for('files.get_signed_pyramid', file_id=file_id, **params),
+        'thumbnail': url_for('files.get_signed_thumbnail', file_id=file_id, **params),
+        'tiles': tile_url.replace('/tiles/0/0/0?', '/tiles/{level}/{x}/{y}?', 1),
+    }
+
+
+def verify_file_signature(file_id: str, view: Optional[str], expires, signature: str) -> Tuple[bool, str]:
+    """(valid, reason) for a signed file request."""
+    try:
+        expires = int(expires)
+    except (TypeError, ValueError):
+        return False, 'Missing or invalid expiry'
+    if not signature or not hmac.compare_digest(signature, _signature(file_id, view, expires)):
+        return False, 'Invalid signature'
+    if expires < time.time():
+        return False, 'URL expired'
+    return True, ''
+
+
+def _stream_signature(user_id: str, inference_id: Optional[str], expires: int) -> str:
+    message = f"stream:{user_id}:{inference_id or ''}:{expires}".encode('utf-8')
+    digest = hmac.new(_secret(), message, hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b'=').decode('ascii')
+
+
+def sign_stream_token(user_id, inference_id=None, expires: Optional[int] = None) -> str:
+    """
+    Short-lived token that opens the progress stream of one inference (or,
+    without ``inference_id``, of all the user's inferences) as ``user_id``.
+    """
+    expires = expires or int(time.time()) + int(current_app.config['STREAM_TOKEN_TTL'])
+    signature = _stream_signature(str(user_id), str(inference_id) if inference_id else None, expires)
+    return f"{user_id}.{expires}.{signature}"
+
+
+def verify_stream_token(token: str, inference_id: Optional[str]) -> Tuple[Optional[str], str]:
+    """(user id, '') for a valid stream token scoped to ``inference_id``, else (None, reason)."""
+    try:
+        user_id, expires, signature = token.split('.')
+        expires = int(expires)
+    except (AttributeError, ValueError):
+        return None, 'Token is invalid!'
+    if not hmac.compare_digest(signature, _stream_signature(user_id, inference_id, expires)):
+        return None, 'Token is invalid!'
+    if expires < time.time():
+        return None, 'Token has expired!'
+    return user_id, ''